@@ -1,34 +1,74 @@
 """
 Datenanalyse-Agent für KPI-Berechnung
 """
-from typing import Dict, Any, List
-from langchain_openai import ChatOpenAI
+import asyncio
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
+import pandas as pd
 from langchain.schema import HumanMessage, SystemMessage
 from tools.duckdb_tool import DuckDBQueryTool
-from config import LLM_MODEL, TEMPERATURE, OPENAI_API_KEY
+from tools.kpi_registry import compile_kpis, describe_kpis
+from agents.kpi_planner import KpiPlan, plan_from_text, plan_reports
+from agents.llm_client import get_llm
+from config import BATCH_KPI_QUERIES
+
+
+# Standard-Auswertungen der Analyse: Name -> (KPIs aus KPI_REGISTRY, Dimensionen, Sortierung)
+KPI_REPORTS = {
+    "revenue": (["revenue"], [], None),
+    "aov": (["aov"], [], None),
+    "orders_by_channel": (["orders", "revenue"], ["acquisition_channel"], "revenue DESC"),
+    "gross_margin": (["revenue", "cogs", "gross_margin_percent"], [], None),
+    "marketing_by_channel": (["spend", "roas", "cac", "conversion_rate"], ["acquisition_channel"], "spend DESC"),
+}
+
+# Eine Query pro Auswertung (Fallback, falls der Batch fehlschlägt)
+COMMON_QUERIES = {
+    name: compile_kpis(kpis, dimensions, order_by=order_by)
+    for name, (kpis, dimensions, order_by) in KPI_REPORTS.items()
+}
+
+
+@lru_cache(maxsize=64)
+def kpi_batch_query(reports: Tuple[str, ...]) -> str:
+    """
+    Die Auswertungen `reports` in einer Query: die Gesamtzeile (grouping_level = 1) liefert die
+    Gesamtwerte, die Kanalzeilen die Auswertungen nach acquisition_channel. Braucht keine der
+    Auswertungen Kanäle, besteht das Ergebnis nur aus der Gesamtzeile.
+    """
+    selected = [KPI_REPORTS[name] for name in reports]
+    dimensions = ["acquisition_channel"] if any(dims for _, dims, _ in selected) else []
+    return compile_kpis(
+        dict.fromkeys(kpi for kpis, _, _ in selected for kpi in kpis),
+        dimensions,
+        with_totals=True
+    )
+
+
+# Alle Standard-Auswertungen in einer Query
+KPI_BATCH_QUERY = kpi_batch_query(tuple(KPI_REPORTS))
 
 
 class DataAnalystAgent:
     """Agent für Datenanalyse und KPI-Berechnung"""
     
-    def __init__(self):
-        self.llm = ChatOpenAI(
-            model=LLM_MODEL,
-            temperature=TEMPERATURE,
-            api_key=OPENAI_API_KEY
-        )
+    def __init__(self, batch_kpis: bool = BATCH_KPI_QUERIES):
+        self.batch_kpis = batch_kpis
+        self.llm = get_llm("analyst")
         self.duckdb_tool = DuckDBQueryTool()
         
-        self.system_prompt = """
+        self.system_prompt = f"""
 Du bist ein erfahrener Datenanalyst. Deine Aufgabe ist es, E-Commerce-Daten zu analysieren und wichtige KPIs zu berechnen.
 
 Verfügbare KPIs und Berechnungen:
-- Revenue: SUM(order_items.(net_price + tax_amount) * quantity) für bezahlte Bestellungen
-- AOV (Average Order Value): Revenue / Anzahl Transaktionen für bezahlte Bestellungen  
-- Conversion Rate: Transaktionen / Sessions (aus Web Analytics)
-- ROAS (Return on Ad Spend): Revenue / Marketing Spend nach Kanal
-- CAC (Customer Acquisition Cost): Marketing Spend / Neue Kunden nach Kanal
-- Gross Margin: (Revenue - COGS) / Revenue, wobei COGS = SUM(products.unit_cost * quantity)
+{describe_kpis()}
+
+Für Umsatz-, AOV- und Margen-Kennzahlen steht die vorberechnete Tabelle paid_sales bereit
+(alle Positionen bezahlter Bestellungen inkl. Kunden- und Produktattributen sowie
+line_revenue und line_cogs) - sie erspart die Joins über orders, order_items, products und customers.
+Aggregierte Fragen nach Datum, Akquisitionskanal, Kategorie oder Land beantwortet der KPI-Cube
+kpi_cube (Tagessummen von revenue, cogs, quantity, orders) bzw. kpi_channel_daily (Spend, Sessions,
+Transaktionen und Neukunden je Tag und Kanal) in Millisekunden.
 
 Gehe systematisch vor:
 1. Verstehe die Anfrage
@@ -44,10 +84,46 @@ Antworte immer auf Deutsch und gib konkrete Zahlen mit Erklärungen zurück.
         Analysiert Daten basierend auf einer Anfrage und berechnet relevante KPIs
         """
         try:
-            # Anfrage an LLM mit System-Prompt
-            messages = [
-                SystemMessage(content=self.system_prompt),
-                HumanMessage(content=f"""
+            # LLM-Response mit Tool-Verwendung
+            response, plan, query_results = self._analyze_with_tools(
+                self._request_messages(request), self.plan_queries(request)
+            )
+            return self._success(response, plan, query_results)
+            
+        except Exception as e:
+            return self._failure(e)
+    
+    async def aanalyze_data(self, request: str) -> Dict[str, Any]:
+        """
+        Async-Version von analyze_data: LLM-Aufrufe über ainvoke, Queries im DuckDB-Thread-Pool
+        """
+        try:
+            response, plan, query_results = await self._aanalyze_with_tools(
+                self._request_messages(request), self.plan_queries(request)
+            )
+            return self._success(response, plan, query_results)
+            
+        except Exception as e:
+            return self._failure(e)
+    
+    @staticmethod
+    def plan_queries(request: str) -> Optional[KpiPlan]:
+        """
+        Regelbasierter Schnellweg der Planung: bekannte Absichten in der Anfrage bestimmen
+        die minimal nötigen Auswertungen, bevor das LLM geantwortet hat (sonst None)
+        """
+        return plan_from_text(request, KPI_REPORTS)
+    
+    @staticmethod
+    def _plan_from_response(response: str) -> KpiPlan:
+        """Plan aus der ersten LLM-Antwort; nennt auch sie keine bekannte KPI, werden alle berechnet"""
+        return plan_from_text(response, KPI_REPORTS, source="llm") or plan_reports([], KPI_REPORTS, "default")
+    
+    def _request_messages(self, request: str) -> List:
+        """Anfrage an LLM mit System-Prompt"""
+        return [
+            SystemMessage(content=self.system_prompt),
+            HumanMessage(content=f"""
 Analysiere die folgenden Daten und berechne relevante KPIs:
 
 Anfrage: {request}
@@ -59,94 +135,156 @@ Strukturiere deine Antwort wie folgt:
 3. Berechnete KPIs mit konkreten Zahlen
 4. Kurze Interpretation der Ergebnisse
 """)
-            ]
-            
-            # LLM-Response mit Tool-Verwendung
-            response = self._analyze_with_tools(messages)
-            
-            return {
-                "status": "success",
-                "analysis": response,
-                "agent": "DataAnalystAgent"
-            }
-            
-        except Exception as e:
-            return {
-                "status": "error",
-                "error": str(e),
-                "agent": "DataAnalystAgent"
-            }
+        ]
+    
+    @staticmethod
+    def format_query_results(query_results: Dict[str, str]) -> str:
+        """Query-Ergebnisse als Text (Name der Auswertung, darunter das kompakte Ergebnis)"""
+        return chr(10).join([f"{name}:{chr(10)}{result}" for name, result in query_results.items()])
+    
+    @classmethod
+    def _results_message(cls, query_results: Dict[str, str]) -> HumanMessage:
+        """Finale Anweisung mit den Query-Ergebnissen"""
+        return HumanMessage(content=f"""
+Hier sind die Ergebnisse der SQL-Queries:
+
+{cls.format_query_results(query_results)}
+
+Erstelle jetzt eine strukturierte Analyse mit konkreten KPIs und deren Interpretation.
+""")
     
-    def _analyze_with_tools(self, messages: List) -> str:
+    @classmethod
+    def _success(cls, analysis: str, plan: KpiPlan, query_results: Dict[str, str]) -> Dict[str, Any]:
+        return {
+            "status": "success",
+            "analysis": analysis,
+            # Strukturierte KPI-Werte, auf die nachfolgende Agenten eine zu lange Analyse verdichten
+            "kpi_data": cls.format_query_results(query_results),
+            "plan": plan,
+            "agent": "DataAnalystAgent"
+        }
+    
+    @staticmethod
+    def _failure(error: Exception) -> Dict[str, Any]:
+        return {
+            "status": "error",
+            "error": str(error),
+            "agent": "DataAnalystAgent"
+        }
+    
+    def _analyze_with_tools(self, messages: List,
+                            plan: Optional[KpiPlan]) -> Tuple[str, KpiPlan, Dict[str, str]]:
         """
         Führt die Analyse mit verfügbaren Tools durch
         """
         # Erste LLM-Antwort um zu verstehen, welche Queries benötigt werden
         initial_response = self.llm.invoke(messages)
+        plan = plan or self._plan_from_response(initial_response.content)
+        self._log_plan(plan)
         
-        # Extrahiere SQL-Queries aus der Antwort (vereinfachte Implementierung)
-        analysis_text = initial_response.content
+        # Führe relevante Queries aus
+        query_results = self._run_kpi_queries(plan["reports"])
         
-        # Beispiel-Queries für häufige KPIs
-        common_queries = {
-            "revenue": """
-                SELECT SUM((oi.net_price + oi.tax_amount) * oi.quantity) as total_revenue
-                FROM order_items oi
-                JOIN orders o ON oi.order_id = o.order_id
-                WHERE o.order_status = 'paid'
-            """,
-            "aov": """
-                SELECT 
-                    SUM((oi.net_price + oi.tax_amount) * oi.quantity) / COUNT(DISTINCT o.order_id) as aov
-                FROM order_items oi
-                JOIN orders o ON oi.order_id = o.order_id
-                WHERE o.order_status = 'paid'
-            """,
-            "orders_by_channel": """
-                SELECT 
-                    c.acquisition_channel,
-                    COUNT(DISTINCT o.order_id) as orders,
-                    SUM((oi.net_price + oi.tax_amount) * oi.quantity) as revenue
-                FROM orders o
-                JOIN customers c ON o.customer_id = c.customer_id
-                JOIN order_items oi ON o.order_id = oi.order_id
-                WHERE o.order_status = 'paid'
-                GROUP BY c.acquisition_channel
-                ORDER BY revenue DESC
-            """,
-            "gross_margin": """
-                SELECT 
-                    SUM((oi.net_price + oi.tax_amount) * oi.quantity) as revenue,
-                    SUM(p.unit_cost * oi.quantity) as cogs,
-                    (SUM((oi.net_price + oi.tax_amount) * oi.quantity) - SUM(p.unit_cost * oi.quantity)) / 
-                    SUM((oi.net_price + oi.tax_amount) * oi.quantity) * 100 as gross_margin_percent
-                FROM order_items oi
-                JOIN orders o ON oi.order_id = o.order_id
-                JOIN products p ON oi.product_id = p.product_id
-                WHERE o.order_status = 'paid'
-            """
-        }
+        # Erstelle finale Analyse mit Query-Ergebnissen
+        final_messages = messages + [initial_response, self._results_message(query_results)]
+        final_response = self.llm.invoke(final_messages)
+        return final_response.content, plan, query_results
+    
+    async def _aanalyze_with_tools(self, messages: List,
+                                   plan: Optional[KpiPlan]) -> Tuple[str, KpiPlan, Dict[str, str]]:
+        """
+        Async-Version von _analyze_with_tools; steht der Plan schon vor der ersten LLM-Antwort
+        fest, laufen diese und die KPI-Queries gleichzeitig. Schlägt eines von beiden fehl,
+        wird das andere abgebrochen (laufende Queries über ihren QueryInterrupt).
+        """
+        if plan is not None:
+            self._log_plan(plan)
+            tasks = [
+                asyncio.ensure_future(self.llm.ainvoke(messages)),
+                asyncio.ensure_future(self._arun_kpi_queries(plan["reports"]))
+            ]
+            try:
+                initial_response, query_results = await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+        else:
+            initial_response = await self.llm.ainvoke(messages)
+            plan = self._plan_from_response(initial_response.content)
+            self._log_plan(plan)
+            query_results = await self._arun_kpi_queries(plan["reports"])
+        
+        final_messages = messages + [initial_response, self._results_message(query_results)]
+        final_response = await self.llm.ainvoke(final_messages)
+        return final_response.content, plan, query_results
+    
+    @staticmethod
+    def _log_plan(plan: KpiPlan) -> None:
+        print(f"🧭 KPI-Plan ({plan['source']}): {', '.join(plan['reports'])} aus {', '.join(plan['tables'])}")
+    
+    def _run_kpi_queries(self, reports: Optional[List[str]] = None) -> Dict[str, str]:
+        """
+        Berechnet die geplanten Auswertungen (Standard: alle) - im Batch-Modus mit einem
+        gemeinsamen Scan, sonst (oder falls der Batch fehlschlägt) mit je einer Query pro Auswertung
+        """
+        reports = list(KPI_REPORTS) if reports is None else reports
+        if self.batch_kpis:
+            try:
+                return self._split_kpi_batch(self.duckdb_tool.query_df(kpi_batch_query(tuple(reports))), reports)
+            except Exception as e:
+                print(f"⚠️ KPI-Batch fehlgeschlagen, führe Einzel-Queries aus: {e}")
         
-        # Führe relevante Queries aus
         query_results = {}
-        for query_name, query in common_queries.items():
+        for query_name in reports:
             try:
-                result = self.duckdb_tool._run(query)
+                result = self.duckdb_tool._run(COMMON_QUERIES[query_name])
                 query_results[query_name] = result
             except Exception as e:
                 query_results[query_name] = f"Fehler: {str(e)}"
+        return query_results
+    
+    async def _arun_kpi_queries(self, reports: Optional[List[str]] = None) -> Dict[str, str]:
+        """Async-Version von _run_kpi_queries; Einzel-Queries laufen parallel im Thread-Pool"""
+        reports = list(KPI_REPORTS) if reports is None else reports
+        if self.batch_kpis:
+            try:
+                result = await self.duckdb_tool.aquery_df(kpi_batch_query(tuple(reports)))
+                return self._split_kpi_batch(result, reports)
+            except Exception as e:
+                print(f"⚠️ KPI-Batch fehlgeschlagen, führe Einzel-Queries aus: {e}")
         
-        # Erstelle finale Analyse mit Query-Ergebnissen
-        final_messages = messages + [
-            initial_response,
-            HumanMessage(content=f"""
-Hier sind die Ergebnisse der SQL-Queries:
-
-{chr(10).join([f"{name}: {result}" for name, result in query_results.items()])}
-
-Erstelle jetzt eine strukturierte Analyse mit konkreten KPIs und deren Interpretation.
-""")
-        ]
+        results = await asyncio.gather(
+            *(self.duckdb_tool._arun(COMMON_QUERIES[query_name]) for query_name in reports),
+            return_exceptions=True
+        )
+        return {
+            query_name: f"Fehler: {str(result)}" if isinstance(result, Exception) else result
+            for query_name, result in zip(reports, results)
+        }
+    
+    def _split_kpi_batch(self, result: pd.DataFrame, reports: List[str]) -> Dict[str, str]:
+        """Teilt das Ergebnis von kpi_batch_query auf die einzelnen Auswertungen auf"""
+        if "grouping_level" in result:
+            total = result[result["grouping_level"] > 0]
+            channels = result[result["grouping_level"] == 0]
+        else:
+            total = result
         
-        final_response = self.llm.invoke(final_messages)
-        return final_response.content 
\ No newline at end of file
+        query_results = {}
+        for name in reports:
+            kpis, dimensions, order_by = KPI_REPORTS[name]
+            if not dimensions:
+                frame = total[kpis]
+            else:
+                frame = channels[dimensions + kpis]
+                # Kanäle, die nur in einer anderen Quelle vorkommen, haben hier keine Werte
+                frame = frame[(frame[kpis].fillna(0) != 0).any(axis=1)]
+                if order_by:
+                    column, _, direction = order_by.partition(" ")
+                    frame = frame.sort_values(
+                        [column] + dimensions, ascending=[direction.upper() != "DESC"] + [True] * len(dimensions)
+                    )
+            query_results[name] = self.duckdb_tool.format_frame(frame)
+        return query_results
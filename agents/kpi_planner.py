@@ -0,0 +1,99 @@
+"""
+Planung der KPI-Auswertungen: welche Standard-Auswertungen und Tabellen eine Anfrage braucht
+"""
+import re
+from typing import Dict, List, Optional, Sequence, Tuple, TypedDict
+
+from tools.kpi_registry import kpi_tables
+
+
+class KpiPlan(TypedDict):
+    """Ergebnis der Planung: erkannte Absichten, auszuführende Auswertungen und gelesene Tabellen"""
+    intents: List[str]
+    reports: List[str]
+    tables: List[str]
+    source: str  # "rules" (Anfrage), "llm" (erste LLM-Antwort) oder "default" (alle Auswertungen)
+
+
+# Absicht -> (Stichwörter, die sie erkennen lassen, benötigte Auswertungen aus KPI_REPORTS).
+# Abkürzungen bis vier Zeichen zählen nur als ganzes Wort, längere Stichwörter auch als Teil
+# zusammengesetzter Wörter (Gesamtumsatz, Bruttomarge, Akquisitionskanäle).
+INTENT_RULES: Dict[str, Tuple[Tuple[str, ...], List[str]]] = {
+    "revenue": (("umsatz", "umsätz", "revenue", "erlös", "sales", "verkauf", "verkäuf"), ["revenue"]),
+    "aov": (("aov", "warenkorb", "bestellwert", "order value", "average order"), ["aov"]),
+    "orders": (("bestellungen", "bestellanzahl", "orders", "auftrag", "aufträg"), ["orders_by_channel"]),
+    "channel": (("kanal", "kanäl", "channel", "akquisitionskan", "acquisition channel"), ["orders_by_channel"]),
+    "margin": (
+        ("marge", "handelsspanne", "margin", "cogs", "warenkosten", "profit",
+         "rentab", "rohertrag", "deckungsbeitrag"),
+        ["gross_margin"]
+    ),
+    "marketing": (
+        ("marketing", "spend", "werbeausgab", "werbebudget", "werbekost", "kampagne", "campaign", "roas", "cac",
+         "customer acquisition", "acquisition cost", "kundenakquis", "akquisitionskost", "kundengewinnung",
+         "neukunden", "conversion", "konversion", "session", "traffic", "besucher"),
+        ["marketing_by_channel"]
+    ),
+}
+
+# Absichten, die nur eine Aufschlüsselung verlangen (Absicht -> Dimension): ihre Auswertungen
+# entfallen, wenn eine andere geplante Auswertung bereits nach dieser Dimension gruppiert
+BREAKDOWN_INTENTS = {"channel": "acquisition_channel"}
+
+# Fragen nach dem Gesamtbild ohne konkrete KPI brauchen alle Auswertungen
+OVERVIEW_KEYWORDS = (
+    "überblick", "übersicht", "gesamtbild", "overview", "dashboard", "kpi", "kpis", "kennzahlen",
+    "geschäftsentwicklung", "zusammenfassung"
+)
+
+
+def _matches(text: str, keywords: Sequence[str]) -> bool:
+    return any(
+        re.search(rf"\b{re.escape(keyword)}\b", text) if len(keyword) <= 4 else keyword in text
+        for keyword in keywords
+    )
+
+
+def match_intents(text: str) -> List[str]:
+    """
+    Absichten aus INTENT_RULES, deren Stichwörter in `text` vorkommen; nennt der Text keine
+    konkrete Absicht, aber ein Stichwort aus OVERVIEW_KEYWORDS, ist das Ergebnis ["overview"]
+    """
+    text = text.lower()
+    intents = [intent for intent, (keywords, _) in INTENT_RULES.items() if _matches(text, keywords)]
+    if not intents and _matches(text, OVERVIEW_KEYWORDS):
+        return ["overview"]
+    return intents
+
+
+def plan_reports(intents: List[str], reports: Dict[str, Tuple[List[str], List[str], Optional[str]]],
+                 source: str) -> KpiPlan:
+    """
+    Minimale Auswahl aus `reports` (Name -> (KPIs, Dimensionen, Sortierung)) für `intents`,
+    in der Reihenfolge von `reports`; ohne erkannte Absicht werden alle Auswertungen geplant
+    """
+    if not intents or "overview" in intents:
+        selected = list(reports)
+        source = source if intents else "default"
+    else:
+        wanted = {
+            name for intent in intents if intent not in BREAKDOWN_INTENTS
+            for name in INTENT_RULES[intent][1]
+        }
+        for intent, dimension in BREAKDOWN_INTENTS.items():
+            if intent in intents and not any(dimension in reports[name][1] for name in wanted):
+                wanted.update(INTENT_RULES[intent][1])
+        selected = [name for name in reports if name in wanted]
+
+    tables = []
+    for name in selected:
+        kpis, dimensions, _ = reports[name]
+        tables += [table for table in kpi_tables(kpis, dimensions) if table not in tables]
+    return {"intents": intents, "reports": selected, "tables": tables, "source": source}
+
+
+def plan_from_text(text: str, reports: Dict[str, Tuple[List[str], List[str], Optional[str]]],
+                   source: str = "rules") -> Optional[KpiPlan]:
+    """Regelbasierter Schnellweg: ein Plan, falls `text` eine bekannte Absicht enthält, sonst None"""
+    intents = match_intents(text)
+    return plan_reports(intents, reports, source) if intents else None
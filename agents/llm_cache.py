@@ -0,0 +1,140 @@
+"""
+Persistenter Antwort-Cache für LLM-Aufrufe (SQLite)
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import warnings
+from typing import Any, Dict, Optional
+
+from langchain_core._api import LangChainBetaWarning
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+
+from config import LLM_CACHE_PATH, LLM_CACHE_SIZE, LLM_CACHE_TTL_SECONDS
+
+
+class LLMResponseCache(BaseCache):
+    """
+    Exakter Antwort-Cache für Chat-Modelle auf SQLite-Basis. LangChain ruft ihn bei jedem
+    invoke/ainvoke eines Modells mit `cache=...` auf: `llm_string` enthält Modell, Temperatur
+    und gebundene Tools, `prompt` die vollständige Nachrichtenliste inkl. der Tool-Ergebnisse
+    (z.B. Query-Ergebnisse im Prompt des Datenanalyse-Agenten). Beide bilden zusammen den
+    Schlüssel; ändern sich die Daten, ändert sich damit auch der Schlüssel.
+
+    Einträge verfallen nach `ttl_seconds` (0 = nie); bei mehr als `max_entries` Einträgen werden
+    die am längsten ungenutzten verdrängt.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, max_entries: int = LLM_CACHE_SIZE,
+                 ttl_seconds: float = LLM_CACHE_TTL_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_responses (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS llm_responses_last_used ON llm_responses (last_used_at)")
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def make_key(prompt: str, llm_string: str) -> str:
+        """SHA-256 über Modellparameter und Nachrichtenliste"""
+        return hashlib.sha256(f"{llm_string}\n{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        """Gibt die gespeicherten Generations zurück oder None (zählt Treffer/Fehlschläge)"""
+        key = self.make_key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM llm_responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                response, created_at = row
+                if self.ttl_seconds <= 0 or now - created_at <= self.ttl_seconds:
+                    with self._conn:
+                        self._conn.execute("UPDATE llm_responses SET last_used_at = ? WHERE key = ?", (now, key))
+                    self.hits += 1
+                    with warnings.catch_warnings():
+                        warnings.simplefilter("ignore", LangChainBetaWarning)
+                        return loads(response)
+                with self._conn:
+                    self._conn.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+            self.misses += 1
+            return None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        """Speichert eine Antwort und verdrängt bei Bedarf die am längsten ungenutzten Einträge"""
+        if not self.enabled:
+            return
+        key = self.make_key(prompt, llm_string)
+        now = time.time()
+        response = dumps(list(return_val))
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_responses (key, response, created_at, last_used_at) VALUES (?, ?, ?, ?)",
+                (key, response, now, now)
+            )
+            overflow = self._count() - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM llm_responses WHERE key IN "
+                    "(SELECT key FROM llm_responses ORDER BY last_used_at LIMIT ?)",
+                    (overflow,)
+                )
+                self.evictions += overflow
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM llm_responses")
+
+    def _count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        """Kennzahlen des Caches (Trefferquote, Größe, Verdrängungen)"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": self._count(),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_llm_cache: Optional[LLMResponseCache] = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMResponseCache:
+    """Gibt den prozessweit geteilten LLM-Antwort-Cache zurück"""
+    global _llm_cache
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = LLMResponseCache()
+        return _llm_cache
@@ -0,0 +1,112 @@
+"""
+Gemeinsame LLM-Clients der Agenten mit geteiltem Keep-Alive-Verbindungspool
+"""
+import asyncio
+import threading
+import weakref
+from typing import Any, Dict, Optional
+
+import httpx
+from langchain_openai import ChatOpenAI
+
+from agents.llm_cache import get_llm_cache
+from agents.token_budget import PromptTokenRecorder
+from config import (
+    LLM_MODEL, OPENAI_API_KEY, LLM_ROLES,
+    LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE_CONNECTIONS, LLM_KEEPALIVE_EXPIRY_SECONDS
+)
+
+_lock = threading.Lock()
+_http_client: Optional[httpx.Client] = None
+_async_http_client: Optional["LoopLocalAsyncClient"] = None
+_clients: Dict[str, ChatOpenAI] = {}
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY_SECONDS
+    )
+
+
+def get_http_client() -> httpx.Client:
+    """HTTP-Client, dessen Verbindungen sich alle LLM-Clients teilen"""
+    global _http_client
+    with _lock:
+        if _http_client is None or _http_client.is_closed:
+            _http_client = httpx.Client(limits=_limits())
+        return _http_client
+
+
+class LoopLocalAsyncClient(httpx.AsyncClient):
+    """
+    AsyncClient, der jede Anfrage über einen eigenen Client des laufenden Event-Loops sendet.
+    Async-Verbindungen gehören zu dem Loop, in dem sie geöffnet wurden; so teilen sich die
+    LLM-Clients die Keep-Alive-Verbindungen je Loop, ohne sie in einem anderen Loop (z.B. einem
+    späteren asyncio.run) wiederzuverwenden.
+    """
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._client_kwargs = kwargs
+        self._loop_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._loop_clients_lock = threading.Lock()
+
+    def loop_client(self) -> httpx.AsyncClient:
+        """Client des laufenden Event-Loops (wird beim ersten Zugriff angelegt)"""
+        loop = asyncio.get_running_loop()
+        with self._loop_clients_lock:
+            client = self._loop_clients.get(loop)
+            if client is None or client.is_closed:
+                client = self._loop_clients[loop] = httpx.AsyncClient(**self._client_kwargs)
+            return client
+
+    async def send(self, request: httpx.Request, **kwargs: Any) -> httpx.Response:
+        return await self.loop_client().send(request, **kwargs)
+
+    async def aclose(self) -> None:
+        """Schließt die Verbindungen des laufenden Event-Loops"""
+        with self._loop_clients_lock:
+            client = self._loop_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Asynchrones Gegenstück zu get_http_client (für ainvoke/astream), Verbindungen je Event-Loop"""
+    global _async_http_client
+    with _lock:
+        if _async_http_client is None:
+            _async_http_client = LoopLocalAsyncClient(limits=_limits())
+        return _async_http_client
+
+
+def get_llm(role: str) -> ChatOpenAI:
+    """
+    LLM-Client für eine Agenten-Rolle aus LLM_ROLES (z.B. "classifier", "analyst", "report").
+    Jede Rolle erhält genau eine Instanz mit ihren Parametern; alle Instanzen nutzen denselben
+    HTTP-Verbindungspool, sodass TLS-Verbindungen zur API zwischen Agenten und Anfragen
+    wiederverwendet werden, beantworten wiederholte Aufrufe aus dem LLM-Antwort-Cache und
+    protokollieren die Prompt-Größe jedes Aufrufs.
+    """
+    if role not in LLM_ROLES:
+        raise ValueError(f"Unbekannte LLM-Rolle: {role}")
+    http_client = get_http_client()
+    http_async_client = get_async_http_client()
+    cache = get_llm_cache()
+    with _lock:
+        if role not in _clients:
+            _clients[role] = ChatOpenAI(
+                model=LLM_MODEL,
+                api_key=OPENAI_API_KEY,
+                http_client=http_client,
+                http_async_client=http_async_client,
+                cache=cache if cache.enabled else None,
+                callbacks=[PromptTokenRecorder(role)],
+                **LLM_ROLES[role]
+            )
+        return _clients[role]
+
@@ -1,21 +1,18 @@
 """
 Bericht-Generator-Agent für Fließtext-Berichte
 """
-from typing import Dict, Any
-from langchain_openai import ChatOpenAI
+from typing import Dict, Any, List
 from langchain.schema import HumanMessage, SystemMessage
-from config import LLM_MODEL, TEMPERATURE, OPENAI_API_KEY
+from agents.llm_client import get_llm
+from agents.token_budget import fit_to_budget
+from config import SUMMARY_INPUT_TOKEN_BUDGET
 
 
 class ReportGeneratorAgent:
     """Agent für die Erstellung von Fließtext-Berichten aus KPI-Daten"""
     
     def __init__(self):
-        self.llm = ChatOpenAI(
-            model=LLM_MODEL,
-            temperature=0.3,  # Etwas höhere Temperatur für kreativen Text
-            api_key=OPENAI_API_KEY
-        )
+        self.llm = get_llm("report")
         
         self.system_prompt = """
 Du bist ein erfahrener Business Analyst und Berichtsschreiber. Deine Aufgabe ist es, aus KPI-Daten und Analysen professionelle, gut lesbare Berichte im Fließtext zu erstellen.
@@ -39,48 +36,74 @@ Struktur:
 Verwende eine professionelle, aber zugängliche Sprache.
 """
     
-    def generate_report(self, analysis_data: str, request_context: str = "") -> Dict[str, Any]:
+    def generate_report(self, analysis_data: str, request_context: str = "",
+                        classification: str = "") -> Dict[str, Any]:
         """
-        Generiert einen Fließtext-Bericht aus KPI-Analysedaten
+        Generiert einen Fließtext-Bericht aus KPI-Analysedaten; die Klassifizierung der Anfrage
+        (Art der Analyse, relevante KPIs) gibt dem Bericht Schwerpunkt und Gliederung vor
         """
         try:
-            messages = [
-                SystemMessage(content=self.system_prompt),
-                HumanMessage(content=f"""
-Erstelle einen professionellen Geschäftsbericht basierend auf folgenden Analysedaten:
-
-Kontext der ursprünglichen Anfrage: {request_context}
-
-Analysedaten:
-{analysis_data}
-
-Erstelle einen strukturierten Bericht, der die wichtigsten Erkenntnisse hervorhebt und konkrete Handlungsempfehlungen gibt.
-""")
-            ]
-            
+            messages = self._report_messages(analysis_data, request_context, classification)
             response = self.llm.invoke(messages)
+            return self._report_result(response.content)
             
-            return {
-                "status": "success",
-                "report": response.content,
-                "agent": "ReportGeneratorAgent",
-                "word_count": len(response.content.split())
-            }
+        except Exception as e:
+            return self._failure(e)
+    
+    async def agenerate_report(self, analysis_data: str, request_context: str = "",
+                               classification: str = "") -> Dict[str, Any]:
+        """Async-Version von generate_report"""
+        try:
+            messages = self._report_messages(analysis_data, request_context, classification)
+            response = await self.llm.ainvoke(messages)
+            return self._report_result(response.content)
             
         except Exception as e:
-            return {
-                "status": "error",
-                "error": str(e),
-                "agent": "ReportGeneratorAgent"
-            }
+            return self._failure(e)
     
     def generate_executive_summary(self, full_report: str) -> Dict[str, Any]:
         """
         Erstellt eine Kurzzusammenfassung eines vollständigen Berichts
         """
         try:
-            messages = [
-                SystemMessage(content="""
+            response = self.llm.invoke(self._summary_messages(full_report))
+            return self._summary_result(response.content)
+            
+        except Exception as e:
+            return self._failure(e)
+    
+    async def agenerate_executive_summary(self, full_report: str) -> Dict[str, Any]:
+        """Async-Version von generate_executive_summary"""
+        try:
+            response = await self.llm.ainvoke(self._summary_messages(full_report))
+            return self._summary_result(response.content)
+            
+        except Exception as e:
+            return self._failure(e)
+    
+    def _report_messages(self, analysis_data: str, request_context: str, classification: str) -> List:
+        return [
+            SystemMessage(content=self.system_prompt),
+            HumanMessage(content=f"""
+Erstelle einen professionellen Geschäftsbericht basierend auf folgenden Analysedaten:
+
+Kontext der ursprünglichen Anfrage: {request_context}
+
+Einordnung der Anfrage:
+{classification or "Keine Klassifizierung verfügbar."}
+
+Analysedaten:
+{analysis_data}
+
+Erstelle einen strukturierten Bericht, der die wichtigsten Erkenntnisse hervorhebt und konkrete Handlungsempfehlungen gibt.
+""")
+        ]
+    
+    @staticmethod
+    def _summary_messages(full_report: str) -> List:
+        full_report = fit_to_budget("summary_input", full_report, SUMMARY_INPUT_TOKEN_BUDGET)
+        return [
+            SystemMessage(content="""
 Du erstellst prägnante Executive Summaries aus vollständigen Geschäftsberichten.
 Die Zusammenfassung soll:
 - Maximal 100 Wörter haben
@@ -88,24 +111,34 @@ Die Zusammenfassung soll:
 - Die wichtigste Handlungsempfehlung hervorheben
 - Für C-Level Manager geeignet sein
 """),
-                HumanMessage(content=f"""
+            HumanMessage(content=f"""
 Erstelle eine Executive Summary für folgenden Bericht:
 
 {full_report}
 """)
-            ]
-            
-            response = self.llm.invoke(messages)
-            
-            return {
-                "status": "success",
-                "executive_summary": response.content,
-                "agent": "ReportGeneratorAgent"
-            }
-            
-        except Exception as e:
-            return {
-                "status": "error",
-                "error": str(e),
-                "agent": "ReportGeneratorAgent"
-            } 
\ No newline at end of file
+        ]
+    
+    @staticmethod
+    def _report_result(report: str) -> Dict[str, Any]:
+        return {
+            "status": "success",
+            "report": report,
+            "agent": "ReportGeneratorAgent",
+            "word_count": len(report.split())
+        }
+    
+    @staticmethod
+    def _summary_result(summary: str) -> Dict[str, Any]:
+        return {
+            "status": "success",
+            "executive_summary": summary,
+            "agent": "ReportGeneratorAgent"
+        }
+    
+    @staticmethod
+    def _failure(error: Exception) -> Dict[str, Any]:
+        return {
+            "status": "error",
+            "error": str(error),
+            "agent": "ReportGeneratorAgent"
+        }
@@ -0,0 +1,172 @@
+"""
+Token-Buchhaltung für LLM-Aufrufe und Token-Budgets bei der Übergabe zwischen Agenten
+"""
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, TypedDict
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from config import PROMPT_METRICS_MAX_RECORDS
+from tools.query_metrics import current_workflow_id
+from utils.token_counter import count_tokens
+
+
+class PromptMetrics(TypedDict):
+    """
+    Tokens eines LLM-Aufrufs (`call` = "llm:<rolle>") oder einer Übergabe zwischen Agenten
+    (`call` = Name des Budgets); bei Übergaben ist `original_tokens` die Größe vor der Verdichtung
+    """
+    timestamp: int
+    workflow_id: Optional[str]
+    call: str
+    tokens: int
+    original_tokens: int
+    budget: Optional[int]
+    compressed: bool
+
+
+class PromptMetricsStore:
+    """In-Process-Speicher der letzten Prompt-Metriken, abfragbar nach Workflow"""
+
+    def __init__(self, max_records: int = PROMPT_METRICS_MAX_RECORDS):
+        self._records: "deque[PromptMetrics]" = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+
+    def record(self, call: str, tokens: int, original_tokens: Optional[int] = None,
+               budget: Optional[int] = None) -> None:
+        original_tokens = tokens if original_tokens is None else original_tokens
+        with self._lock:
+            self._records.append(PromptMetrics(
+                timestamp=int(time.time() * 1000),
+                workflow_id=current_workflow_id.get(),
+                call=call,
+                tokens=tokens,
+                original_tokens=original_tokens,
+                budget=budget,
+                compressed=tokens < original_tokens
+            ))
+
+    def query(self, workflow_id: Optional[str] = None) -> List[PromptMetrics]:
+        """Gibt die Metriken eines (bzw. aller) Workflows zurück, älteste zuerst"""
+        with self._lock:
+            return [
+                dict(record) for record in self._records
+                if workflow_id is None or record["workflow_id"] == workflow_id
+            ]
+
+    def summary(self, workflow_id: Optional[str] = None) -> Dict[str, Any]:
+        """Prompt-Tokens je LLM-Rolle sowie Anzahl und Ersparnis der Verdichtungen"""
+        records = self.query(workflow_id)
+        llm_calls = [r for r in records if r["call"].startswith("llm:")]
+        handoffs = [r for r in records if not r["call"].startswith("llm:")]
+        by_role: Dict[str, int] = {}
+        for r in llm_calls:
+            role = r["call"].split(":", 1)[1]
+            by_role[role] = by_role.get(role, 0) + r["tokens"]
+        return {
+            "llm_calls": len(llm_calls),
+            "prompt_tokens": sum(r["tokens"] for r in llm_calls),
+            "prompt_tokens_by_role": by_role,
+            "compressions": sum(1 for r in handoffs if r["compressed"]),
+            "tokens_saved": sum(r["original_tokens"] - r["tokens"] for r in handoffs),
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._records.clear()
+
+
+_prompt_metrics_store: Optional[PromptMetricsStore] = None
+_prompt_metrics_store_lock = threading.Lock()
+
+
+def get_prompt_metrics_store() -> PromptMetricsStore:
+    """Gibt den prozessweit geteilten Speicher der Prompt-Metriken zurück"""
+    global _prompt_metrics_store
+    with _prompt_metrics_store_lock:
+        if _prompt_metrics_store is None:
+            _prompt_metrics_store = PromptMetricsStore()
+        return _prompt_metrics_store
+
+
+class PromptTokenRecorder(BaseCallbackHandler):
+    """Callback, der die Prompt-Größe jedes Aufrufs eines Chat-Modells misst"""
+
+    def __init__(self, role: str):
+        self.role = role
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], **kwargs: Any) -> None:
+        for prompt in messages:
+            tokens = sum(count_tokens(str(message.content)) for message in prompt)
+            get_prompt_metrics_store().record(f"llm:{self.role}", tokens)
+
+
+def key_lines(text: str) -> List[str]:
+    """Zeilen mit Zahlen (KPI-Werte, Veränderungen) ohne Markdown-Hervorhebung, ohne Duplikate"""
+    lines = []
+    for line in text.splitlines():
+        line = re.sub(r"\*\*|__", "", line).strip()
+        if re.search(r"\d", line) and line not in lines:
+            lines.append(line)
+    return lines
+
+
+def truncate_to_budget(text: str, budget: int) -> str:
+    """Längster Anfang von `text`, der in `budget` Tokens passt (Binärsuche über die Zeichen)"""
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle]) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low].rstrip()
+
+
+def fit_to_budget(call: str, text: str, budget: int, kpi_data: str = "") -> str:
+    """
+    Gibt `text` unverändert zurück, wenn er in `budget` Tokens passt (0 = unbegrenzt). Sonst wird
+    er verdichtet: statt der Prosa erhält der nächste Agent die strukturierten KPI-Daten
+    (`kpi_data`, z.B. die kompakten Query-Ergebnisse) und so viele Kernaussagen mit Zahlen aus
+    `text`, wie das Budget zulässt. Beide Größen werden unter `call` protokolliert.
+    """
+    tokens = count_tokens(text)
+    if budget <= 0 or tokens <= budget:
+        get_prompt_metrics_store().record(call, tokens, budget=budget or None)
+        return text
+
+    sections = []
+    used = 0
+    if kpi_data:
+        header = "KPI-Daten:"
+        kept = [header]
+        used = count_tokens(header)
+        for line in kpi_data.splitlines():
+            line_tokens = count_tokens(line) + 1
+            if used + line_tokens > budget:
+                break
+            kept.append(line)
+            used += line_tokens
+        sections.append("\n".join(kept))
+
+    header = "Kernaussagen der Analyse:"
+    statements = [header]
+    used += count_tokens(header) + 2
+    for line in key_lines(text):
+        line_tokens = count_tokens(line) + 1
+        if used + line_tokens > budget:
+            break
+        statements.append(line)
+        used += line_tokens
+    if len(statements) > 1:
+        sections.append("\n".join(statements))
+
+    # Ohne KPI-Daten und Zeilen mit Zahlen bleibt der gekürzte Anfang des Texts
+    compressed = "\n\n".join(sections) or truncate_to_budget(text, budget)
+    compressed_tokens = count_tokens(compressed)
+    print(f"✂️ {call}: {tokens} → {compressed_tokens} Tokens verdichtet (Budget {budget})")
+    get_prompt_metrics_store().record(call, compressed_tokens, tokens, budget)
+    return compressed
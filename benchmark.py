@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Benchmark für das DuckDB Tool mit den KPI-Queries des Datenanalyse-Agenten
+
+Misst pro Skalierungsfaktor und Query die Cold-Latenz (frischer Katalog inkl. Ingest),
+die Warm-Latenz (Tabellen geladen, ohne Ergebnis-Cache) mit p50/p95, die Latenz bei
+Cache-Treffern sowie den Peak-RSS. Jeder Skalierungsfaktor läuft in einem eigenen
+Prozess, damit der Peak-RSS nicht von vorherigen Läufen verfälscht wird.
+
+Beispiel:
+    python benchmark.py --scales 1 10 100 --runs 20
+    python benchmark.py --scales 1 10 --compare benchmark_results/<vorheriger_lauf>.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _peak_rss_mb() -> float:
+    """Peak-RSS des aktuellen Prozesses in MB (ru_maxrss: KB unter Linux, Bytes unter macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _latency_stats(samples_ms: List[float]) -> Dict[str, float]:
+    samples = np.array(samples_ms)
+    return {
+        "p50_ms": round(float(np.percentile(samples, 50)), 3),
+        "p95_ms": round(float(np.percentile(samples, 95)), 3),
+        "mean_ms": round(float(samples.mean()), 3),
+        "min_ms": round(float(samples.min()), 3),
+        "max_ms": round(float(samples.max()), 3),
+    }
+
+
+def benchmark_queries() -> Dict[str, str]:
+    """Die KPI-Queries aus DataAnalystAgent._analyze_with_tools (einzeln und als Batch)"""
+    from agents.data_analyst_agent import COMMON_QUERIES, KPI_BATCH_QUERY
+
+    queries = dict(COMMON_QUERIES)
+    queries["kpi_batch"] = KPI_BATCH_QUERY
+    return queries
+
+
+def ensure_dataset(scale: float, data_root: str, seed: int) -> str:
+    """Erzeugt den Datensatz für einen Skalierungsfaktor, falls er noch nicht existiert"""
+    from utils.data_generator import SyntheticDataGenerator
+
+    data_dir = os.path.join(data_root, f"sf{scale:g}_seed{seed}")
+    if not os.path.exists(os.path.join(data_dir, "web_analytics_daily.csv")):
+        print(f"🏭 Erzeuge Datensatz für Skalierungsfaktor {scale:g} ...")
+        SyntheticDataGenerator(scale=scale, seed=seed).generate(data_dir)
+    return data_dir
+
+
+def run_scale(scale: float, data_dir: str, runs: int, use_parquet: bool) -> Dict[str, Any]:
+    """Führt alle Queries für einen Skalierungsfaktor aus (läuft in einem eigenen Prozess)"""
+    from config import CSV_FILES
+    from tools.duckdb_catalog import DuckDBCatalog
+    from tools.duckdb_tool import DuckDBQueryTool
+    from tools.parquet_cache import ParquetCache
+    from tools.query_cache import QueryResultCache
+
+    csv_files = {name: os.path.join(data_dir, os.path.basename(path)) for name, path in CSV_FILES.items()}
+    parquet_cache = ParquetCache(os.path.join(data_dir, ".parquet"))
+    results = {}
+
+    for query_name, query in benchmark_queries().items():
+        # Cold: frischer Katalog, die referenzierten Tabellen werden erst durch die Query geladen
+        catalog = DuckDBCatalog(csv_files, use_parquet=use_parquet, parquet_cache=parquet_cache)
+        tool = DuckDBQueryTool(catalog=catalog, query_cache=QueryResultCache(max_entries=0))
+        started = time.perf_counter()
+        output = tool._run(query)
+        cold_ms = (time.perf_counter() - started) * 1000
+        error = output if output.startswith("Fehler") else None
+
+        # Warm: Tabellen geladen, jede Ausführung geht durch DuckDB
+        warm_ms = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            tool._run(query)
+            warm_ms.append((time.perf_counter() - started) * 1000)
+
+        # Cached: Wiederholung mit aktivem Ergebnis-Cache
+        cached_tool = DuckDBQueryTool(catalog=catalog, query_cache=QueryResultCache())
+        cached_tool._run(query)
+        cached_ms = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            cached_tool._run(query)
+            cached_ms.append((time.perf_counter() - started) * 1000)
+
+        results[query_name] = {
+            "cold_ms": round(cold_ms, 3),
+            "warm": _latency_stats(warm_ms),
+            "cached": _latency_stats(cached_ms),
+            "error": error,
+        }
+        print(f"  {query_name:<18} cold {cold_ms:9.1f} ms | warm p50 {results[query_name]['warm']['p50_ms']:8.2f} ms"
+              f" p95 {results[query_name]['warm']['p95_ms']:8.2f} ms | cached p50 {results[query_name]['cached']['p50_ms']:6.3f} ms")
+
+    row_counts = catalog.query_df("SELECT (SELECT COUNT(*) FROM orders) AS orders, (SELECT COUNT(*) FROM order_items) AS order_items")
+    return {
+        "scale": scale,
+        "rows": {name: int(value) for name, value in row_counts.iloc[0].items()},
+        "queries": results,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def compare(current: Dict[str, Any], baseline_path: str) -> None:
+    """Vergleicht die Warm-p50-Latenzen mit einem früheren Lauf"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    baseline_scales = {entry["scale"]: entry for entry in baseline["results"]}
+
+    print(f"\n📊 Vergleich mit {baseline_path} (Commit {baseline.get('git_commit')})")
+    for entry in current["results"]:
+        previous = baseline_scales.get(entry["scale"])
+        if previous is None:
+            continue
+        for query_name, result in entry["queries"].items():
+            before = previous["queries"].get(query_name)
+            if before is None:
+                continue
+            old_p50, new_p50 = before["warm"]["p50_ms"], result["warm"]["p50_ms"]
+            change = (new_p50 - old_p50) / old_p50 * 100 if old_p50 else 0.0
+            marker = "🔺" if change > 10 else "🔻" if change < -10 else "  "
+            print(f"{marker} sf{entry['scale']:g} {query_name:<18} warm p50 {old_p50:8.2f} -> {new_p50:8.2f} ms ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark für DuckDB Tool und KPI-Queries")
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 10, 100], help="Skalierungsfaktoren")
+    parser.add_argument("--runs", type=int, default=20, help="Warm-Wiederholungen pro Query")
+    parser.add_argument("--seed", type=int, default=42, help="Seed des Datengenerators")
+    parser.add_argument("--data-root", default=".cache/benchmark_data", help="Ablage der erzeugten Datensätze")
+    parser.add_argument("--parquet", action="store_true", help="Tabellen über den Parquet-Cache laden")
+    parser.add_argument("--output", default="benchmark_results", help="Verzeichnis für die JSON-Ergebnisse")
+    parser.add_argument("--compare", default=None, help="Früheres Ergebnis-JSON zum Vergleich")
+    args = parser.parse_args()
+
+    print("🚀 DuckDB Tool Benchmark")
+    print("=" * 50)
+
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "runs": args.runs,
+        "seed": args.seed,
+        "parquet": args.parquet,
+        "results": [],
+    }
+
+    # Eigener Prozess pro Skalierungsfaktor für einen unverfälschten Peak-RSS
+    context = multiprocessing.get_context("spawn")
+    for scale in args.scales:
+        data_dir = ensure_dataset(scale, args.data_root, args.seed)
+        print(f"\n📋 Skalierungsfaktor {scale:g}")
+        with context.Pool(1) as pool:
+            result = pool.apply(run_scale, (scale, data_dir, args.runs, args.parquet))
+        print(f"  Peak-RSS: {result['peak_rss_mb']} MB, Zeilen: {result['rows']}")
+        report["results"].append(result)
+
+    os.makedirs(args.output, exist_ok=True)
+    output_path = os.path.join(
+        args.output, f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{report['git_commit'] or 'nogit'}.json"
+    )
+    with open(output_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Ergebnisse gespeichert: {output_path}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
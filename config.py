@@ -15,8 +15,33 @@ if not OPENAI_API_KEY:
 LLM_MODEL = "gpt-4o-mini"  # Kostengünstiger für Demo-Zwecke
 TEMPERATURE = 0.1
 
+# Parameter der LLM-Clients je Agenten-Rolle (siehe agents/llm_client.py)
+LLM_ROLES = {
+    "classifier": {"temperature": TEMPERATURE},
+    "analyst": {"temperature": TEMPERATURE},
+    "report": {"temperature": 0.3},  # Etwas höhere Temperatur für kreativen Text
+}
+
+# Gemeinsamer HTTP-Verbindungspool aller LLM-Clients: maximale Verbindungen, davon offen
+# gehaltene Keep-Alive-Verbindungen und deren Lebensdauer ohne Anfrage
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "10"))
+LLM_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("LLM_KEEPALIVE_EXPIRY_SECONDS", "60"))
+
+# Persistenter Antwort-Cache für LLM-Aufrufe (SQLite, 0 Einträge = deaktiviert, TTL 0 = unbegrenzt)
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "1000"))
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "86400"))
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".cache/llm_cache.sqlite")
+
+# Token-Budgets für Übergaben zwischen Agenten (0 = unbegrenzt): längere Eingaben werden vorher
+# auf die strukturierten KPI-Daten und die Kernaussagen mit Zahlen verdichtet
+REPORT_INPUT_TOKEN_BUDGET = int(os.getenv("REPORT_INPUT_TOKEN_BUDGET", "1500"))
+SUMMARY_INPUT_TOKEN_BUDGET = int(os.getenv("SUMMARY_INPUT_TOKEN_BUDGET", "1000"))
+# Anzahl gespeicherter Prompt-Metriken (Tokens je LLM-Aufruf und Übergabe, 0 = keine)
+PROMPT_METRICS_MAX_RECORDS = int(os.getenv("PROMPT_METRICS_MAX_RECORDS", "1000"))
+
 # Pfade
-DATA_PATH = "show_case_data"
+DATA_PATH = os.getenv("DATA_PATH", "show_case_data")
 CSV_FILES = {
     "customers": f"{DATA_PATH}/customers.csv",
     "orders": f"{DATA_PATH}/orders.csv", 
@@ -24,4 +49,45 @@ CSV_FILES = {
     "products": f"{DATA_PATH}/products.csv",
     "marketing_spend": f"{DATA_PATH}/marketing_spend.csv",
     "web_analytics_daily": f"{DATA_PATH}/web_analytics_daily.csv"
-} 
\ No newline at end of file
+} 
+
+# DuckDB-Ingest
+# Optionaler Parquet-Cache: CSV-Dateien werden einmalig in typisierte Parquet-Dateien
+# konvertiert (Schlüssel: Inhalts-Hash der CSV) und DuckDB liest danach nur noch diese
+USE_PARQUET_CACHE = os.getenv("USE_PARQUET_CACHE", "false").lower() in ("1", "true", "yes")
+PARQUET_CACHE_DIR = os.getenv("PARQUET_CACHE_DIR", ".cache/parquet")
+
+# Optional: nach Jahr/Monat der Datumsspalte hive-partitionierte Parquet-Kopien, damit Queries
+# mit Datumsfilter nur die Dateien der betroffenen Monate lesen
+USE_DATE_PARTITIONING = os.getenv("USE_DATE_PARTITIONING", "false").lower() in ("1", "true", "yes")
+DATE_PARTITION_COLUMNS = {"orders": "order_date", "web_analytics_daily": "date"}
+
+# Exporte, an die nur Zeilen angehängt werden - bei Wachstum wird nur der neue Teil geladen
+APPEND_ONLY_TABLES = ["orders", "order_items", "web_analytics_daily"]
+
+# Anzahl paralleler DuckDB-Cursor auf der gemeinsamen Datenbank
+DUCKDB_POOL_SIZE = int(os.getenv("DUCKDB_POOL_SIZE", "4"))
+
+# Ressourcengrenzen der DuckDB-Datenbank: Zeitlimit pro Query (0 = unbegrenzt), Speicherlimit
+# (leer = DuckDB-Standard), Threads (0 = alle Kerne) und Auslagerungsverzeichnis für große Joins
+DUCKDB_QUERY_TIMEOUT_SECONDS = float(os.getenv("DUCKDB_QUERY_TIMEOUT_SECONDS", "30"))
+DUCKDB_MEMORY_LIMIT = os.getenv("DUCKDB_MEMORY_LIMIT", "")
+DUCKDB_THREADS = int(os.getenv("DUCKDB_THREADS", "0"))
+DUCKDB_TEMP_DIRECTORY = os.getenv("DUCKDB_TEMP_DIRECTORY", ".cache/duckdb_tmp")
+
+# Ergebnis-Cache für SQL-Queries (LRU, 0 Einträge = deaktiviert, TTL 0 = unbegrenzt)
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "256"))
+QUERY_CACHE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "600"))
+
+# Ausgabe von Query-Ergebnissen an das LLM: "compact" (CSV mit Spaltentypen, gerundete Zahlen,
+# bei großen Ergebnissen Top-k-Zeilen plus Zusammenfassung) oder "table" (ausgerichtete Tabelle)
+RESULT_FORMAT = os.getenv("RESULT_FORMAT", "compact")
+RESULT_DECIMALS = int(os.getenv("RESULT_DECIMALS", "2"))
+
+# Query-Metriken: Anzahl gespeicherter Datensätze (0 = keine Metriken) und optionales JSON-Profil pro Query
+QUERY_METRICS_MAX_RECORDS = int(os.getenv("QUERY_METRICS_MAX_RECORDS", "1000"))
+QUERY_PROFILING = os.getenv("QUERY_PROFILING", "false").lower() in ("1", "true", "yes")
+
+
+# KPI-Ausführung: alle Standard-KPIs des Datenanalyse-Agenten in einem gemeinsamen Scan berechnen
+BATCH_KPI_QUERIES = os.getenv("BATCH_KPI_QUERIES", "true").lower() in ("1", "true", "yes")
\ No newline at end of file
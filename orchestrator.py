@@ -1,42 +1,44 @@
 """
 Orchestrator für den Multi-Agenten-Workflow
 """
-from typing import Dict, Any, TypedDict, Annotated
-from langgraph.graph import StateGraph, END
+from typing import Dict, Any, AsyncIterator, List, TypedDict, Annotated
+from langgraph.graph import StateGraph, START, END
 from langgraph.prebuilt import ToolExecutor
-from langchain_openai import ChatOpenAI
 from langchain.schema import HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableLambda
 
 from agents.data_analyst_agent import DataAnalystAgent
 from agents.report_generator_agent import ReportGeneratorAgent
-from tools.duckdb_tool import DuckDBQueryTool
-from config import LLM_MODEL, TEMPERATURE, OPENAI_API_KEY
+from agents.llm_client import get_llm
+from agents.token_budget import fit_to_budget
+from config import REPORT_INPUT_TOKEN_BUDGET
+
+
+def merge_errors(left: str, right: str) -> str:
+    """Reducer für `error`: Fehler paralleler Knoten gehen nicht verloren"""
+    return "; ".join(error for error in (left, right) if error)
 
 
 class WorkflowState(TypedDict):
     """State-Struktur für den LangGraph-Workflow"""
     original_request: str
     current_step: str
+    classification: str
     analysis_result: Dict[str, Any]
     report_result: Dict[str, Any]
     final_output: str
-    error: str
+    error: Annotated[str, merge_errors]
 
 
 class MultiAgentOrchestrator:
     """Orchestrator für den Multi-Agenten-Workflow"""
     
     def __init__(self):
-        self.llm = ChatOpenAI(
-            model=LLM_MODEL,
-            temperature=TEMPERATURE,
-            api_key=OPENAI_API_KEY
-        )
+        self.llm = get_llm("classifier")
         
         # Agenten initialisieren
         self.data_analyst = DataAnalystAgent()
         self.report_generator = ReportGeneratorAgent()
-        self.duckdb_tool = DuckDBQueryTool()
         
         # Workflow-Graph erstellen
         self.workflow = self._create_workflow()
@@ -46,30 +48,44 @@ class MultiAgentOrchestrator:
         
         workflow = StateGraph(WorkflowState)
         
-        # Knoten hinzufügen
-        workflow.add_node("classify_request", self._classify_request)
-        workflow.add_node("analyze_data", self._analyze_data)
-        workflow.add_node("generate_report", self._generate_report)
+        # Knoten hinzufügen - jeweils mit synchroner (invoke) und asynchroner (ainvoke) Variante
+        workflow.add_node("classify_request", RunnableLambda(self._classify_request, afunc=self._aclassify_request))
+        workflow.add_node("analyze_data", RunnableLambda(self._analyze_data, afunc=self._aanalyze_data))
+        workflow.add_node("generate_report", RunnableLambda(self._generate_report, afunc=self._agenerate_report))
         workflow.add_node("finalize_output", self._finalize_output)
         
-        # Einstiegspunkt
-        workflow.set_entry_point("classify_request")
-        
-        # Edges definieren
-        workflow.add_edge("classify_request", "analyze_data")
-        workflow.add_edge("analyze_data", "generate_report")
+        # Klassifizierung und Datenanalyse laufen parallel (Fan-out ab START), der
+        # Bericht wartet auf beide Zweige (Fan-in) und nutzt die Klassifizierung als Kontext
+        workflow.add_edge(START, "classify_request")
+        workflow.add_edge(START, "analyze_data")
+        workflow.add_edge(["classify_request", "analyze_data"], "generate_report")
         workflow.add_edge("generate_report", "finalize_output")
         workflow.add_edge("finalize_output", END)
         
         return workflow.compile()
     
-    def _classify_request(self, state: WorkflowState) -> WorkflowState:
-        """Klassifiziert und verarbeitet die eingehende Anfrage"""
+    def _classify_request(self, state: WorkflowState) -> Dict[str, Any]:
+        """Klassifiziert die eingehende Anfrage (parallel zur Datenanalyse)"""
         try:
-            request = state["original_request"]
+            response = self.llm.invoke(self._classification_messages(state["original_request"]))
+            return self._classified(response.content)
             
-            # Einfache Klassifizierung - kann erweitert werden
-            classification_prompt = f"""
+        except Exception as e:
+            return {"error": f"Fehler bei der Anfrage-Klassifizierung: {str(e)}"}
+    
+    async def _aclassify_request(self, state: WorkflowState) -> Dict[str, Any]:
+        """Async-Version von _classify_request"""
+        try:
+            response = await self.llm.ainvoke(self._classification_messages(state["original_request"]))
+            return self._classified(response.content)
+            
+        except Exception as e:
+            return {"error": f"Fehler bei der Anfrage-Klassifizierung: {str(e)}"}
+    
+    @staticmethod
+    def _classification_messages(request: str) -> List:
+        # Einfache Klassifizierung - kann erweitert werden
+        classification_prompt = f"""
 Analysiere folgende Geschäftsanfrage und kategorisiere sie:
 
 Anfrage: {request}
@@ -81,80 +97,105 @@ Bestimme:
 
 Antworte kurz und präzise auf Deutsch.
 """
-            
-            messages = [
-                SystemMessage(content="Du bist ein Business Intelligence Experte, der Datenanfragen klassifiziert."),
-                HumanMessage(content=classification_prompt)
-            ]
-            
-            response = self.llm.invoke(messages)
-            
-            state["current_step"] = "request_classified"
-            print(f"🎯 Anfrage klassifiziert: {response.content[:100]}...")
-            
-            return state
-            
-        except Exception as e:
-            state["error"] = f"Fehler bei der Anfrage-Klassifizierung: {str(e)}"
-            return state
+        return [
+            SystemMessage(content="Du bist ein Business Intelligence Experte, der Datenanfragen klassifiziert."),
+            HumanMessage(content=classification_prompt)
+        ]
     
-    def _analyze_data(self, state: WorkflowState) -> WorkflowState:
+    @staticmethod
+    def _classified(classification: str) -> Dict[str, Any]:
+        print(f"🎯 Anfrage klassifiziert: {classification[:100]}...")
+        return {"classification": classification}
+    
+    def _analyze_data(self, state: WorkflowState) -> Dict[str, Any]:
         """Führt die Datenanalyse durch"""
         try:
             print("📊 Starte Datenanalyse...")
+            return self._analyzed(self.data_analyst.analyze_data(state["original_request"]))
             
-            analysis_result = self.data_analyst.analyze_data(state["original_request"])
-            state["analysis_result"] = analysis_result
-            state["current_step"] = "data_analyzed"
-            
-            if analysis_result["status"] == "success":
-                print("✅ Datenanalyse erfolgreich abgeschlossen")
-            else:
-                print(f"❌ Fehler bei der Datenanalyse: {analysis_result.get('error', 'Unbekannter Fehler')}")
-            
-            return state
+        except Exception as e:
+            return {"error": f"Fehler bei der Datenanalyse: {str(e)}"}
+    
+    async def _aanalyze_data(self, state: WorkflowState) -> Dict[str, Any]:
+        """Async-Version von _analyze_data"""
+        try:
+            print("📊 Starte Datenanalyse...")
+            return self._analyzed(await self.data_analyst.aanalyze_data(state["original_request"]))
             
         except Exception as e:
-            state["error"] = f"Fehler bei der Datenanalyse: {str(e)}"
-            return state
+            return {"error": f"Fehler bei der Datenanalyse: {str(e)}"}
     
-    def _generate_report(self, state: WorkflowState) -> WorkflowState:
+    @staticmethod
+    def _analyzed(analysis_result: Dict[str, Any]) -> Dict[str, Any]:
+        if analysis_result["status"] == "success":
+            print("✅ Datenanalyse erfolgreich abgeschlossen")
+        else:
+            print(f"❌ Fehler bei der Datenanalyse: {analysis_result.get('error', 'Unbekannter Fehler')}")
+        
+        return {"analysis_result": analysis_result, "current_step": "data_analyzed"}
+    
+    def _generate_report(self, state: WorkflowState) -> Dict[str, Any]:
         """Generiert den Fließtext-Bericht"""
         try:
             print("📝 Generiere Bericht...")
             
-            if state["analysis_result"]["status"] != "success":
-                state["error"] = "Kann keinen Bericht erstellen - Datenanalyse war nicht erfolgreich"
-                return state
+            if state["analysis_result"].get("status") != "success":
+                return {"error": "Kann keinen Bericht erstellen - Datenanalyse war nicht erfolgreich"}
             
-            analysis_text = state["analysis_result"]["analysis"]
             report_result = self.report_generator.generate_report(
-                analysis_text, 
-                state["original_request"]
+                self._report_input(state["analysis_result"]),
+                state["original_request"],
+                state.get("classification", "")
             )
+            return self._report_generated(report_result)
             
-            state["report_result"] = report_result
-            state["current_step"] = "report_generated"
+        except Exception as e:
+            return {"error": f"Fehler bei der Berichtserstellung: {str(e)}"}
+    
+    async def _agenerate_report(self, state: WorkflowState) -> Dict[str, Any]:
+        """Async-Version von _generate_report"""
+        try:
+            print("📝 Generiere Bericht...")
             
-            if report_result["status"] == "success":
-                print("✅ Bericht erfolgreich generiert")
-            else:
-                print(f"❌ Fehler bei der Berichtserstellung: {report_result.get('error', 'Unbekannter Fehler')}")
+            if state["analysis_result"].get("status") != "success":
+                return {"error": "Kann keinen Bericht erstellen - Datenanalyse war nicht erfolgreich"}
             
-            return state
+            report_result = await self.report_generator.agenerate_report(
+                self._report_input(state["analysis_result"]),
+                state["original_request"],
+                state.get("classification", "")
+            )
+            return self._report_generated(report_result)
             
         except Exception as e:
-            state["error"] = f"Fehler bei der Berichtserstellung: {str(e)}"
-            return state
+            return {"error": f"Fehler bei der Berichtserstellung: {str(e)}"}
+    
+    @staticmethod
+    def _report_input(analysis_result: Dict[str, Any]) -> str:
+        """Analyse für den Bericht, bei Überschreitung des Token-Budgets auf die KPI-Daten verdichtet"""
+        return fit_to_budget(
+            "report_input",
+            analysis_result["analysis"],
+            REPORT_INPUT_TOKEN_BUDGET,
+            analysis_result.get("kpi_data", "")
+        )
     
-    def _finalize_output(self, state: WorkflowState) -> WorkflowState:
+    @staticmethod
+    def _report_generated(report_result: Dict[str, Any]) -> Dict[str, Any]:
+        if report_result["status"] == "success":
+            print("✅ Bericht erfolgreich generiert")
+        else:
+            print(f"❌ Fehler bei der Berichtserstellung: {report_result.get('error', 'Unbekannter Fehler')}")
+        
+        return {"report_result": report_result, "current_step": "report_generated"}
+    
+    def _finalize_output(self, state: WorkflowState) -> Dict[str, Any]:
         """Finalisiert die Ausgabe"""
         try:
             print("🎁 Finalisiere Ausgabe...")
             
             if state.get("error"):
-                state["final_output"] = f"❌ Fehler im Workflow: {state['error']}"
-                return state
+                return {"final_output": f"❌ Fehler im Workflow: {state['error']}"}
             
             if (state["analysis_result"]["status"] == "success" and 
                 state["report_result"]["status"] == "success"):
@@ -176,17 +217,16 @@ Antworte kurz und präzise auf Deutsch.
 *Generiert durch Multi-Agenten-System mit LangGraph*
 *Wörter im Bericht: {state['report_result'].get('word_count', 'N/A')}*
 """
-                state["final_output"] = final_output
                 print("✅ Workflow erfolgreich abgeschlossen")
-            else:
-                state["final_output"] = "❌ Workflow konnte nicht erfolgreich abgeschlossen werden"
+                return {"final_output": final_output, "current_step": "completed"}
             
-            return state
+            return {"final_output": "❌ Workflow konnte nicht erfolgreich abgeschlossen werden"}
             
         except Exception as e:
-            state["error"] = f"Fehler bei der Finalisierung: {str(e)}"
-            state["final_output"] = f"❌ Fehler bei der Finalisierung: {str(e)}"
-            return state
+            return {
+                "error": f"Fehler bei der Finalisierung: {str(e)}",
+                "final_output": f"❌ Fehler bei der Finalisierung: {str(e)}"
+            }
     
     def process_request(self, request: str) -> str:
         """
@@ -194,22 +234,83 @@ Antworte kurz und präzise auf Deutsch.
         """
         print(f"🚀 Starte Multi-Agenten-Workflow für: {request[:50]}...")
         
-        # Initial State
-        initial_state = WorkflowState(
-            original_request=request,
-            current_step="starting",
-            analysis_result={},
-            report_result={},
-            final_output="",
-            error=""
-        )
-        
         try:
             # Workflow ausführen
-            final_state = self.workflow.invoke(initial_state)
+            final_state = self.workflow.invoke(self._initial_state(request))
+            return final_state["final_output"]
+            
+        except Exception as e:
+            error_msg = f"❌ Kritischer Fehler im Orchestrator: {str(e)}"
+            print(error_msg)
+            return error_msg
+    
+    async def aprocess_request(self, request: str) -> str:
+        """
+        Async-Version von process_request: alle LLM-Aufrufe laufen über ainvoke und alle
+        Queries im DuckDB-Thread-Pool, sodass ein Event-Loop viele Workflows gleichzeitig bedient
+        """
+        print(f"🚀 Starte Multi-Agenten-Workflow für: {request[:50]}...")
+        
+        try:
+            final_state = await self.workflow.ainvoke(self._initial_state(request))
             return final_state["final_output"]
             
         except Exception as e:
             error_msg = f"❌ Kritischer Fehler im Orchestrator: {str(e)}"
             print(error_msg)
-            return error_msg 
\ No newline at end of file
+            return error_msg
+    
+    async def astream_request(self, request: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Wie aprocess_request, liefert aber laufend Ereignisse:
+        - {"type": "node_start" | "node_end", "node": ...} für jeden Knoten des Graphen
+        - {"type": "report_chunk", "content": ...} für jedes Token des Berichts
+        - {"type": "final", "output": ..., "error": ...} zum Abschluss
+
+        Solange jemand die Ereignisse abonniert, ruft LangChain das Modell auch bei ainvoke
+        über die Streaming-API auf; kommt der Bericht aus dem LLM-Cache, wird er als ein
+        einziger Chunk gemeldet.
+        """
+        print(f"🚀 Starte Multi-Agenten-Workflow für: {request[:50]}...")
+        
+        report_streamed = False
+        try:
+            async for event in self.workflow.astream_events(self._initial_state(request), version="v2"):
+                kind = event["event"]
+                node = event.get("metadata", {}).get("langgraph_node")
+                
+                if kind == "on_chat_model_stream" and node == "generate_report":
+                    content = event["data"]["chunk"].content
+                    if content:
+                        report_streamed = True
+                        yield {"type": "report_chunk", "content": content}
+                elif kind in ("on_chain_start", "on_chain_end") and node not in (None, START) and event["name"] == node:
+                    if kind == "on_chain_end" and node == "generate_report" and not report_streamed:
+                        report = event["data"].get("output", {}).get("report_result", {}).get("report")
+                        if report:
+                            yield {"type": "report_chunk", "content": report}
+                    yield {"type": "node_start" if kind == "on_chain_start" else "node_end", "node": node}
+                elif kind == "on_chain_end" and not event.get("parent_ids"):
+                    final_state = event["data"]["output"]
+                    yield {
+                        "type": "final",
+                        "output": final_state.get("final_output", ""),
+                        "error": final_state.get("error", "")
+                    }
+                    
+        except Exception as e:
+            error_msg = f"❌ Kritischer Fehler im Orchestrator: {str(e)}"
+            print(error_msg)
+            yield {"type": "final", "output": error_msg, "error": str(e)}
+    
+    @staticmethod
+    def _initial_state(request: str) -> WorkflowState:
+        return WorkflowState(
+            original_request=request,
+            current_step="starting",
+            classification="",
+            analysis_result={},
+            report_result={},
+            final_output="",
+            error=""
+        )
@@ -2,6 +2,7 @@
 """
 Test-Script für das LangGraph Multi-Agenten System
 """
+import glob
 import os
 import sys
 from tools.duckdb_tool import DuckDBQueryTool
@@ -21,6 +22,180 @@ def test_duckdb_tool():
     return "customer_count" in result
 
 
+def test_duckdb_catalog():
+    """Prüft, dass der Katalog CSV-Dateien nur einmal lädt und bei Änderungen neu lädt"""
+    print("🧪 Teste DuckDB-Katalog...")
+    import shutil
+    import tempfile
+    from tools.duckdb_catalog import DuckDBCatalog
+    
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        csv_path = os.path.join(tmp_dir, "products.csv")
+        shutil.copy("show_case_data/products.csv", csv_path)
+        catalog = DuckDBCatalog({"products": csv_path})
+        
+        first = catalog.query_df("SELECT COUNT(*) AS n FROM products")["n"][0]
+        fingerprint = catalog.loaded_tables()["products"]
+        catalog.query_df("SELECT COUNT(*) AS n FROM products")
+        assert catalog.loaded_tables()["products"] == fingerprint
+        
+        with open(csv_path) as f:
+            content = f.read().rstrip("\n")
+        with open(csv_path, "w") as f:
+            f.write(content + "\n999,Books,1.0,2.0\n")
+        second = catalog.query_df("SELECT COUNT(*) AS n FROM products")["n"][0]
+        assert second == first + 1
+        
+        print(f"✅ Katalog: {first} -> {second} Zeilen nach Dateiänderung")
+        
+        # Nur referenzierte Tabellen werden geladen
+        lazy_catalog = DuckDBCatalog()
+        lazy_catalog.query_df("SELECT COUNT(*) FROM customers")
+        assert list(lazy_catalog.loaded_tables()) == ["customers"]
+        return True
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_read_only_queries():
+    """Prüft, dass schreibende Statements abgelehnt werden und die Tabellen unverändert bleiben"""
+    print("🔒 Teste Schreibschutz...")
+    from tools.duckdb_catalog import DuckDBCatalog
+    from tools.query_cache import QueryResultCache
+    
+    catalog = DuckDBCatalog()
+    tool = DuckDBQueryTool(catalog=catalog, query_cache=QueryResultCache(max_entries=0))
+    count_query = "SELECT COUNT(*) AS n FROM orders WHERE order_status = 'paid'"
+    paid_orders = catalog.query_df(count_query)["n"][0]
+    
+    for statement in [
+        "DELETE FROM orders WHERE order_status = 'paid'",
+        "DROP TABLE products",
+        "SELECT 1; DROP TABLE products",
+        "EXPLAIN ANALYZE DELETE FROM orders",
+        "CREATE TABLE copy AS SELECT * FROM orders",
+    ]:
+        result = tool._run(statement)
+        assert "Nur lesende Queries sind erlaubt" in result, (statement, result)
+    
+    assert catalog.query_df(count_query)["n"][0] == paid_orders
+    assert "unit_cost,DOUBLE" in tool._run("DESCRIBE products")
+    assert "count_star()" in tool._run("WITH p AS (SELECT * FROM products) SELECT COUNT(*) FROM p")
+    print(f"✅ Schreibende Statements abgelehnt, {paid_orders} bezahlte Bestellungen unverändert")
+    return True
+
+
+def test_cursor_pool():
+    """Prüft die Obergrenze paralleler Cursor, die Pool-Statistik und das Laden je Tabelle"""
+    print("🏊 Teste Cursor-Pool...")
+    import threading
+    import time
+    import duckdb
+    from tools.duckdb_catalog import DuckDBCatalog
+    from tools.duckdb_pool import DuckDBCursorPool
+    
+    pool = DuckDBCursorPool(duckdb.connect(), size=2)
+    lock = threading.Lock()
+    active = []
+    peak = []
+    
+    def work(i):
+        with pool.cursor() as cur:
+            with lock:
+                active.append(i)
+                peak.append(len(active))
+            assert cur.execute("SELECT 42").fetchone()[0] == 42
+            time.sleep(0.05)
+            with lock:
+                active.remove(i)
+    
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    stats = pool.stats()
+    assert max(peak) == 2, peak
+    assert (stats["created"], stats["peak_in_use"], stats["acquisitions"]) == (2, 2, 6), stats
+    assert stats["in_use"] == 0 and stats["utilization"] == 0 and stats["waits"] >= 1, stats
+    
+    # Während eine Tabelle (langsam) neu geladen wird, laufen Queries auf anderen Tabellen weiter
+    catalog = DuckDBCatalog()
+    loading = threading.Event()
+    load_table = catalog._load_table
+    
+    def slow_load(table_name, file_path):
+        if table_name == "orders":
+            loading.set()
+            time.sleep(1.0)
+        load_table(table_name, file_path)
+    
+    catalog._load_table = slow_load
+    loader = threading.Thread(target=catalog.query_df, args=("SELECT COUNT(*) FROM orders",))
+    loader.start()
+    loading.wait()
+    started = time.perf_counter()
+    catalog.query_df("SELECT COUNT(*) FROM products")
+    elapsed = time.perf_counter() - started
+    loader.join()
+    assert elapsed < 0.5, elapsed
+    print(f"✅ Pool: {stats}, products in {elapsed:.2f}s trotz Neuladen von orders")
+    return True
+
+
+def test_bounded_fetch():
+    """Prüft Vorschau mit Zeilenzahl aus derselben Ausführung und das Streaming in Batches"""
+    print("🚰 Teste begrenztes Abrufen...")
+    from datetime import date
+    from tools.duckdb_catalog import DuckDBCatalog
+    from tools.query_cache import QueryResultCache
+    
+    catalog = DuckDBCatalog({}, pool_size=1)
+    columns, rows, total = catalog.query_preview("SELECT range AS n FROM range(25000) ORDER BY n DESC", 20)
+    assert columns == ["n"] and total == 25000 and len(rows) == 20 and rows[0] == (24999,)
+    assert catalog.query_preview("SELECT 1 AS n", 20)[1:] == ([(1,)], 1)
+    
+    # Eine Sequenz zeigt, wie oft die Query tatsächlich ausgeführt wurde
+    catalog.conn.execute("CREATE SEQUENCE probe")
+    columns, rows, total = catalog.query_preview("SELECT nextval('probe') AS v FROM range(100)", 10)
+    assert [row[0] for row in rows] == list(range(1, 11)) and total == 100
+    assert catalog.conn.execute("SELECT nextval('probe')").fetchone()[0] == 101
+    
+    # Vorschau, Zeilenzahl, Zusammenfassung und Profil des Tools aus einer einzigen Ausführung
+    tool = DuckDBQueryTool(catalog=catalog, query_cache=QueryResultCache(max_entries=0), profiling=True)
+    output = tool._run("SELECT nextval('probe') AS v, 'x' AS label FROM range(100)")
+    assert "v:int,label:str\n102,x" in output and "# 100 Zeilen" in output, output
+    assert "# v: sum=15150, min=102, max=201, avg=151.5" in output, output
+    assert catalog.conn.execute("SELECT nextval('probe')").fetchone()[0] == 202
+    summary = {}
+    catalog.query_preview("SELECT range AS n, NULL::INT AS e, CASE WHEN range % 2 = 0 THEN range END AS m FROM range(50)", 10,
+                          summary=summary)
+    assert summary == {"n": {"sum": 1225, "min": 0, "max": 49, "avg": 24.5},
+                       "m": {"sum": 600, "min": 0, "max": 48, "avg": 24.0}}, summary
+    # Gefilterte Queries liefern unvollständige Blöcke; Vorschau und Zählung verlieren keine Zeile
+    summary = {}
+    columns, rows, total = catalog.query_preview(
+        "SELECT range AS n, DATE '2025-10-01' + (range % 7)::INT AS d FROM range(1000000) WHERE range % 1000 < 7",
+        20, summary=summary
+    )
+    assert total == 7000 and rows[7] == (1000, date(2025, 10, 7)), (total, rows[7])
+    assert summary["n"]["sum"] == sum(n for n in range(1000000) if n % 1000 < 7), summary
+    assert catalog.pool.stats()["in_use"] == 0
+    
+    batches = list(catalog.stream_batches("SELECT range AS n FROM range(5000)"))
+    assert [len(batch) for batch in batches] == [2048, 2048, 904]
+    assert sum(int(batch["n"].sum()) for batch in batches) == sum(range(5000))
+    stream = catalog.stream_batches("SELECT range AS n FROM range(5000)")
+    next(stream)
+    assert catalog.pool.stats()["in_use"] == 1
+    stream.close()
+    assert catalog.pool.stats()["in_use"] == 0
+    print(f"✅ {total} Zeilen bei einer Ausführung gezählt, {len(batches)} Batches gestreamt")
+    return True
+
+
 def test_csv_files():
     """Überprüft ob alle CSV-Dateien vorhanden sind"""
     print("📁 Überprüfe CSV-Dateien...")
@@ -47,6 +222,966 @@ def test_csv_files():
         return True
 
 
+def test_paid_sales():
+    """Prüft, dass paid_sales den Roh-Joins entspricht und nach Änderungen einer Quelle neu aufgebaut wird"""
+    print("🧾 Teste Faktentabelle paid_sales...")
+    import shutil
+    import tempfile
+    from tools.duckdb_catalog import DuckDBCatalog
+    
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        csv_files = {}
+        for table_name in ["customers", "orders", "order_items", "products"]:
+            csv_files[table_name] = os.path.join(tmp_dir, f"{table_name}.csv")
+            shutil.copy(f"show_case_data/{table_name}.csv", csv_files[table_name])
+        catalog = DuckDBCatalog(csv_files)
+        
+        fact_query = """
+            SELECT acquisition_channel, category, COUNT(DISTINCT order_id) AS orders,
+                   SUM(line_revenue) AS revenue, SUM(line_cogs) AS cogs
+            FROM paid_sales GROUP BY ALL ORDER BY ALL
+        """
+        raw_query = """
+            SELECT c.acquisition_channel, p.category, COUNT(DISTINCT o.order_id) AS orders,
+                   SUM((oi.net_price + oi.tax_amount) * oi.quantity) AS revenue,
+                   SUM(p.unit_cost * oi.quantity) AS cogs
+            FROM order_items oi
+            JOIN orders o ON oi.order_id = o.order_id
+            LEFT JOIN products p ON oi.product_id = p.product_id
+            LEFT JOIN customers c ON o.customer_id = c.customer_id
+            WHERE o.order_status = 'paid'
+            GROUP BY ALL ORDER BY ALL
+        """
+        fact = catalog.query_df(fact_query)
+        raw = catalog.query_df(raw_query)
+        assert fact[["acquisition_channel", "category", "orders"]].equals(raw[["acquisition_channel", "category", "orders"]])
+        assert ((fact[["revenue", "cogs"]] - raw[["revenue", "cogs"]]).abs() < 1e-6).all().all()
+        
+        # Geänderte Einstandspreise (keine reine Anhängung) bauen paid_sales neu auf
+        cogs_before = catalog.query_df("SELECT SUM(line_cogs) AS cogs FROM paid_sales")["cogs"][0]
+        with open(csv_files["products"]) as f:
+            header, *rows = f.read().splitlines()
+        rows = [",".join(fields[:2] + [str(float(fields[2]) * 2)] + fields[3:]) for fields in (r.split(",") for r in rows)]
+        with open(csv_files["products"], "w") as f:
+            f.write("\n".join([header] + rows) + "\n")
+        cogs_after = catalog.query_df("SELECT SUM(line_cogs) AS cogs FROM paid_sales")["cogs"][0]
+        assert abs(cogs_after - 2 * cogs_before) < 1e-6, (cogs_before, cogs_after)
+        assert catalog._generations["products"] == 2
+        print(f"✅ paid_sales entspricht den Joins, COGS nach Preisänderung {cogs_before:.2f} -> {cogs_after:.2f}")
+        return True
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_incremental_append():
+    """Prüft, dass angehängte Zeilen inkrementell geladen und in paid_sales übernommen werden"""
+    print("🧪 Teste inkrementellen Ingest...")
+    import shutil
+    import tempfile
+    from tools.duckdb_catalog import DuckDBCatalog
+    
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        csv_files = {}
+        for table_name in ["customers", "orders", "order_items", "products"]:
+            csv_files[table_name] = os.path.join(tmp_dir, f"{table_name}.csv")
+            shutil.copy(f"show_case_data/{table_name}.csv", csv_files[table_name])
+        
+        catalog = DuckDBCatalog(csv_files)
+        catalog.query_df("SELECT COUNT(*) FROM paid_sales")
+        
+        with open(csv_files["orders"], "a") as f:
+            f.write("1201,5,2025-12-01,paid,PayPal,Mobile,DE\n")
+        with open(csv_files["order_items"], "a") as f:
+            f.write("\n3017,1201,3,2,10.0,0,10.0,1.9\n")
+        
+        incremental = catalog.query_df("SELECT * FROM paid_sales ORDER BY order_item_id")
+        assert catalog._generations["orders"] == 1 and catalog._generations["order_items"] == 1
+        
+        full = DuckDBCatalog(csv_files).query_df("SELECT * FROM paid_sales ORDER BY order_item_id")
+        assert incremental.equals(full)
+        
+        # Passen angehängte Werte nicht zu den Spaltentypen, wird die Tabelle vollständig neu geladen
+        orders_only = DuckDBCatalog({"orders": csv_files["orders"]})
+        orders_only.query_df("SELECT COUNT(*) FROM orders")
+        with open(csv_files["orders"], "a") as f:
+            f.write("A-2,5,2025-12-02,paid,PayPal,Mobile,DE\n")
+        query = "SELECT * FROM orders ORDER BY order_id"
+        reloaded = orders_only.query_df(query)
+        assert orders_only._generations["orders"] == 2 and "A-2" in set(reloaded["order_id"])
+        assert reloaded.equals(DuckDBCatalog({"orders": csv_files["orders"]}).query_df(query))
+        
+        print(f"✅ Inkrementell geladen: {len(incremental)} Zeilen in paid_sales")
+        return True
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_incremental_rollups():
+    """Prüft, dass angehängte Zeilen nur die betroffenen Tage von kpi_cube und kpi_channel_daily neu berechnen"""
+    print("🧪 Teste inkrementelle Rollups...")
+    import shutil
+    import tempfile
+    from config import CSV_FILES
+    from tools.duckdb_catalog import DuckDBCatalog
+    
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        csv_files = {}
+        for table_name, path in CSV_FILES.items():
+            csv_files[table_name] = os.path.join(tmp_dir, os.path.basename(path))
+            shutil.copy(path, csv_files[table_name])
+        
+        catalog = DuckDBCatalog(csv_files)
+        totals_query = "SELECT SUM(revenue) AS revenue, SUM(orders_primary) AS orders FROM kpi_cube"
+        before = catalog.query_df(totals_query)
+        untouched_query = "SELECT * FROM kpi_cube WHERE date = '2025-09-01' ORDER BY ALL"
+        untouched = catalog.query_df(untouched_query)
+        catalog.query_df("SELECT COUNT(*) FROM kpi_channel_daily")
+        
+        rebuilds = []
+        rebuild_rollup_keys = catalog._rebuild_rollup_keys
+        
+        def record_rebuild(table_name, *args):
+            rebuilds.append((table_name, rebuild_rollup_keys(table_name, *args)))
+            return rebuilds[-1][1]
+        
+        catalog._rebuild_rollup_keys = record_rebuild
+        
+        # Neue Bestellung sowie eine weitere Position einer bestehenden bezahlten Bestellung
+        paid_order = catalog.query_df(
+            "SELECT MIN(order_id) AS order_id FROM orders WHERE order_status = 'paid' AND order_date <> '2025-09-01'"
+        )["order_id"][0]
+        with open(csv_files["orders"], "a") as f:
+            f.write("1201,5,2025-10-05,paid,PayPal,Mobile,DE\n")
+        with open(csv_files["order_items"], "a") as f:
+            f.write(f"\n3017,1201,3,2,10.0,0,10.0,1.9\n3018,{paid_order},4,1,20.0,0,20.0,3.8\n")
+        with open(csv_files["web_analytics_daily"], "a") as f:
+            f.write("2025-10-05,Email,1,23.8,10,8\n")
+        
+        after = catalog.query_df(totals_query)
+        channel_daily = catalog.query_df("SELECT * FROM kpi_channel_daily ORDER BY ALL")
+        assert sorted(rebuilds) == [("kpi_channel_daily", True), ("kpi_cube", True)], rebuilds
+        assert abs(after["revenue"][0] - before["revenue"][0] - (2 * 11.9 + 23.8)) < 1e-6
+        assert after["orders"][0] == before["orders"][0] + 1
+        assert catalog.query_df(untouched_query).equals(untouched)
+        
+        full = DuckDBCatalog(csv_files)
+        for table_name, result in [("kpi_cube", catalog.query_df("SELECT * FROM kpi_cube ORDER BY ALL")),
+                                   ("kpi_channel_daily", channel_daily)]:
+            expected = full.query_df(f"SELECT * FROM {table_name} ORDER BY ALL")
+            assert list(result.columns) == list(expected.columns) and len(result) == len(expected), table_name
+            for column in result.columns:
+                if result[column].dtype.kind == "f":
+                    assert (result[column] - expected[column]).abs().max() < 1e-6, (table_name, column)
+                else:
+                    assert result[column].equals(expected[column]), (table_name, column)
+        
+        print(f"✅ Cube-Umsatz {before['revenue'][0]:.2f} -> {after['revenue'][0]:.2f} ohne vollständigen Neuaufbau")
+        return True
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_parquet_cache():
+    """Prüft Wiederverwendung, Neukonvertierung und getrennte Verzeichnisse je Quelldatei"""
+    print("📦 Teste Parquet-Cache...")
+    import shutil
+    import tempfile
+    import duckdb
+    from tools.parquet_cache import ParquetCache
+    
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        cache = ParquetCache(os.path.join(tmp_dir, "cache"))
+        conn = duckdb.connect()
+        sources = []
+        for dataset in ("a", "b"):
+            os.makedirs(os.path.join(tmp_dir, dataset))
+            sources.append(os.path.join(tmp_dir, dataset, "products.csv"))
+            shutil.copy("show_case_data/products.csv", sources[-1])
+        
+        first = cache.ensure(conn, "products", sources[0])
+        mtime = os.stat(first).st_mtime_ns
+        assert cache.ensure(conn, "products", sources[0]) == first
+        assert os.stat(first).st_mtime_ns == mtime, "Unveränderte CSV darf nicht neu konvertiert werden"
+        
+        # Gleicher Tabellenname aus einem anderen Datenbestand: eigene Datei, die erste bleibt erhalten
+        other = cache.ensure(conn, "products", sources[1])
+        assert other != first and os.path.exists(first)
+        
+        with open(sources[0]) as f:
+            content = f.read().rstrip("\n")
+        with open(sources[0], "w") as f:
+            f.write(content + "\n999,Books,1.0,2.0\n")
+        changed = cache.ensure(conn, "products", sources[0])
+        assert changed != first and not os.path.exists(first) and os.path.exists(other)
+        assert conn.execute(f"SELECT COUNT(*) FROM '{changed}'").fetchone()[0] == \
+            conn.execute(f"SELECT COUNT(*) FROM '{other}'").fetchone()[0] + 1
+        print(f"✅ Parquet-Cache: {len(glob.glob(os.path.join(tmp_dir, 'cache', '*', '*.parquet')))} Dateien in getrennten Verzeichnissen")
+        return True
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_date_partitioning():
+    """Prüft, dass die nach Jahr/Monat partitionierten Views dieselben Ergebnisse liefern"""
+    print("🗂️ Teste Datumspartitionierung...")
+    import shutil
+    import tempfile
+    from tools.duckdb_catalog import DuckDBCatalog
+    from tools.parquet_cache import ParquetCache
+    
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        partitioned = DuckDBCatalog(use_date_partitioning=True, parquet_cache=ParquetCache(tmp_dir))
+        query = """
+            SELECT channel, SUM(revenue) AS revenue, (SELECT COUNT(*) FROM orders WHERE order_date >= '2025-10-01') AS orders
+            FROM web_analytics_daily WHERE date BETWEEN '2025-09-01' AND '2025-09-30'
+            GROUP BY channel ORDER BY channel
+        """
+        result = partitioned.query_df(query)
+        assert result.equals(DuckDBCatalog().query_df(query))
+        assert partitioned.query_df("SELECT * FROM paid_sales").shape == DuckDBCatalog().query_df("SELECT * FROM paid_sales").shape
+        
+        months = glob.glob(os.path.join(tmp_dir, "*", "orders-*.partitioned", "year=*", "month=*"))
+        assert months, "Keine Partitionen für orders geschrieben"
+        print(f"✅ {len(months)} Monatspartitionen für orders, Ergebnisse identisch")
+        return True
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_data_generator():
+    """Prüft Schema, Determinismus und referentielle Integrität der synthetischen Daten"""
+    print("🏭 Teste Datengenerator...")
+    import filecmp
+    import shutil
+    import tempfile
+    from config import CSV_FILES
+    from tools.duckdb_catalog import DuckDBCatalog
+    from utils.data_generator import SyntheticDataGenerator, main as generate_main
+    
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        # Kleine Blockgröße, damit mehrere Blöcke geschrieben werden
+        counts = SyntheticDataGenerator(scale=0.05, chunk_size=20).generate(os.path.join(tmp_dir, "a"))
+        generate_main(["--scale", "0.05", "--chunk-size", "20", "--output", os.path.join(tmp_dir, "b")])
+        
+        names = [os.path.basename(path) for path in CSV_FILES.values()]
+        _, mismatch, errors = filecmp.cmpfiles(os.path.join(tmp_dir, "a"), os.path.join(tmp_dir, "b"), names, shallow=False)
+        assert not mismatch and not errors, "Gleicher Seed muss identische Daten erzeugen"
+        
+        generated = DuckDBCatalog({name: os.path.join(tmp_dir, "a", os.path.basename(path)) for name, path in CSV_FILES.items()})
+        original = DuckDBCatalog()
+        for table_name in CSV_FILES:
+            schema = f"SELECT column_name, column_type FROM (DESCRIBE {table_name})"
+            assert generated.query_df(schema).equals(original.query_df(schema)), table_name
+            assert generated.query_df(f"SELECT COUNT(*) AS n FROM {table_name}")["n"][0] == counts[table_name], table_name
+        
+        orphans = generated.query_df("""
+            SELECT
+                (SELECT COUNT(*) FROM orders o LEFT JOIN customers c USING (customer_id)
+                 WHERE c.customer_id IS NULL OR o.order_date < c.signup_date) AS orders,
+                (SELECT COUNT(*) FROM order_items oi LEFT JOIN orders o USING (order_id) WHERE o.order_id IS NULL) +
+                (SELECT COUNT(*) FROM order_items oi LEFT JOIN products p USING (product_id) WHERE p.product_id IS NULL) AS items
+        """)
+        assert orphans["orders"][0] == 0 and orphans["items"][0] == 0, orphans
+        
+        # web_analytics_daily aggregiert die bezahlten Bestellungen
+        totals = generated.query_df("""
+            SELECT (SELECT SUM(transactions) FROM web_analytics_daily) AS transactions,
+                   (SELECT COUNT(*) FROM orders WHERE order_status = 'paid') AS paid_orders
+        """)
+        assert totals["transactions"][0] == totals["paid_orders"][0], totals
+        print(f"✅ {counts['orders']} Bestellungen, {counts['order_items']} Positionen im show_case_data-Schema")
+        return True
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_benchmark():
+    """Smoke-Test des Benchmarks auf einem kleinen erzeugten Datensatz"""
+    print("⏱️ Teste Benchmark...")
+    import json
+    import shutil
+    import tempfile
+    import benchmark
+    
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        data_dir = benchmark.ensure_dataset(0.05, tmp_dir, 7)
+        mtime = os.stat(os.path.join(data_dir, "orders.csv")).st_mtime_ns
+        assert benchmark.ensure_dataset(0.05, tmp_dir, 7) == data_dir
+        assert os.stat(os.path.join(data_dir, "orders.csv")).st_mtime_ns == mtime, "Vorhandener Datensatz darf nicht neu erzeugt werden"
+        
+        result = benchmark.run_scale(0.05, data_dir, runs=2, use_parquet=True)
+        assert result["rows"]["orders"] == 60 and result["rows"]["order_items"] >= 60, result["rows"]
+        assert set(result["queries"]) == set(benchmark.benchmark_queries())
+        for query_name, stats in result["queries"].items():
+            assert stats["error"] is None, (query_name, stats["error"])
+            assert 0 < stats["warm"]["min_ms"] <= stats["warm"]["p50_ms"] <= stats["warm"]["max_ms"], stats
+        
+        baseline_path = os.path.join(tmp_dir, "baseline.json")
+        with open(baseline_path, "w") as f:
+            json.dump({"git_commit": None, "results": [result]}, f)
+        benchmark.compare({"results": [result]}, baseline_path)
+        print(f"✅ {len(result['queries'])} Queries gemessen, Peak-RSS {result['peak_rss_mb']} MB")
+        return True
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_kpi_cube():
+    """Prüft, dass Cube-Abfragen dieselben Kennzahlen liefern wie paid_sales"""
+    print("🧊 Teste KPI-Cube...")
+    from tools.duckdb_catalog import DuckDBCatalog
+    from tools import kpi_cube
+    
+    catalog = DuckDBCatalog()
+    measures = list(kpi_cube.CUBE_MEASURES)
+    for dimensions in [(), ("acquisition_channel",), ("category", "country"), ("date",)]:
+        filters = {"country": ["DE", "AT"]}
+        query = kpi_cube.rollup_query(measures, dimensions, filters, ("2025-09-01", "2025-10-31"))
+        assert "FROM kpi_cube" in query
+        raw_query = kpi_cube.rollup_query(measures, dimensions, dict(filters, device=["Mobile", "Desktop", "Tablet"]),
+                                          ("2025-09-01", "2025-10-31"))
+        assert "FROM paid_sales" in raw_query
+        
+        cube_result = catalog.query_df(query)
+        raw_result = catalog.query_df(raw_query)
+        assert list(cube_result["orders"]) == list(raw_result["orders"]), dimensions
+        assert (cube_result["revenue"] - raw_result["revenue"]).abs().max() < 1e-6, dimensions
+    
+    # Nach einer Kategorie gefiltert zählt jede Bestellung mit dieser Kategorie, nicht nur die Primärkategorie
+    all_devices = {"device": ["Mobile", "Desktop", "Tablet"]}
+    for dimensions, filters in [((), {"category": "Books"}), (("country",), {"category": ["Home"]}),
+                                (("date",), {"category": "Books", "country": "DE"})]:
+        query = kpi_cube.rollup_query(["orders", "revenue"], dimensions, filters)
+        assert "FROM kpi_cube" in query and "orders_primary" not in query, query
+        cube_result = catalog.query_df(query)
+        raw_result = catalog.query_df(kpi_cube.rollup_query(["orders", "revenue"], dimensions, dict(filters, **all_devices)))
+        assert list(cube_result["orders"]) == list(raw_result["orders"]), filters
+        assert (cube_result["revenue"] - raw_result["revenue"]).abs().max() < 1e-6, filters
+    
+    # Mehrere Kategorien lassen sich im Cube nicht ohne Doppelzählung zusammenfassen
+    query = kpi_cube.rollup_query(["orders"], [], {"category": ["Books", "Home"]})
+    assert "FROM paid_sales" in query, query
+    expected = catalog.query_df(
+        "SELECT COUNT(DISTINCT order_id) AS orders FROM paid_sales WHERE category IN ('Books', 'Home')"
+    )
+    assert list(catalog.query_df(query)["orders"]) == list(expected["orders"])
+    
+    print("✅ Cube und Rohdaten liefern identische Kennzahlen")
+    return True
+
+
+def test_kpi_batch():
+    """Prüft, dass die aufgeteilte Batch-Query dieselben Ergebnisse liefert wie die Einzel-Queries"""
+    print("📦 Teste KPI-Batch...")
+    from agents.data_analyst_agent import DataAnalystAgent, KPI_REPORTS
+    
+    batched = DataAnalystAgent(batch_kpis=True)
+    single = DataAnalystAgent(batch_kpis=False)
+    for reports in [list(KPI_REPORTS), ["revenue", "gross_margin"], ["marketing_by_channel"], ["aov", "orders_by_channel"]]:
+        batch_results = batched._run_kpi_queries(reports)
+        single_results = single._run_kpi_queries(reports)
+        assert list(batch_results) == reports
+        assert batch_results == single_results, (reports, batch_results, single_results)
+    print(f"✅ {len(KPI_REPORTS)} Auswertungen aus einem Scan identisch zu den Einzel-Queries")
+    return True
+
+
+def test_kpi_registry():
+    """Prüft, dass der KPI-Compiler Basiskennzahlen teilt und ungültige Dimensionen ablehnt"""
+    print("📐 Teste KPI-Register...")
+    from tools.duckdb_catalog import DuckDBCatalog
+    from tools.kpi_registry import KPI_REGISTRY, compile_kpis
+    
+    query = compile_kpis(["revenue", "aov", "roas", "gross_margin_percent"], ["acquisition_channel"])
+    assert query.count("SUM(revenue) AS revenue") == 1 and query.count("FROM kpi_cube") == 1
+    # ROAS liest den Umsatz im Zeitraum der Spend-Daten aus demselben Scan
+    assert query.count("SUM(revenue) FILTER") == 1
+    
+    try:
+        compile_kpis(["roas"], ["category"])
+        assert False, "ROAS darf nicht nach Kategorie gruppiert werden"
+    except ValueError:
+        pass
+    
+    # KPI-Filter werden als FILTER-Klausel in dieselbe Query übernommen
+    registry = dict(KPI_REGISTRY, paid_search_revenue={
+        "label": "Paid Search Revenue", "description": "Revenue aus Paid Search",
+        "measure": "{revenue}", "filters": {"acquisition_channel": "Paid Search"},
+        "dimensions": ["date", "country"],
+    })
+    catalog = DuckDBCatalog()
+    result = catalog.query_df(compile_kpis(["revenue", "paid_search_revenue"], ["country"], registry=registry))
+    expected = catalog.query_df("""
+        SELECT country, SUM(line_revenue) AS revenue FROM paid_sales
+        WHERE acquisition_channel = 'Paid Search' GROUP BY country ORDER BY country
+    """)
+    assert (result["paid_search_revenue"] - expected["revenue"]).abs().max() < 1e-6
+    assert (result["revenue"] > result["paid_search_revenue"]).all()
+    
+    # Nach Kategorie gefiltert zählen alle Bestellungen mit Artikeln dieser Kategorie
+    result = catalog.query_df(compile_kpis(["aov", "orders"], ["country"], {"category": "Books"}))
+    expected = catalog.query_df("""
+        SELECT country, SUM(line_revenue) / COUNT(DISTINCT order_id) AS aov, COUNT(DISTINCT order_id) AS orders
+        FROM paid_sales WHERE category = 'Books' GROUP BY country ORDER BY country
+    """)
+    assert list(result["orders"]) == list(expected["orders"]), result
+    assert (result["aov"] - expected["aov"]).abs().max() < 1e-6, result
+    
+    # ROAS und CAC nur über den Zeitraum, für den Spend-Daten vorliegen
+    result = catalog.query_df(compile_kpis(["roas", "cac"], ["acquisition_channel"]))
+    paid_search = result[result["acquisition_channel"] == "Paid Search"].iloc[0]
+    expected = catalog.query_df("""
+        WITH spend_window AS (SELECT MIN(date) AS first_day, MAX(date) AS last_day FROM marketing_spend),
+        spend AS (SELECT SUM(spend) AS spend FROM marketing_spend WHERE channel = 'Paid Search'),
+        revenue AS (
+            SELECT SUM(line_revenue) AS revenue FROM paid_sales, spend_window
+            WHERE acquisition_channel = 'Paid Search' AND order_date BETWEEN first_day AND last_day
+        ),
+        new_customers AS (
+            SELECT COUNT(*) AS new_customers FROM customers, spend_window
+            WHERE acquisition_channel = 'Paid Search' AND signup_date BETWEEN first_day AND last_day
+        )
+        SELECT revenue / spend AS roas, spend / new_customers AS cac FROM spend, revenue, new_customers
+    """).iloc[0]
+    assert abs(paid_search["roas"] - expected["roas"]) < 1e-9, (paid_search, expected)
+    assert abs(paid_search["cac"] - expected["cac"]) < 1e-6, (paid_search, expected)
+    
+    print(f"✅ {len(KPI_REGISTRY)} KPIs im Register, Basiskennzahlen werden geteilt")
+    return True
+
+
+def test_query_metrics():
+    """Prüft die Metriken je Query, ihre Zuordnung zum Workflow und das Query-Profil"""
+    print("📈 Teste Query-Metriken...")
+    from tools.duckdb_catalog import DuckDBCatalog
+    from tools.duckdb_tool import DuckDBQueryTool
+    from tools.query_cache import QueryResultCache
+    from tools.query_metrics import current_workflow_id, get_metrics_store
+    
+    tool = DuckDBQueryTool(catalog=DuckDBCatalog(), query_cache=QueryResultCache())
+    query = "SELECT order_status, COUNT(*) AS n FROM orders GROUP BY order_status ORDER BY order_status"
+    token = current_workflow_id.set("test-metrics")
+    try:
+        tool._run(query)
+        tool._run(query)
+        tool._run("SELECT * FROM unbekannte_tabelle")
+    finally:
+        current_workflow_id.reset(token)
+    
+    first, cached, failed = get_metrics_store().query("test-metrics")
+    assert first["tables"] == ["orders"] and not first["cache_hit"] and first["rows_returned"] == 4, first
+    assert first["total_ms"] >= first["execute_ms"] > 0 and first["error"] is None, first
+    assert cached["cache_hit"] and cached["execute_ms"] == 0, cached
+    assert failed["error"] and "unbekannte_tabelle" in failed["error"], failed
+    summary = get_metrics_store().summary("test-metrics")
+    assert (summary["queries"], summary["cache_hits"], summary["errors"]) == (3, 1, 1), summary
+    assert get_metrics_store().query("anderer-workflow") == []
+    
+    # Profil aus derselben Ausführung, für formatierte Ergebnisse und DataFrames
+    orders = tool.query_df("SELECT COUNT(*) AS n FROM orders")["n"][0]
+    profiled = DuckDBQueryTool(catalog=DuckDBCatalog(), query_cache=QueryResultCache(max_entries=0), profiling=True)
+    token = current_workflow_id.set("test-profile")
+    try:
+        profiled._run(query)
+        profiled.query_df(query)
+    finally:
+        current_workflow_id.reset(token)
+    for metrics in get_metrics_store().query("test-profile"):
+        assert metrics["profile"] is not None and metrics["rows_scanned"] == orders, metrics["rows_scanned"]
+    assert get_metrics_store().query("test-profile")[0]["result_tokens"] > 0
+    
+    # Ohne Metriken-Speicher werden auch keine Tokens gezählt
+    from tools import duckdb_tool, query_metrics
+    store, counter = query_metrics._metrics_store, duckdb_tool.count_tokens
+    query_metrics._metrics_store = query_metrics.QueryMetricsStore(max_records=0)
+    duckdb_tool.count_tokens = None
+    try:
+        assert "order_status:str,n:int" in profiled._run(query)
+        assert query_metrics.get_metrics_store().query() == []
+    finally:
+        query_metrics._metrics_store, duckdb_tool.count_tokens = store, counter
+    print(f"✅ Metriken: {summary}")
+    return True
+
+
+def test_compact_results():
+    """Prüft die kompakte Ergebnis-Serialisierung und den Token-Zähler"""
+    print("🗜️ Teste kompakte Ergebnisse...")
+    import datetime
+    import pandas as pd
+    import threading
+    import time
+    from tools.result_format import compact_frame, compact_table
+    from utils import token_counter
+    from utils.token_counter import count_tokens
+    
+    text = compact_table(
+        ["channel", "orders", "revenue", "rate", "day"],
+        [("Paid, Search", 12, 1234.5678, 0.000529, datetime.date(2025, 10, 1)), ("Email", 3, 20.0, None, None)]
+    )
+    assert text.splitlines() == [
+        "channel:str,orders:int,revenue:float,rate:float,day:date",
+        '"Paid, Search",12,1234.57,0.000529,2025-10-01',
+        "Email,3,20,,",
+    ], text
+    
+    frame = pd.DataFrame({"channel": list("abcdef"), "revenue": [1.0, 6.0, 3.0, 2.0, 5.0, 4.0]})
+    top = compact_frame(frame, top_k=2, sort_by="revenue")
+    assert top.splitlines()[1:3] == ["b,6", "e,5"]
+    assert "# 6 Zeilen, erste 2 gezeigt" in top and "# revenue: sum=21, min=1, max=6, avg=3.5" in top
+    
+    assert 0 < count_tokens(text) < len(text)
+    
+    # Solange der Tokenizer lädt (z.B. Download), wird geschätzt statt gewartet
+    loaded = threading.Event()
+    load = token_counter._load_encoding
+    token_counter._load_encoding = lambda model: (loaded.wait(5), load(model))
+    try:
+        started = time.perf_counter()
+        assert count_tokens(text, model="test-model") == -(-len(text) // token_counter.CHARS_PER_TOKEN)
+        assert time.perf_counter() - started < 1
+    finally:
+        loaded.set()
+        token_counter._load_encoding = load
+    token_counter.load_encoding("test-model", wait=True)
+    print(f"✅ Kompaktes Ergebnis mit {count_tokens(text)} Tokens")
+    return True
+
+
+def test_query_cache():
+    """Prüft Normalisierung, LRU-Verdrängung und Trefferzählung des Ergebnis-Caches"""
+    print("🧪 Teste Query-Cache...")
+    from tools.query_cache import QueryResultCache
+    
+    cache = QueryResultCache(max_entries=2, ttl_seconds=0)
+    key = cache.make_key("SELECT  *\nFROM orders WHERE order_status = 'paid';", ("v1",))
+    assert key == cache.make_key("select * from orders where order_status = 'paid'", ("v1",))
+    assert key != cache.make_key("select * from orders where order_status = 'PAID'", ("v1",))
+    assert key != cache.make_key("select * from orders where order_status = 'paid'", ("v2",))
+    # Aliase bestimmen die Spaltennamen des Ergebnisses und behalten ihre Schreibweise
+    assert cache.make_key('SELECT 1 AS "Revenue"', ("v1",)) != cache.make_key('SELECT 1 AS "revenue"', ("v1",))
+    assert cache.make_key("SELECT 1 Revenue", ("v1",)) != cache.make_key("SELECT 1 revenue", ("v1",))
+    assert cache.make_key('SELECT 1 AS "Rev ""Q""  x"', ("v1",))[0] == 'select 1 as "Rev ""Q""  x"'
+    
+    cache.put(key, "a")
+    cache.put("b", "b")
+    assert cache.get(key) == "a"
+    cache.put("c", "c")  # verdrängt "b" als ältesten ungenutzten Eintrag
+    assert cache.get("b") is None
+    assert cache.get(key) == "a"
+    
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (2, 1, 1)
+    print(f"✅ Cache-Statistik: {stats}")
+    return True
+
+
+def test_query_timeout():
+    """Prüft, dass eine zu lange Query abgebrochen wird und der Cursor danach wieder nutzbar ist"""
+    print("⏱️ Teste Query-Zeitlimit...")
+    from tools.duckdb_catalog import DuckDBCatalog
+    from tools.duckdb_tool import DuckDBQueryTool
+    from tools.query_cache import QueryResultCache
+    
+    catalog = DuckDBCatalog({}, pool_size=1, memory_limit="512MB", threads=2)
+    assert catalog.conn.execute("SELECT current_setting('threads')").fetchone()[0] == 2
+    tool = DuckDBQueryTool(catalog=catalog, query_cache=QueryResultCache(max_entries=0), query_timeout=0.2)
+    
+    # Unbeabsichtigter Cross Join, der ohne Zeitlimit minutenlang laufen würde
+    result = tool._run("SELECT SUM(a.range * b.range) FROM range(1000000000) a, range(1000) b")
+    assert "Zeitlimit von 0.2 Sekunden überschritten" in result, result
+    assert tool._run("SELECT 42 AS answer").strip().endswith("42")
+    print(f"✅ {result}")
+    return True
+
+
+def test_query_cancellation():
+    """Prüft, dass ein gecancelter _arun-Aufruf die Query abbricht und den Cursor zurückgibt"""
+    print("🛑 Teste Abbruch asynchroner Queries...")
+    import asyncio
+    import time
+    from tools.duckdb_catalog import DuckDBCatalog
+    from tools.duckdb_tool import DuckDBQueryTool
+    from tools.query_cache import QueryResultCache
+    from tools.query_metrics import get_metrics_store
+    
+    catalog = DuckDBCatalog({}, pool_size=1)
+    tool = DuckDBQueryTool(catalog=catalog, query_cache=QueryResultCache(max_entries=0), query_timeout=0)
+    slow_query = "SELECT SUM(a.range * b.range) AS total FROM range(1000000000) a, range(1000) b"
+    
+    async def cancel_slow_query():
+        task = asyncio.create_task(tool._arun(slow_query))
+        await asyncio.sleep(0.3)
+        assert catalog.pool.stats()["in_use"] == 1
+        started = time.perf_counter()
+        task.cancel()
+        try:
+            await task
+            assert False, "Task hätte abgebrochen werden müssen"
+        except asyncio.CancelledError:
+            pass
+        return time.perf_counter() - started
+    
+    elapsed = asyncio.run(cancel_slow_query())
+    stats = catalog.pool.stats()
+    assert stats["in_use"] == 0 and stats["created"] == 1, stats
+    record = [r for r in get_metrics_store().query() if r["query"] == slow_query][-1]
+    assert "Interrupted" in record["error"], record
+    # Der zurückgegebene Cursor ist sofort wieder nutzbar
+    assert asyncio.run(tool._arun("SELECT 42 AS answer")).strip().endswith("42")
+    
+    # Scheitert die erste LLM-Antwort, werden die parallel laufenden KPI-Queries abgebrochen
+    from agents.data_analyst_agent import DataAnalystAgent
+    
+    class FailingLLM:
+        async def ainvoke(self, messages):
+            await asyncio.sleep(0.3)
+            raise RuntimeError("LLM nicht erreichbar")
+    
+    class SlowTool:
+        async def aquery_df(self, query):
+            return await tool.aquery_df(slow_query)
+    
+    agent = DataAnalystAgent(batch_kpis=True)
+    agent.llm = FailingLLM()
+    agent.duckdb_tool = SlowTool()
+    
+    async def analyze_with_failing_llm():
+        try:
+            await agent._aanalyze_with_tools([], DataAnalystAgent.plan_queries("Wie hoch ist der Umsatz?"))
+            assert False, "Der LLM-Fehler hätte weitergegeben werden müssen"
+        except RuntimeError:
+            # Noch im selben Event-Loop: die Query darf nicht weiterlaufen
+            return catalog.pool.stats()["in_use"]
+    
+    assert asyncio.run(analyze_with_failing_llm()) == 0
+    print(f"✅ Query nach {elapsed:.2f}s abgebrochen, Pool wieder frei: {catalog.pool.stats()}")
+    return True
+
+
+def test_llm_clients():
+    """Prüft, dass alle Agenten-Rollen einen gemeinsamen HTTP-Verbindungspool nutzen"""
+    print("🔌 Teste LLM-Clients...")
+    import asyncio
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from agents.llm_client import get_llm, get_http_client, get_async_http_client
+    from config import LLM_ROLES
+    
+    analyst = get_llm("analyst")
+    report = get_llm("report")
+    assert get_llm("analyst") is analyst
+    assert report.temperature == LLM_ROLES["report"]["temperature"]
+    assert analyst.root_client._client is report.root_client._client is get_http_client()
+    assert analyst.root_async_client._client is report.root_async_client._client is get_async_http_client()
+    try:
+        get_llm("unbekannt")
+        return False
+    except ValueError:
+        pass
+    
+    # Keep-Alive-Verbindungen eines beendeten Event-Loops dürfen nicht wiederverwendet werden
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"ok")
+        
+        def log_message(self, *args):
+            pass
+    
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        async def request():
+            client = get_async_http_client()
+            response = await client.get(f"http://127.0.0.1:{server.server_port}/")
+            return response.text, client.loop_client()
+        
+        first_text, first_client = asyncio.run(request())
+        second_text, second_client = asyncio.run(request())
+        assert first_text == second_text == "ok" and first_client is not second_client
+    finally:
+        server.shutdown()
+        server.server_close()
+    print(f"✅ {len(LLM_ROLES)} Rollen teilen sich einen Verbindungspool (async je Event-Loop)")
+    return True
+
+
+def test_llm_cache():
+    """Prüft Treffer, Verdrängung und Persistenz des LLM-Antwort-Caches"""
+    print("💾 Teste LLM-Antwort-Cache...")
+    import tempfile
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from agents.llm_cache import LLMResponseCache
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "llm_cache.sqlite")
+        cache = LLMResponseCache(path, max_entries=2, ttl_seconds=0)
+        llm = FakeListChatModel(responses=["a", "b", "c"], cache=cache)
+        assert llm.invoke("Umsatz?").content == "a"
+        assert llm.invoke("Umsatz?").content == "a"
+        assert llm.invoke("AOV?").content == "b"
+        assert llm.invoke("CAC?").content == "c"
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"], stats["evictions"], stats["entries"]) == (1, 3, 1, 2), stats
+        
+        # Neuer Prozess bzw. neue Instanz: Antworten kommen von der Platte
+        restored = FakeListChatModel(responses=["a", "b", "c"], cache=LLMResponseCache(path, max_entries=2, ttl_seconds=0))
+        assert restored.invoke("CAC?").content == "c"
+        # Andere Modellparameter ergeben einen anderen Schlüssel
+        assert FakeListChatModel(responses=["y"], cache=cache).invoke("AOV?").content == "y"
+    print(f"✅ Trefferquote {cache.stats()['hit_rate']:.0%}")
+    return True
+
+
+class _ScriptedLLM:
+    """Test-Double für Chat-Modelle: antwortet nach `delay` Sekunden mit festem Text"""
+    
+    def __init__(self, content: str, delay: float = 0.0):
+        self.content = content
+        self.delay = delay
+        self.calls = []
+    
+    def invoke(self, messages):
+        from langchain_core.messages import AIMessage
+        import time
+        self.calls.append(messages)
+        time.sleep(self.delay)
+        return AIMessage(content=self.content)
+    
+    async def ainvoke(self, messages):
+        from langchain_core.messages import AIMessage
+        import asyncio
+        self.calls.append(messages)
+        await asyncio.sleep(self.delay)
+        return AIMessage(content=self.content)
+
+
+def test_parallel_workflow():
+    """Prüft, dass Klassifizierung und Analyse parallel laufen und der Bericht beide nutzt"""
+    print("🔀 Teste parallelen Workflow...")
+    import time
+    from orchestrator import MultiAgentOrchestrator
+    
+    orchestrator = MultiAgentOrchestrator()
+    orchestrator.llm = _ScriptedLLM("Umsatzanalyse nach Kanal", delay=0.4)
+    orchestrator.data_analyst.llm = _ScriptedLLM("Analyse", delay=0.2)
+    orchestrator.report_generator.llm = report_llm = _ScriptedLLM("Bericht")
+    
+    start = time.perf_counter()
+    output = orchestrator.process_request("Wie entwickelt sich der Umsatz nach Kanal?")
+    elapsed = time.perf_counter() - start
+    
+    assert "## 📝 Executive Report\nBericht" in output, output
+    assert "Umsatzanalyse nach Kanal" in report_llm.calls[0][-1].content
+    # Seriell wären es mindestens 0,8 s (Klassifizierung + zwei Analyse-Aufrufe)
+    assert elapsed < 0.75, elapsed
+    print(f"✅ Workflow in {elapsed:.2f}s")
+    return True
+
+
+def test_async_workflow():
+    """Prüft, dass mehrere Workflows über aprocess_request gleichzeitig auf einem Event-Loop laufen"""
+    print("⚡ Teste asynchronen Workflow...")
+    import asyncio
+    import time
+    from orchestrator import MultiAgentOrchestrator
+    
+    orchestrator = MultiAgentOrchestrator()
+    orchestrator.llm = _ScriptedLLM("Umsatzanalyse", delay=0.2)
+    orchestrator.data_analyst.llm = _ScriptedLLM("Analyse", delay=0.2)
+    orchestrator.report_generator.llm = _ScriptedLLM("Bericht", delay=0.2)
+    
+    async def run_workflows():
+        return await asyncio.gather(*(
+            orchestrator.aprocess_request(f"Umsatz nach Kanal ({i})") for i in range(4)
+        ))
+    
+    start = time.perf_counter()
+    outputs = asyncio.run(run_workflows())
+    elapsed = time.perf_counter() - start
+    
+    assert all("## 📝 Executive Report\nBericht" in output for output in outputs), outputs
+    # Ein Workflow braucht mindestens 0,6 s (Analyse und Bericht nacheinander); vier
+    # blockierende Workflows bräuchten nacheinander 2,4 s
+    assert elapsed < 1.5, elapsed
+    print(f"✅ {len(outputs)} Workflows in {elapsed:.2f}s")
+    return True
+
+
+def test_report_streaming():
+    """Prüft die Ereignisse von astream_request inkl. Berichts-Tokens und Cache-Treffer"""
+    print("📡 Teste Berichts-Streaming...")
+    import asyncio
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from agents.llm_cache import LLMResponseCache
+    from orchestrator import MultiAgentOrchestrator
+    
+    orchestrator = MultiAgentOrchestrator()
+    orchestrator.llm = FakeListChatModel(responses=["Umsatzanalyse"])
+    orchestrator.data_analyst.llm = FakeListChatModel(responses=["Plan", "Analyse"])
+    orchestrator.report_generator.llm = FakeListChatModel(
+        responses=["Umsatz stieg um 5%"], cache=LLMResponseCache(":memory:")
+    )
+    
+    async def collect():
+        return [event async for event in orchestrator.astream_request("Wie entwickelt sich der Umsatz?")]
+    
+    for run in ("LLM", "Cache"):
+        events = asyncio.run(collect())
+        chunks = [event["content"] for event in events if event["type"] == "report_chunk"]
+        nodes = [event["node"] for event in events if event["type"] == "node_end"]
+        assert "".join(chunks) == "Umsatz stieg um 5%"
+        # Tokens einzeln vom Modell, aus dem Cache als ein Chunk
+        assert (len(chunks) > 1) if run == "LLM" else (len(chunks) == 1), chunks
+        assert nodes[-2:] == ["generate_report", "finalize_output"], nodes
+        assert events[-1]["type"] == "final" and "Umsatz stieg um 5%" in events[-1]["output"]
+    print(f"✅ {len(events)} Ereignisse, Bericht gestreamt")
+    return True
+
+
+def test_workflow_events():
+    """Prüft SSE-Ereignisse, zusammengefassten Puffer und knotengesteuerten Agenten-Status der Web-API"""
+    print("🛰️ Teste Workflow-Ereignisse...")
+    import asyncio
+    import time
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from orchestrator import MultiAgentOrchestrator
+    import web_api
+    
+    orchestrator = MultiAgentOrchestrator()
+    orchestrator.llm = FakeListChatModel(responses=["Umsatzanalyse"])
+    orchestrator.data_analyst.llm = FakeListChatModel(responses=["Plan", "Analyse"])
+    orchestrator.report_generator.llm = FakeListChatModel(responses=["Umsatz stieg um 5%"])
+    workflow_id = "test-events"
+    previous = web_api.orchestrator, web_api.ORCHESTRATOR_AVAILABLE
+    web_api.orchestrator, web_api.ORCHESTRATOR_AVAILABLE = orchestrator, True
+    web_api.current_workflows[workflow_id] = {
+        "status": "running",
+        "current_step": "Initialisierung...",
+        "workflow_status": {key: "idle" for key in ("orchestrator", "dataAnalyst", "duckdbTool", "reportGenerator")}
+    }
+    web_api.workflow_logs[workflow_id] = []
+    
+    async def collect():
+        return [message async for message in web_api.workflow_event_stream(workflow_id)]
+    
+    async def run():
+        live = asyncio.ensure_future(collect())
+        await asyncio.sleep(0)
+        started = time.perf_counter()
+        await web_api.run_workflow_real(workflow_id, "Wie entwickelt sich der Umsatz?")
+        elapsed = time.perf_counter() - started
+        return await live, await collect(), elapsed
+    
+    try:
+        live, late, elapsed = asyncio.run(run())
+        chunk_count = sum(message.startswith("event: report_chunk") for message in live)
+        buffered = web_api.workflow_events[workflow_id]
+        # Live-Verbindungen erhalten jedes Token, der Puffer nur einen zusammengefassten Chunk
+        assert chunk_count > 1, live
+        assert [event["type"] for event in buffered].count("report_chunk") == 1, buffered
+        assert next(event for event in buffered if event["type"] == "report_chunk")["content"] == "Umsatz stieg um 5%"
+        assert len(late) == len(buffered) == len(live) - chunk_count + 1
+        assert late[-1].startswith("event: done") and live[-1].startswith("event: done")
+        assert not web_api.workflow_subscribers[workflow_id]
+        
+        workflow = web_api.current_workflows[workflow_id]
+        assert workflow["status"] == "completed", workflow
+        assert set(workflow["workflow_status"].values()) == {"completed"}, workflow["workflow_status"]
+        messages = [log["message"] for log in web_api.workflow_logs[workflow_id]]
+        assert "✅ Report-Generator: Bericht aus Daten erstellt" in messages
+        # Ohne simulierte Wartezeiten
+        assert elapsed < 5, elapsed
+    finally:
+        web_api.orchestrator, web_api.ORCHESTRATOR_AVAILABLE = previous
+        for registry in (web_api.current_workflows, web_api.workflow_logs,
+                         web_api.workflow_events, web_api.workflow_subscribers):
+            registry.pop(workflow_id, None)
+    print(f"✅ {len(live)} Ereignisse live, {len(late)} aus dem Puffer in {elapsed:.2f}s")
+    return True
+
+
+def test_kpi_planner():
+    """Prüft die Auswahl der KPI-Auswertungen per Regeln und über die erste LLM-Antwort"""
+    print("🧭 Teste KPI-Planung...")
+    from agents.data_analyst_agent import DataAnalystAgent
+    
+    plan = DataAnalystAgent.plan_queries("Wie effizient ist unser Marketing-Spend pro Kanal?")
+    assert plan["reports"] == ["marketing_by_channel"] and plan["source"] == "rules", plan
+    plan = DataAnalystAgent.plan_queries("Wie entwickelt sich die Bruttomarge?")
+    assert plan["reports"] == ["gross_margin"] and plan["tables"] == ["kpi_cube"], plan
+    assert DataAnalystAgent.plan_queries("Was ist los?") is None
+    plan = DataAnalystAgent.plan_queries("Wie hoch ist der AOV?")
+    assert plan["reports"] == ["aov"], plan
+    
+    # Ohne bekannte Absicht entscheidet die erste LLM-Antwort
+    agent = DataAnalystAgent()
+    agent.llm = llm = _ScriptedLLM("Relevant ist die Gross Margin.")
+    result = agent.analyze_data("Was ist los?")
+    assert result["status"] == "success", result
+    assert result["plan"]["reports"] == ["gross_margin"] and result["plan"]["source"] == "llm"
+    results_prompt = llm.calls[-1][-1].content
+    assert "gross_margin:" in results_prompt and "marketing_by_channel:" not in results_prompt
+    print(f"✅ Plan: {', '.join(result['plan']['reports'])}")
+    return True
+
+
+def test_token_budget():
+    """Prüft Prompt-Messung und Verdichtung zu langer Übergaben zwischen Agenten"""
+    print("🧮 Teste Token-Budgets...")
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from agents.token_budget import PromptTokenRecorder, fit_to_budget, get_prompt_metrics_store
+    from orchestrator import MultiAgentOrchestrator
+    from utils.token_counter import count_tokens, load_encoding
+    
+    # Budgets und Prüfung zählen mit demselben Tokenizer
+    load_encoding(wait=True)
+    store = get_prompt_metrics_store()
+    store.clear()
+    assert fit_to_budget("test", "Umsatz: 1.234 EUR", 100) == "Umsatz: 1.234 EUR"
+    
+    prose = "Die Entwicklung ist insgesamt erfreulich und zeigt ein stabiles Bild. " * 200
+    analysis = prose + "\n**Revenue:** 1.234.567 EUR\n" + prose + "\n- ROAS Paid Search: 4,2\n"
+    kpi_data = "revenue:\nrevenue:float\n1234567"
+    compressed = fit_to_budget("test", analysis, 200, kpi_data)
+    assert count_tokens(compressed) <= 200, count_tokens(compressed)
+    assert compressed.startswith("KPI-Daten:\nrevenue:") and "Revenue: 1.234.567 EUR" in compressed, compressed
+    assert "erfreulich" not in compressed
+    
+    FakeListChatModel(responses=["ok"], callbacks=[PromptTokenRecorder("test")]).invoke("Wie hoch ist der Umsatz?")
+    summary = store.summary()
+    assert summary["llm_calls"] == 1 and summary["prompt_tokens_by_role"]["test"] > 0, summary
+    assert summary["compressions"] == 1 and summary["tokens_saved"] > 1000, summary
+    
+    # Ohne KPI-Daten und ohne Zeilen mit Zahlen bleibt der gekürzte Anfang der Prosa
+    truncated = fit_to_budget("test", prose, 50)
+    assert truncated and prose.startswith(truncated), truncated
+    assert 40 <= count_tokens(truncated) <= 50, count_tokens(truncated)
+    
+    # Eine lange Analyse erreicht den Bericht nur verdichtet
+    orchestrator = MultiAgentOrchestrator()
+    orchestrator.llm = _ScriptedLLM("Umsatzanalyse")
+    orchestrator.data_analyst.llm = _ScriptedLLM(analysis)
+    orchestrator.report_generator.llm = report_llm = _ScriptedLLM("Bericht")
+    orchestrator.process_request("Wie hoch ist der Umsatz?")
+    report_prompt = report_llm.calls[0][-1].content
+    assert "KPI-Daten:\nrevenue:" in report_prompt and count_tokens(report_prompt) < count_tokens(analysis) / 4
+    print(f"✅ {summary['tokens_saved']} Tokens durch Verdichtung gespart")
+    return True
+
+
 def test_imports():
     """Testet ob alle wichtigen Module importiert werden können"""
     print("📦 Teste Imports...")
@@ -82,7 +1217,34 @@ def main():
     tests = [
         ("CSV-Dateien", test_csv_files),
         ("Imports", test_imports),
-        ("DuckDB Tool", test_duckdb_tool)
+        ("DuckDB Tool", test_duckdb_tool),
+        ("DuckDB-Katalog", test_duckdb_catalog),
+        ("Schreibschutz", test_read_only_queries),
+        ("Cursor-Pool", test_cursor_pool),
+        ("Begrenztes Abrufen", test_bounded_fetch),
+        ("Faktentabelle paid_sales", test_paid_sales),
+        ("Inkrementeller Ingest", test_incremental_append),
+        ("Inkrementelle Rollups", test_incremental_rollups),
+        ("Parquet-Cache", test_parquet_cache),
+        ("Datumspartitionierung", test_date_partitioning),
+        ("Datengenerator", test_data_generator),
+        ("Benchmark", test_benchmark),
+        ("KPI-Cube", test_kpi_cube),
+        ("KPI-Register", test_kpi_registry),
+        ("KPI-Batch", test_kpi_batch),
+        ("Query-Metriken", test_query_metrics),
+        ("Kompakte Ergebnisse", test_compact_results),
+        ("Query-Cache", test_query_cache),
+        ("Query-Zeitlimit", test_query_timeout),
+        ("Query-Abbruch", test_query_cancellation),
+        ("LLM-Clients", test_llm_clients),
+        ("LLM-Cache", test_llm_cache),
+        ("Paralleler Workflow", test_parallel_workflow),
+        ("Asynchroner Workflow", test_async_workflow),
+        ("Berichts-Streaming", test_report_streaming),
+        ("Workflow-Ereignisse", test_workflow_events),
+        ("KPI-Planung", test_kpi_planner),
+        ("Token-Budgets", test_token_budget)
     ]
     
     passed = 0
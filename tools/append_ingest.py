@@ -0,0 +1,66 @@
+"""
+Erkennung und Extraktion angehängter Zeilen in append-only CSV-Exporten
+"""
+import hashlib
+import os
+import shutil
+from typing import NamedTuple, Optional
+
+# So viele Bytes vor dem bisherigen Dateiende müssen unverändert sein, damit eine
+# Größenänderung als reines Anhängen gilt
+TAIL_CHECK_BYTES = 4096
+
+
+class AppendState(NamedTuple):
+    """Stand einer CSV-Datei beim letzten Ingest"""
+    offset: int
+    header: bytes
+    tail_hash: str
+    ends_with_newline: bool
+
+
+def _tail_hash(f, offset: int) -> str:
+    start = max(0, offset - TAIL_CHECK_BYTES)
+    f.seek(start)
+    return hashlib.sha256(f.read(offset - start)).hexdigest()
+
+
+def capture_state(file_path: str, size: Optional[int] = None) -> AppendState:
+    """Merkt sich Header, Länge und Dateiende nach einem Ingest"""
+    offset = os.path.getsize(file_path) if size is None else size
+    with open(file_path, "rb") as f:
+        header = f.readline()
+        tail_hash = _tail_hash(f, offset)
+        f.seek(max(0, offset - 1))
+        ends_with_newline = f.read(1) in (b"\n", b"\r")
+    return AppendState(offset, header, tail_hash, ends_with_newline)
+
+
+def is_append(state: AppendState, file_path: str, size: int) -> bool:
+    """
+    Prüft, ob die Datei seit `state` nur gewachsen ist: Header und die letzten Bytes vor
+    dem alten Dateiende sind unverändert und die neuen Bytes beginnen eine neue Zeile.
+    """
+    if size <= state.offset:
+        return False
+    with open(file_path, "rb") as f:
+        if f.readline() != state.header:
+            return False
+        if _tail_hash(f, state.offset) != state.tail_hash:
+            return False
+        f.seek(state.offset)
+        first_byte = f.read(1)
+    # Ohne abschließenden Zeilenumbruch würde der Anhang die letzte Zeile verlängern
+    return state.ends_with_newline or first_byte in (b"\n", b"\r")
+
+
+def write_delta(state: AppendState, file_path: str, target_path: str) -> None:
+    """Schreibt Header + angehängte Zeilen als eigenständige CSV-Datei nach `target_path`"""
+    with open(file_path, "rb") as src, open(target_path, "wb") as dst:
+        dst.write(state.header)
+        src.seek(state.offset)
+        if not state.ends_with_newline:
+            # Den Zeilenumbruch, der die alte letzte Zeile abschließt, überspringen
+            if src.read(1) == b"\r" and src.read(1) != b"\n":
+                src.seek(-1, os.SEEK_CUR)
+        shutil.copyfileobj(src, dst, 1 << 20)
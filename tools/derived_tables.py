@@ -0,0 +1,159 @@
+"""
+Abgeleitete Tabellen, die der DuckDB-Katalog aus den CSV-Tabellen materialisiert
+"""
+from typing import Dict, List, TypedDict
+
+
+class DerivedTable(TypedDict, total=False):
+    """
+    Definition einer abgeleiteten Tabelle. Der Platzhalter {delta_filter} in `sql` wird beim
+    vollständigen Aufbau leer gelassen und beim inkrementellen Aufbau durch eine Bedingung
+    auf die neuen Zeilen der unter `incremental_sources` (Quelle -> Alias) genannten
+    append-only Tabellen ersetzt.
+
+    Aggregattabellen werden stattdessen je Wert ihrer Spalte `rollup_key` (z.B. Tag) neu
+    berechnet: `rollup_key_sources` liefert je Quelle eine Query auf die Schlüsselwerte der
+    Zeilen ab Zeilennummer {row_offset}, und jeder Platzhalter {key_filter:<Ausdruck>} in `sql`
+    schränkt den Ausdruck auf die betroffenen Schlüsselwerte ein (vollständiger Aufbau: TRUE).
+    """
+    sources: List[str]
+    sql: str
+    incremental_sources: Dict[str, str]
+    rollup_key: str
+    rollup_key_sources: Dict[str, str]
+
+
+DERIVED_TABLES: Dict[str, DerivedTable] = {
+    # Denormalisierte Faktentabelle aller Positionen bezahlter Bestellungen.
+    # Ersetzt den Join order_items -> orders (-> products / customers), den jede KPI-Query braucht.
+    "paid_sales": {
+        "sources": ["order_items", "orders", "products", "customers"],
+        "incremental_sources": {"order_items": "oi", "orders": "o"},
+        "sql": """
+            SELECT
+                oi.order_item_id,
+                oi.order_id,
+                o.customer_id,
+                o.order_date,
+                o.payment_method,
+                o.device,
+                o.country,
+                c.acquisition_channel,
+                c.signup_date,
+                c.country AS customer_country,
+                c.region,
+                c.age_group,
+                oi.product_id,
+                p.category,
+                oi.quantity,
+                oi.unit_price,
+                oi.discount_rate,
+                oi.net_price,
+                oi.tax_amount,
+                (oi.net_price + oi.tax_amount) * oi.quantity AS line_revenue,
+                p.unit_cost * oi.quantity AS line_cogs
+            FROM order_items oi
+            JOIN orders o ON oi.order_id = o.order_id
+            LEFT JOIN products p ON oi.product_id = p.product_id
+            LEFT JOIN customers c ON o.customer_id = c.customer_id
+            WHERE o.order_status = 'paid' {delta_filter}
+        """
+    },
+    # KPI-Rollup-Cube: additive Tagesaggregate bezahlter Bestellungen je Akquisitionskanal,
+    # Produktkategorie und Bestellland. orders zählt Bestellungen je Zelle (exakt, solange nach
+    # category gruppiert wird), orders_primary zählt jede Bestellung nur in der Zelle ihrer
+    # ersten Kategorie und lässt sich daher über alle Kategorien hinweg aufsummieren.
+    "kpi_cube": {
+        "sources": ["order_items", "orders", "products", "customers"],
+        "rollup_key": "date",
+        "rollup_key_sources": {
+            "order_items": """
+                SELECT o.order_date FROM order_items oi JOIN orders o ON oi.order_id = o.order_id
+                WHERE oi.rowid >= {row_offset}
+            """,
+            "orders": "SELECT order_date FROM orders WHERE rowid >= {row_offset}",
+        },
+        "sql": """
+            WITH items AS (
+                SELECT
+                    o.order_date AS date,
+                    c.acquisition_channel,
+                    p.category,
+                    o.country,
+                    oi.order_id,
+                    oi.quantity,
+                    (oi.net_price + oi.tax_amount) * oi.quantity AS line_revenue,
+                    p.unit_cost * oi.quantity AS line_cogs
+                FROM order_items oi
+                JOIN orders o ON oi.order_id = o.order_id
+                LEFT JOIN products p ON oi.product_id = p.product_id
+                LEFT JOIN customers c ON o.customer_id = c.customer_id
+                WHERE o.order_status = 'paid' AND {key_filter:o.order_date}
+            ),
+            primary_category AS (
+                SELECT order_id, MIN(category) AS category
+                FROM items
+                GROUP BY order_id
+            )
+            SELECT
+                i.date,
+                i.acquisition_channel,
+                i.category,
+                i.country,
+                SUM(i.line_revenue) AS revenue,
+                SUM(i.line_cogs) AS cogs,
+                SUM(i.quantity) AS quantity,
+                COUNT(*) AS order_items,
+                COUNT(DISTINCT i.order_id) AS orders,
+                COUNT(DISTINCT i.order_id) FILTER (WHERE i.category IS NOT DISTINCT FROM pc.category) AS orders_primary
+            FROM items i
+            JOIN primary_category pc ON i.order_id = pc.order_id
+            GROUP BY i.date, i.acquisition_channel, i.category, i.country
+        """
+    },
+    # Tagesaggregate je Kanal für Spend-, Traffic- und Neukunden-KPIs (ROAS, CAC, Conversion Rate)
+    "kpi_channel_daily": {
+        "sources": ["marketing_spend", "web_analytics_daily", "customers"],
+        "rollup_key": "date",
+        "rollup_key_sources": {
+            "marketing_spend": "SELECT date FROM marketing_spend WHERE rowid >= {row_offset}",
+            "web_analytics_daily": "SELECT date FROM web_analytics_daily WHERE rowid >= {row_offset}",
+            "customers": "SELECT signup_date FROM customers WHERE rowid >= {row_offset}",
+        },
+        "sql": """
+            WITH spend AS (
+                SELECT date, channel, SUM(spend) AS spend, SUM(clicks) AS clicks, SUM(impressions) AS impressions
+                FROM marketing_spend
+                WHERE {key_filter:date}
+                GROUP BY date, channel
+            ),
+            web AS (
+                SELECT date, channel, SUM(sessions) AS sessions, SUM(users) AS users,
+                       SUM(transactions) AS transactions, SUM(revenue) AS web_revenue
+                FROM web_analytics_daily
+                WHERE {key_filter:date}
+                GROUP BY date, channel
+            ),
+            signups AS (
+                SELECT signup_date AS date, acquisition_channel AS channel, COUNT(*) AS new_customers
+                FROM customers
+                WHERE {key_filter:signup_date}
+                GROUP BY signup_date, acquisition_channel
+            )
+            SELECT
+                date,
+                channel,
+                COALESCE(spend, 0) AS spend,
+                COALESCE(clicks, 0) AS clicks,
+                COALESCE(impressions, 0) AS impressions,
+                COALESCE(sessions, 0) AS sessions,
+                COALESCE(users, 0) AS users,
+                COALESCE(transactions, 0) AS transactions,
+                COALESCE(web_revenue, 0) AS web_revenue,
+                COALESCE(new_customers, 0) AS new_customers
+            FROM spend
+            FULL OUTER JOIN web USING (date, channel)
+            FULL OUTER JOIN signups USING (date, channel)
+        """
+    }
+}
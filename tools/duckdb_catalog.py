@@ -0,0 +1,617 @@
+"""
+Prozessweiter DuckDB-Katalog für die CSV-Dateien
+"""
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+from config import (
+    CSV_FILES, USE_PARQUET_CACHE, DUCKDB_POOL_SIZE, APPEND_ONLY_TABLES,
+    USE_DATE_PARTITIONING, DATE_PARTITION_COLUMNS,
+    DUCKDB_MEMORY_LIMIT, DUCKDB_THREADS, DUCKDB_TEMP_DIRECTORY
+)
+from tools import append_ingest, result_format
+from tools.derived_tables import DERIVED_TABLES, DerivedTable
+from tools.duckdb_pool import DuckDBCursorPool, QueryInterrupt, QueryTimeoutError
+from tools.parquet_cache import ParquetCache
+
+
+# EXPLAIN mit Optionen; der Rest ist das erklärte Statement
+_EXPLAIN_PREFIX = re.compile(r"^\s*EXPLAIN\s+(?:\([^)]*\)|ANALY[SZ]E)?", re.IGNORECASE)
+# Platzhalter {key_filter:<Ausdruck>} in abgeleiteten Tabellen (siehe DerivedTable)
+_KEY_FILTER = re.compile(r"\{key_filter:([^}]+)\}")
+# Ganzzahlige DuckDB-Typen (im DataFrame bei NULL-Werten als float64)
+_INTEGER_TYPES = {
+    "TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT",
+    "UTINYINT", "USMALLINT", "UINTEGER", "UBIGINT", "UHUGEINT",
+}
+
+
+def _python_value(value: Any, duckdb_type: str) -> Any:
+    """Wert aus einem DataFrame-Block mit dem Python-Typ, den fetchall für `duckdb_type` liefert"""
+    if value is None or value is pd.NaT or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if duckdb_type in _INTEGER_TYPES:
+        return int(value)
+    if isinstance(value, pd.Timestamp):
+        return value.date() if duckdb_type == "DATE" else value.to_pydatetime()
+    if isinstance(value, pd.Timedelta):
+        return value.to_pytimedelta()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class ReadOnlyQueryError(ValueError):
+    """Eine Query enthält ein Statement, das Daten oder Schema des Katalogs verändern würde"""
+
+    def __init__(self, statement_type: str):
+        super().__init__(
+            f"Nur lesende Queries sind erlaubt (SELECT, WITH, DESCRIBE, EXPLAIN), nicht {statement_type}."
+        )
+        self.statement_type = statement_type
+
+
+def check_read_only(query: str) -> None:
+    """
+    Lässt nur lesende Statements zu. Alle Queries teilen sich eine langlebige Datenbank:
+    ein DELETE oder DROP würde die geladenen Tabellen bis zum Prozessende verändern, da
+    sie nur bei einer Änderung der Quelldatei neu geladen werden. WITH, DESCRIBE, SHOW und
+    SUMMARIZE parst DuckDB als SELECT; EXPLAIN ANALYZE führt sein Statement aus, daher wird
+    auch das erklärte Statement geprüft.
+    """
+    for statement in duckdb.extract_statements(query):
+        if statement.type == duckdb.StatementType.EXPLAIN:
+            explained = _EXPLAIN_PREFIX.sub("", statement.query, count=1)
+            if explained == statement.query:
+                raise ReadOnlyQueryError(statement.type.name)
+            check_read_only(explained)
+        elif statement.type != duckdb.StatementType.SELECT:
+            raise ReadOnlyQueryError(statement.type.name)
+
+
+class DuckDBCatalog:
+    """
+    Langlebige In-Memory-Datenbank, in die jede CSV-Datei nur einmal geladen wird.
+    Tabellen werden erst geladen, wenn eine Query sie referenziert. Abgeleitete Tabellen
+    (siehe DERIVED_TABLES) werden aus ihren Quelltabellen materialisiert und neu aufgebaut,
+    sobald sich eine der Quellen ändert. Wachsen append-only Exporte nur am Ende, werden
+    lediglich die neuen Zeilen geladen und in abgeleitete Tabellen übernommen.
+    Optional liegen Tabellen mit Datumsspalte als Views auf Jahr/Monat-Partitionen, sodass
+    Queries mit Datumsfilter nur die Dateien des abgefragten Zeitraums lesen.
+    """
+
+    def __init__(self, csv_files: Optional[Dict[str, str]] = None,
+                 use_parquet: bool = USE_PARQUET_CACHE,
+                 parquet_cache: Optional[ParquetCache] = None,
+                 use_date_partitioning: bool = USE_DATE_PARTITIONING,
+                 pool_size: int = DUCKDB_POOL_SIZE,
+                 derived_tables: Optional[Dict[str, DerivedTable]] = None,
+                 append_only_tables: Optional[Iterable[str]] = None,
+                 memory_limit: str = DUCKDB_MEMORY_LIMIT,
+                 threads: int = DUCKDB_THREADS,
+                 temp_directory: str = DUCKDB_TEMP_DIRECTORY):
+        self.csv_files = dict(csv_files if csv_files is not None else CSV_FILES)
+        # Nur abgeleitete Tabellen, deren Quellen alle im Katalog vorhanden sind
+        self.derived_tables = {
+            name: definition
+            for name, definition in (derived_tables if derived_tables is not None else DERIVED_TABLES).items()
+            if all(source in self.csv_files for source in definition["sources"])
+        }
+        # Mit Parquet-Cache sind die Tabellen Views auf Parquet-Dateien, sonst materialisierte Tabellen
+        self.use_parquet = use_parquet
+        self.parquet_cache = parquet_cache or ParquetCache()
+        # Tabelle -> Datumsspalte für Tabellen, die als Views auf Jahr/Monat-Partitionen liegen
+        self.partition_columns = {
+            name: column for name, column in DATE_PARTITION_COLUMNS.items() if name in self.csv_files
+        } if use_date_partitioning else {}
+        # Inkrementelles Anhängen funktioniert nur für materialisierte Tabellen
+        self.append_only_tables = set() if use_parquet else set(
+            append_only_tables if append_only_tables is not None else APPEND_ONLY_TABLES
+        ) & set(self.csv_files) - set(self.partition_columns)
+        # Eine gemeinsame Datenbank: geladen wird über `conn`, Queries laufen über Pool-Cursor
+        self.conn = duckdb.connect(':memory:', config=self._connection_config(memory_limit, threads, temp_directory))
+        self.pool = DuckDBCursorPool(self.conn, pool_size)
+        # Je Tabelle ein Lock und ein eigener Cursor für das (Neu-)Laden: lädt ein Thread eine
+        # Tabelle neu, laufen Queries auf allen anderen Tabellen ungehindert weiter
+        self._table_locks = {name: threading.RLock() for name in self.table_names}
+        self._loaders = {name: self.conn.cursor() for name in self.table_names}
+        # Cursor zum Parsen der Queries in referenced_tables
+        self._parser = self.conn.cursor()
+        self._parser_lock = threading.Lock()
+        # Tabelle -> (mtime_ns, size) der Quelldatei beim letzten Laden
+        self._fingerprints: Dict[str, Tuple[int, int]] = {}
+        # Tabelle -> Zähler der vollständigen Neuladungen (Anhängen erhöht ihn nicht)
+        self._generations: Dict[str, int] = {}
+        # Tabelle -> Zeilenanzahl (nur materialisierte Tabellen; neue Zeilen haben rowid >= alter Anzahl)
+        self._row_counts: Dict[str, Optional[int]] = {}
+        # Tabelle -> Dateistand beim letzten Ingest, um reines Anhängen zu erkennen
+        self._append_states: Dict[str, append_ingest.AppendState] = {}
+        # Abgeleitete Tabelle -> (Generation, Zeilenanzahl) ihrer Quellen beim letzten Aufbau
+        self._derived_versions: Dict[str, Dict[str, Tuple[int, Optional[int]]]] = {}
+
+    @staticmethod
+    def _connection_config(memory_limit: str, threads: int, temp_directory: str) -> Dict[str, Any]:
+        """
+        Ressourcengrenzen der Datenbank - gelten für alle Cursor, also für alle parallelen
+        Queries zusammen. Überschreiten Joins oder Aggregationen das Speicherlimit, lagert
+        DuckDB Zwischenergebnisse in `temp_directory` aus, statt abzubrechen.
+        """
+        config: Dict[str, Any] = {}
+        if memory_limit:
+            config["memory_limit"] = memory_limit
+        if threads > 0:
+            config["threads"] = threads
+        if temp_directory:
+            os.makedirs(temp_directory, exist_ok=True)
+            config["temp_directory"] = temp_directory
+        return config
+
+    @staticmethod
+    def _file_fingerprint(file_path: str) -> Tuple[int, int]:
+        """Günstiger Änderungsindikator einer Datei (mtime + Größe)"""
+        stat = os.stat(file_path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _relation_kind(self, table_name: str) -> str:
+        """VIEW für Tabellen auf Parquet-Dateien, sonst TABLE"""
+        return "VIEW" if self.use_parquet or table_name in self.partition_columns else "TABLE"
+
+    @property
+    def table_names(self) -> List[str]:
+        """Alle Tabellen des Katalogs (CSV-Tabellen und abgeleitete Tabellen)"""
+        return list(self.csv_files) + list(self.derived_tables)
+
+    def _base_tables(self, tables: Iterable[str]) -> List[str]:
+        """Löst abgeleitete Tabellen in ihre CSV-Quelltabellen auf"""
+        base = []
+        for name in tables:
+            sources = self.derived_tables[name]["sources"] if name in self.derived_tables else [name]
+            base.extend(source for source in sources if source not in base)
+        return base
+
+    def referenced_tables(self, query: str) -> List[str]:
+        """
+        Ermittelt die Katalog-Tabellen, auf die eine Query zugreift.
+        Nutzt den DuckDB-Parser; bei Statements, die er so nicht auflösen kann
+        (z.B. DESCRIBE oder mehrere Statements), wird nach Tabellennamen gesucht.
+        """
+        known = {name.lower(): name for name in self.table_names}
+        try:
+            with self._parser_lock:
+                names = self._parser.get_table_names(query)
+            return sorted({known[n.lower()] for n in names if n.lower() in known})
+        except Exception:
+            return sorted(
+                name for name in self.table_names
+                if re.search(rf"\b{re.escape(name)}\b", query, re.IGNORECASE)
+            )
+
+    def refresh(self, tables: Optional[Iterable[str]] = None) -> None:
+        """
+        Lädt die angegebenen Tabellen (Standard: alle), falls ihre Quelldatei neu ist
+        oder sich seit dem letzten Laden geändert hat. Angefragte abgeleitete Tabellen
+        werden samt Quellen geladen und bei geänderten Quellen neu aufgebaut.
+        """
+        requested = self.table_names if tables is None else list(tables)
+        for table_name in self._base_tables(requested):
+            self._refresh_table(table_name)
+        for table_name in requested:
+            if table_name in self.derived_tables:
+                self._refresh_derived(table_name)
+
+    def _current_fingerprint(self, table_name: str) -> Optional[Tuple[int, int]]:
+        """Fingerprint der Quelldatei oder None, falls sie (nicht mehr) existiert"""
+        try:
+            return self._file_fingerprint(self.csv_files[table_name])
+        except FileNotFoundError:
+            return None
+
+    def _refresh_table(self, table_name: str) -> None:
+        """
+        Lädt eine CSV-Tabelle bei Bedarf neu. Ist die Datei unverändert, wird kein Lock
+        genommen; sonst nur das Lock dieser Tabelle.
+        """
+        if self._fingerprints.get(table_name) == self._current_fingerprint(table_name):
+            return
+
+        with self._table_locks[table_name]:
+            loader = self._loaders[table_name]
+            file_path = self.csv_files[table_name]
+            # Erneut prüfen: ein anderer Thread kann die Tabelle inzwischen geladen haben
+            fingerprint = self._current_fingerprint(table_name)
+            if self._fingerprints.get(table_name) == fingerprint:
+                return
+            if fingerprint is None:
+                loader.execute(f"DROP {self._relation_kind(table_name)} IF EXISTS {table_name}")
+                self._append_states.pop(table_name, None)
+                self._fingerprints.pop(table_name, None)
+                return
+
+            append_state = self._append_states.get(table_name)
+            appended = False
+            if (table_name in self._fingerprints and append_state is not None
+                    and append_ingest.is_append(append_state, file_path, fingerprint[1])):
+                try:
+                    self._append_delta(table_name, file_path, append_state)
+                    appended = True
+                except duckdb.Error as e:
+                    # Z.B. Werte, die nicht zu den beim ersten Laden erkannten Spaltentypen passen
+                    print(f"⚠️ Angehängte Zeilen von {table_name} nicht übernehmbar, lade vollständig neu: {e}")
+            if not appended:
+                self._load_table(table_name, file_path)
+                self._generations[table_name] = self._generations.get(table_name, 0) + 1
+                self._row_counts[table_name] = None if self._relation_kind(table_name) == "VIEW" else (
+                    loader.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+                )
+
+            if table_name in self.append_only_tables:
+                self._append_states[table_name] = append_ingest.capture_state(file_path, fingerprint[1])
+            self._fingerprints[table_name] = fingerprint
+
+    def _append_delta(self, table_name: str, file_path: str, state: append_ingest.AppendState) -> None:
+        """Lädt nur die seit dem letzten Ingest angehängten Zeilen einer CSV-Datei"""
+        loader = self._loaders[table_name]
+        columns = loader.execute(f"DESCRIBE {table_name}").fetchall()
+        column_types = ", ".join(f"'{name}': '{column_type}'" for name, column_type, *_ in columns)
+
+        fd, delta_path = tempfile.mkstemp(suffix=".csv")
+        os.close(fd)
+        try:
+            append_ingest.write_delta(state, file_path, delta_path)
+            inserted = loader.execute(f"""
+                INSERT INTO {table_name}
+                SELECT * FROM read_csv('{delta_path}', header = true, columns = {{{column_types}}})
+            """).fetchone()[0]
+        finally:
+            os.remove(delta_path)
+
+        self._row_counts[table_name] += inserted
+
+    def _refresh_derived(self, table_name: str) -> None:
+        """
+        Materialisiert eine abgeleitete Tabelle, falls sich eine ihrer Quellen geändert hat.
+        Sind nur inkrementell verarbeitbare Quellen gewachsen, werden nur die neuen Zeilen eingefügt.
+        """
+        definition = self.derived_tables[table_name]
+        if self._derived_versions.get(table_name) == self._source_versions(definition):
+            return
+
+        # Lock der abgeleiteten Tabelle und ihrer Quellen, immer in derselben Reihenfolge
+        with ExitStack() as stack:
+            for name in sorted([table_name] + definition["sources"]):
+                stack.enter_context(self._table_locks[name])
+            loader = self._loaders[table_name]
+
+            version = self._source_versions(definition)
+            if version is None:
+                if self._derived_versions.pop(table_name, None) is not None:
+                    loader.execute(f"DROP TABLE IF EXISTS {table_name}")
+                return
+
+            previous = self._derived_versions.get(table_name)
+            if previous == version:
+                return
+
+            sql = definition["sql"]
+            delta_filter = self._delta_filter(definition, previous, version)
+            if delta_filter is not None:
+                loader.execute(f"INSERT INTO {table_name} {self._render_sql(sql, delta_filter)}")
+            elif not self._rebuild_rollup_keys(table_name, definition, previous, version):
+                loader.execute(f"CREATE OR REPLACE TABLE {table_name} AS {self._render_sql(sql)}")
+            self._derived_versions[table_name] = version
+
+    def _source_versions(self, definition: DerivedTable) -> Optional[Dict[str, Tuple[int, Optional[int]]]]:
+        """(Generation, Zeilenanzahl) je Quelle oder None, falls eine Quelle nicht geladen ist"""
+        if any(source not in self._fingerprints for source in definition["sources"]):
+            return None
+        return {
+            source: (self._generations[source], self._row_counts[source])
+            for source in definition["sources"]
+        }
+
+    @staticmethod
+    def _grown_sources(previous: Optional[Dict[str, Tuple[int, Optional[int]]]],
+                       current: Dict[str, Tuple[int, Optional[int]]]) -> Optional[Dict[str, int]]:
+        """
+        Bisherige Zeilenanzahl je Quelle, an die seit `previous` nur Zeilen angehängt wurden -
+        None, falls eine Quelle neu geladen wurde oder ihre Zeilenanzahl unbekannt ist
+        """
+        if previous is None:
+            return None
+
+        grown = {}
+        for source, (generation, row_count) in current.items():
+            old_generation, old_row_count = previous[source]
+            if generation != old_generation:
+                return None
+            if row_count == old_row_count:
+                continue
+            if row_count is None or old_row_count is None:
+                return None
+            grown[source] = old_row_count
+        return grown
+
+    @classmethod
+    def _delta_filter(cls, definition: DerivedTable,
+                      previous: Optional[Dict[str, Tuple[int, Optional[int]]]],
+                      current: Dict[str, Tuple[int, Optional[int]]]) -> Optional[str]:
+        """
+        Filter auf die neuen Zeilen, falls sich seit `previous` nur inkrementelle Quellen
+        durch Anhängen verändert haben - sonst None (vollständiger Neuaufbau)
+        """
+        incremental_sources = definition.get("incremental_sources", {})
+        grown = cls._grown_sources(previous, current)
+        if not incremental_sources or grown is None or any(source not in incremental_sources for source in grown):
+            return None
+
+        conditions = [f"{incremental_sources[source]}.rowid >= {row_count}" for source, row_count in grown.items()]
+        return f"AND ({' OR '.join(conditions)})"
+
+    def _rebuild_rollup_keys(self, table_name: str, definition: DerivedTable,
+                             previous: Optional[Dict[str, Tuple[int, Optional[int]]]],
+                             current: Dict[str, Tuple[int, Optional[int]]]) -> bool:
+        """
+        Berechnet eine Aggregattabelle nur für die Schlüsselwerte (z.B. Tage) neu, die in den
+        angehängten Zeilen vorkommen. Gibt False zurück, falls ein vollständiger Neuaufbau nötig ist.
+        """
+        key_sources = definition.get("rollup_key_sources", {})
+        grown = self._grown_sources(previous, current)
+        if not key_sources or grown is None or any(source not in key_sources for source in grown):
+            return False
+
+        loader = self._loaders[table_name]
+        keys_table = f"_{table_name}_keys"
+        key_queries = " UNION ".join(
+            f"({key_sources[source].replace('{row_offset}', str(row_count))})" for source, row_count in grown.items()
+        )
+        loader.execute(f"CREATE OR REPLACE TEMP TABLE {keys_table} AS SELECT key FROM ({key_queries}) AS keys(key)")
+        try:
+            # NULL-Schlüssel lassen sich nicht gezielt löschen
+            if loader.execute(f"SELECT COUNT(*) FROM {keys_table} WHERE key IS NULL").fetchone()[0]:
+                return False
+            # Löschen und Einfügen in einer Transaktion, damit Queries keinen halben Stand sehen
+            loader.begin()
+            try:
+                loader.execute(
+                    f"DELETE FROM {table_name} WHERE {definition['rollup_key']} IN (SELECT key FROM {keys_table})"
+                )
+                loader.execute(f"INSERT INTO {table_name} {self._render_sql(definition['sql'], keys_table=keys_table)}")
+                loader.commit()
+            except duckdb.Error:
+                loader.rollback()
+                raise
+            return True
+        finally:
+            loader.execute(f"DROP TABLE IF EXISTS {keys_table}")
+
+    @staticmethod
+    def _render_sql(sql: str, delta_filter: str = "", keys_table: Optional[str] = None) -> str:
+        """Setzt {delta_filter} und die {key_filter:<Ausdruck>}-Platzhalter einer Definition ein"""
+        sql = sql.replace("{delta_filter}", delta_filter)
+        return _KEY_FILTER.sub(
+            lambda m: f"{m.group(1)} IN (SELECT key FROM {keys_table})" if keys_table else "TRUE", sql
+        )
+
+    def _load_table(self, table_name: str, file_path: str) -> None:
+        """Registriert eine Quelldatei als Tabelle bzw. als View auf ihrer Parquet-Kopie"""
+        loader = self._loaders[table_name]
+        if table_name in self.partition_columns:
+            partition_dir = self.parquet_cache.ensure_partitioned(
+                loader, table_name, file_path, self.partition_columns[table_name]
+            )
+            # Die Partitionsspalten werden ausgeblendet, damit das Schema dem der CSV-Datei entspricht
+            loader.execute(f"""
+                CREATE OR REPLACE VIEW {table_name} AS
+                SELECT * EXCLUDE (year, month)
+                FROM read_parquet('{partition_dir}/**/*.parquet', hive_partitioning = true)
+            """)
+        elif self.use_parquet:
+            parquet_path = self.parquet_cache.ensure(loader, table_name, file_path)
+            loader.execute(f"""
+                CREATE OR REPLACE VIEW {table_name} AS
+                SELECT * FROM read_parquet('{parquet_path}')
+            """)
+        else:
+            loader.execute(f"""
+                CREATE OR REPLACE TABLE {table_name} AS
+                SELECT * FROM read_csv_auto('{file_path}')
+            """)
+
+    def loaded_tables(self) -> Dict[str, Tuple[int, int]]:
+        """Gibt die aktuell geladenen Tabellen mit ihrem Datei-Fingerprint zurück"""
+        return dict(self._fingerprints)
+
+    def data_version(self, tables: Optional[Iterable[str]] = None) -> Tuple:
+        """
+        Fingerprint des Datenstands der angegebenen Tabellen (Standard: alle).
+        Ändert sich, sobald eine dieser Dateien (bzw. eine Quelle einer abgeleiteten
+        Tabelle) neu geladen oder entfernt wurde.
+        """
+        requested = self.table_names if tables is None else list(tables)
+        self.refresh(requested)
+        return tuple((name, self._fingerprints.get(name)) for name in sorted(self._base_tables(requested)))
+
+    def query_df(self, query: str, tables: Optional[Iterable[str]] = None,
+                 interrupt: Optional[QueryInterrupt] = None,
+                 profile: Optional[Dict[str, Any]] = None):
+        """
+        Führt eine Query aus und gibt einen DataFrame zurück. Vorher werden nur die
+        Tabellen geladen, die die Query referenziert. Ist `profile` angegeben, wird dort
+        das JSON-Profil derselben Ausführung eingetragen.
+        """
+        check_read_only(query)
+        self.refresh(self.referenced_tables(query) if tables is None else tables)
+        with self.pool.cursor() as cur, self._profiled(cur, profile), self._interruptible(cur, interrupt):
+            return cur.execute(query).fetchdf()
+
+    def query_preview(self, query: str, limit: int,
+                      tables: Optional[Iterable[str]] = None,
+                      interrupt: Optional[QueryInterrupt] = None,
+                      timings: Optional[Dict[str, float]] = None,
+                      summary: Optional[Dict[str, Dict[str, Any]]] = None,
+                      profile: Optional[Dict[str, Any]] = None) -> Tuple[List[str], List[tuple], int]:
+        """
+        Führt eine Query einmal aus und behält höchstens `limit` Zeilen; weitere Zeilen
+        werden als DataFrame-Blöcke nur gezählt. Gibt (Spalten, Vorschauzeilen, Gesamtzahl Zeilen)
+        zurück - der Speicherbedarf bleibt unabhängig von der Größe des Ergebnisses
+        begrenzt. Über `interrupt` kann ein anderer Thread die laufende Query abbrechen bzw. ein Zeitlimit greifen
+        (dann QueryTimeoutError); in `timings` werden execute_ms und fetch_ms eingetragen.
+        Hat das Ergebnis mehr als `limit` Zeilen, erhält `summary` beim Zählen Summe, Minimum,
+        Maximum und Mittelwert der numerischen Spalten; `profile` das JSON-Profil der Ausführung.
+        """
+        timings = {} if timings is None else timings
+        check_read_only(query)
+        self.refresh(self.referenced_tables(query) if tables is None else tables)
+        with self.pool.cursor() as cur, self._profiled(cur, profile), self._interruptible(cur, interrupt):
+            # Über die Relation sind die genauen Spaltentypen bekannt, bevor die Query läuft;
+            # sie startet mit dem ersten Block (fetchmany und fetch_df_chunk lassen sich nicht
+            # mischen, ohne Zeilen des gepufferten Blocks zu verlieren)
+            started = time.perf_counter()
+            relation = cur.sql(query)
+            if relation is None:
+                timings["execute_ms"] = (time.perf_counter() - started) * 1000
+                timings["fetch_ms"] = 0.0
+                return [], [], 0
+            chunks = self._fetch_chunks(relation)
+            first = next(chunks, None)
+            executed = time.perf_counter()
+            timings["execute_ms"] = (executed - started) * 1000
+            try:
+                columns = list(relation.columns)
+                types = [str(column_type) for column_type in relation.types]
+                frames = [] if first is None else [first]
+                fetched = len(frames[0]) if frames else 0
+                while fetched <= limit:
+                    frame = next(chunks, None)
+                    if frame is None:
+                        break
+                    frames.append(frame)
+                    fetched += len(frame)
+                head = pd.concat(frames, ignore_index=True).head(limit + 1) if frames else pd.DataFrame()
+                rows = [
+                    tuple(_python_value(value, column_type) for value, column_type in zip(row, types))
+                    for row in head.itertuples(index=False, name=None)
+                ]
+                if fetched <= limit:
+                    return columns, rows, fetched
+
+                if summary is None:
+                    return columns, rows[:limit], fetched + self._count_remaining(chunks)
+                running = result_format.RunningSummary(columns, rows)
+                for frame in frames:
+                    running.update(frame)
+                total = fetched + self._count_remaining(chunks, running.update)
+                summary.update(running.result())
+                return columns, rows[:limit], total
+            finally:
+                timings["fetch_ms"] = (time.perf_counter() - executed) * 1000
+
+    @staticmethod
+    @contextmanager
+    def _interruptible(cur: duckdb.DuckDBPyConnection, interrupt: Optional[QueryInterrupt]) -> Iterator[None]:
+        """Macht die Query auf `cur` über `interrupt` abbrechbar und meldet Zeitüberschreitungen"""
+        if interrupt is None:
+            yield
+            return
+        interrupt.attach(cur)
+        try:
+            yield
+        except duckdb.InterruptException as e:
+            if interrupt.timed_out:
+                raise QueryTimeoutError(interrupt.timeout_seconds) from e
+            raise
+        finally:
+            interrupt.detach()
+
+    @staticmethod
+    @contextmanager
+    def _profiled(cur: duckdb.DuckDBPyConnection, profile: Optional[Dict[str, Any]]) -> Iterator[None]:
+        """
+        Schreibt das JSON-Profil der auf `cur` ausgeführten Query nach `profile`. DuckDB legt
+        es ab, sobald das Ergebnis vollständig abgeholt ist - die Query läuft nur einmal.
+        """
+        if profile is None:
+            yield
+            return
+        fd, profile_path = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        try:
+            cur.execute("SET enable_profiling = 'json'")
+            cur.execute(f"SET profiling_output = '{profile_path}'")
+            yield
+        finally:
+            # Der Cursor geht ohne Profiling zurück in den Pool
+            cur.execute("PRAGMA disable_profiling")
+            if os.path.getsize(profile_path):
+                with open(profile_path) as f:
+                    profile.update(json.load(f))
+            os.remove(profile_path)
+
+    @staticmethod
+    def _fetch_chunks(relation: duckdb.DuckDBPyRelation, vectors_per_chunk: int = 8) -> Iterator[pd.DataFrame]:
+        """Liefert das Ergebnis der Relation als DataFrame-Blöcke von je `vectors_per_chunk` * 2048 Zeilen"""
+        while True:
+            frame = relation.fetch_df_chunk(vectors_per_chunk)
+            if frame.empty:
+                return
+            yield frame
+
+    @staticmethod
+    def _count_remaining(chunks: Iterator[pd.DataFrame],
+                         on_chunk: Optional[Callable[[pd.DataFrame], None]] = None) -> int:
+        """
+        Zählt die noch nicht geholten Zeilen des laufenden Ergebnisses und reicht jeden Block
+        an `on_chunk` weiter. Die Query wird dafür nicht erneut ausgeführt: bei nicht
+        deterministischen Ausdrücken würde eine zweite Ausführung andere Werte liefern.
+        """
+        total = 0
+        for frame in chunks:
+            if on_chunk is not None:
+                on_chunk(frame)
+            total += len(frame)
+        return total
+
+    def stream_batches(self, query: str, vectors_per_batch: int = 1,
+                       tables: Optional[Iterable[str]] = None) -> Iterator[pd.DataFrame]:
+        """
+        Liefert das vollständige Ergebnis einer Query als Folge von DataFrame-Batches
+        (je `vectors_per_batch` * 2048 Zeilen). Der Cursor bleibt belegt, bis der
+        Generator erschöpft oder geschlossen ist.
+        """
+        check_read_only(query)
+        self.refresh(self.referenced_tables(query) if tables is None else tables)
+        with self.pool.cursor() as cur:
+            cur.execute(query)
+            if cur.description is None:
+                return
+            while True:
+                batch = cur.fetch_df_chunk(vectors_per_batch)
+                if batch.empty:
+                    return
+                yield batch
+
+
+_catalog: Optional[DuckDBCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> DuckDBCatalog:
+    """Gibt den prozessweit geteilten Katalog zurück (wird beim ersten Zugriff erstellt)"""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = DuckDBCatalog()
+        return _catalog
@@ -0,0 +1,136 @@
+"""
+Cursor-Pool für parallele Queries auf einer gemeinsamen DuckDB-Datenbank
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+import duckdb
+
+from config import DUCKDB_POOL_SIZE
+
+
+class DuckDBCursorPool:
+    """
+    Verwaltet bis zu `size` Cursor auf derselben Datenbank. Jeder Cursor ist eine eigene
+    DuckDB-Verbindung auf die geladenen Tabellen und wird exklusiv von einem Thread genutzt,
+    sodass Queries parallel laufen, ohne sich ein globales Lock zu teilen.
+    """
+
+    def __init__(self, conn: duckdb.DuckDBPyConnection, size: int = DUCKDB_POOL_SIZE):
+        if size < 1:
+            raise ValueError("DuckDB-Pool-Größe muss mindestens 1 sein")
+        self._conn = conn
+        self.size = size
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle: List[duckdb.DuckDBPyConnection] = []
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._peak_in_use = 0
+        self._acquisitions = 0
+        self._waits = 0
+        self._wait_seconds = 0.0
+
+    @contextmanager
+    def cursor(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        """Leiht einen Cursor aus und wartet, falls alle Cursor belegt sind"""
+        if not self._slots.acquire(blocking=False):
+            wait_started = time.perf_counter()
+            self._slots.acquire()
+            with self._lock:
+                self._waits += 1
+                self._wait_seconds += time.perf_counter() - wait_started
+
+        with self._lock:
+            if self._idle:
+                cur = self._idle.pop()
+            else:
+                cur = self._conn.cursor()
+                self._created += 1
+            self._in_use += 1
+            self._acquisitions += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+
+        try:
+            yield cur
+        finally:
+            with self._lock:
+                self._in_use -= 1
+                self._idle.append(cur)
+            self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """Auslastungskennzahlen zum Dimensionieren des Pools"""
+        with self._lock:
+            return {
+                "size": self.size,
+                "created": self._created,
+                "in_use": self._in_use,
+                "peak_in_use": self._peak_in_use,
+                "utilization": self._in_use / self.size,
+                "acquisitions": self._acquisitions,
+                "waits": self._waits,
+                "wait_seconds": round(self._wait_seconds, 4),
+            }
+
+
+class QueryTimeoutError(Exception):
+    """Eine Query hat ihr Zeitlimit überschritten und wurde abgebrochen"""
+
+    def __init__(self, timeout_seconds: float):
+        super().__init__(
+            f"Zeitlimit von {timeout_seconds:g} Sekunden überschritten, die Query wurde abgebrochen. "
+            "Bitte die Query einschränken (Filter, Aggregation oder fehlende Join-Bedingung prüfen)."
+        )
+        self.timeout_seconds = timeout_seconds
+
+
+class QueryInterrupt:
+    """
+    Verbindet eine laufende Query mit ihrem Aufrufer, damit dieser sie über
+    DuckDBs interrupt() abbrechen kann (z.B. wenn ein async Task gecancelt wird).
+    Mit `timeout_seconds` wird die Query außerdem nach Ablauf des Zeitlimits abgebrochen.
+    """
+
+    def __init__(self, timeout_seconds: Optional[float] = None):
+        self._lock = threading.Lock()
+        self._cursor = None
+        self._timer: Optional[threading.Timer] = None
+        self.timeout_seconds = timeout_seconds
+        self.cancelled = False
+        self.timed_out = False
+
+    def attach(self, cur: duckdb.DuckDBPyConnection) -> None:
+        """Registriert den Cursor, auf dem die Query läuft, und startet das Zeitlimit"""
+        with self._lock:
+            if self.cancelled:
+                raise duckdb.InterruptException("Query wurde vor dem Start abgebrochen")
+            self._cursor = cur
+            if self.timeout_seconds:
+                self._timer = threading.Timer(self.timeout_seconds, self._on_timeout)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def detach(self) -> None:
+        with self._lock:
+            self._cursor = None
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def interrupt(self) -> None:
+        """Bricht die laufende Query ab bzw. verhindert ihren Start"""
+        with self._lock:
+            self.cancelled = True
+            if self._cursor is not None:
+                self._cursor.interrupt()
+
+    def _on_timeout(self) -> None:
+        with self._lock:
+            # Nach detach() gehört der Cursor bereits einer anderen Query
+            if self._cursor is None:
+                return
+            self.timed_out = True
+        self.interrupt()
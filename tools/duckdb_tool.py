@@ -1,13 +1,42 @@
 """
 DuckDB Tool für SQL-Queries auf CSV-Dateien
 """
-import duckdb
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, Iterator, List, Optional
 from langchain.tools import BaseTool
 from pydantic import Field
-import os
-from config import CSV_FILES
+from config import DUCKDB_POOL_SIZE, DUCKDB_QUERY_TIMEOUT_SECONDS, QUERY_PROFILING, RESULT_FORMAT
+from tools.duckdb_catalog import DuckDBCatalog, get_catalog
+from tools.duckdb_pool import QueryInterrupt
+from tools.query_cache import QueryResultCache, get_query_cache
+from tools.query_metrics import QueryMetrics, get_metrics_store, new_metrics, rows_scanned
+from tools import result_format
+from utils.token_counter import count_tokens
+
+
+# Ergebnisse bis zu dieser Größe werden vollständig ausgegeben, größere nur als Vorschau
+FULL_RESULT_MAX_ROWS = 20
+PREVIEW_ROWS = 10
+
+# Eigener Thread-Pool für async Aufrufe, damit Scans nie den Event-Loop blockieren
+_query_executor: Optional[ThreadPoolExecutor] = None
+_query_executor_lock = threading.Lock()
+
+
+def _get_query_executor() -> ThreadPoolExecutor:
+    global _query_executor
+    with _query_executor_lock:
+        if _query_executor is None:
+            _query_executor = ThreadPoolExecutor(
+                max_workers=DUCKDB_POOL_SIZE,
+                thread_name_prefix="duckdb-query"
+            )
+        return _query_executor
 
 
 class DuckDBQueryTool(BaseTool):
@@ -25,56 +54,215 @@ class DuckDBQueryTool(BaseTool):
     - marketing_spend: date, channel, campaign, spend
     - web_analytics_daily: date, channel, sessions, users, transactions, revenue
     
+    Vorberechnete Faktentabelle (bevorzugt für Umsatz-, AOV- und Margen-KPIs, kein Join nötig):
+    - paid_sales: alle Positionen bezahlter Bestellungen mit order_item_id, order_id, customer_id,
+      order_date, payment_method, device, country, acquisition_channel, signup_date, customer_country,
+      region, age_group, product_id, category, quantity, unit_price, discount_rate, net_price, tax_amount,
+      line_revenue (= (net_price + tax_amount) * quantity), line_cogs (= unit_cost * quantity)
+    
+    KPI-Cube (Tagesaggregate, am schnellsten für Fragen nach Datum, Kanal, Kategorie oder Land):
+    - kpi_cube: date, acquisition_channel, category, country, revenue, cogs, quantity, order_items,
+      orders (Bestellungen je Zeile, nur mit GROUP BY category summierbar),
+      orders_primary (über alle Kategorien summierbar)
+    - kpi_channel_daily: date, channel, spend, clicks, impressions, sessions, users, transactions,
+      web_revenue, new_customers
+    
     Wichtige Joins:
     - orders.customer_id → customers.customer_id
     - order_items.order_id → orders.order_id
     - order_items.product_id → products.product_id
     
     Beispiel: SELECT COUNT(*) as total_orders FROM orders WHERE order_status = 'paid'
+    Beispiel: SELECT SUM(line_revenue) / COUNT(DISTINCT order_id) as aov FROM paid_sales
+    Beispiel: SELECT country, SUM(revenue) / SUM(orders_primary) as aov FROM kpi_cube GROUP BY country
     """
     
+    # Optional eigene Instanzen (z.B. für Benchmarks), sonst die prozessweit geteilten
+    catalog: Optional[DuckDBCatalog] = Field(default=None, exclude=True)
+    query_cache: Optional[QueryResultCache] = Field(default=None, exclude=True)
+    # Zeitlimit pro Query in Sekunden (0 = unbegrenzt); danach wird die Query per interrupt() abgebrochen
+    query_timeout: float = Field(default=DUCKDB_QUERY_TIMEOUT_SECONDS, exclude=True)
+    # JSON-Profil jeder ausgeführten Query in den Metriken (aus derselben Ausführung)
+    profiling: bool = Field(default=QUERY_PROFILING, exclude=True)
+    
+    def _get_catalog(self) -> DuckDBCatalog:
+        return self.catalog if self.catalog is not None else get_catalog()
+    
+    def _get_query_cache(self) -> QueryResultCache:
+        return self.query_cache if self.query_cache is not None else get_query_cache()
+    
     def _run(self, query: str) -> str:
         """Führt eine SQL-Query aus und gibt das Ergebnis zurück"""
+        return self._execute(query)
+    
+    def _execute(self, query: str, interrupt: Optional[QueryInterrupt] = None) -> str:
+        """Gemeinsame Ausführung für _run und _arun; `interrupt` erlaubt den Abbruch"""
+        if interrupt is None:
+            interrupt = QueryInterrupt(self.query_timeout)
+        metrics = new_metrics(query)
+        started = time.perf_counter()
         try:
-            # DuckDB-Verbindung erstellen
-            conn = duckdb.connect(':memory:')
-            
-            # CSV-Dateien als Tabellen laden
-            for table_name, file_path in CSV_FILES.items():
-                if os.path.exists(file_path):
-                    conn.execute(f"""
-                        CREATE TABLE {table_name} AS 
-                        SELECT * FROM read_csv_auto('{file_path}')
-                    """)
-            
-            # Query ausführen
-            result = conn.execute(query).fetchdf()
-            
-            # Verbindung schließen
-            conn.close()
+            catalog = self._get_catalog()
+            cache = self._get_query_cache()
             
-            # Ergebnis als String formatieren
-            if result.empty:
-                return "Keine Daten gefunden."
+            # Nur die Tabellen, die die Query referenziert, werden geladen und geprüft
+            tables = catalog.referenced_tables(query)
+            metrics["tables"] = tables
             
-            # Für kleine Ergebnisse: vollständige Ausgabe
-            if len(result) <= 20 and len(result.columns) <= 10:
-                return result.to_string(index=False)
+            # Wiederholte Queries auf unverändertem Datenstand kommen direkt aus dem Cache
+            cache_key = cache.make_key(query, catalog.data_version(tables))
+            metrics["ingest_ms"] = (time.perf_counter() - started) * 1000
+            cached = cache.get(cache_key)
+            if cached is not None:
+                metrics["cache_hit"] = True
+                self._count_result_tokens(metrics, cached)
+                return cached
             
-            # Für große Ergebnisse: Zusammenfassung
-            summary = f"Query erfolgreich ausgeführt. {len(result)} Zeilen, {len(result.columns)} Spalten.\n"
-            summary += f"Spalten: {', '.join(result.columns)}\n\n"
-            summary += "Erste 10 Zeilen:\n"
-            summary += result.head(10).to_string(index=False)
+            # Query auf dem prozessweiten Katalog ausführen - CSV-Dateien werden
+            # nur beim ersten Zugriff bzw. nach einer Dateiänderung neu geladen.
+            # Behalten werden nur die Zeilen, die auch ausgegeben werden; Zeilenzahl,
+            # Kennzahlen über alle Zeilen (kompaktes Format) und Profil stammen aus derselben Ausführung.
+            summary = {} if RESULT_FORMAT == "compact" else None
+            profile = {} if self.profiling else None
+            columns, rows, total_rows = catalog.query_preview(
+                query, FULL_RESULT_MAX_ROWS, tables, interrupt, metrics, summary, profile
+            )
+            metrics["rows_returned"] = total_rows
+            self._attach_profile(metrics, profile)
             
-            if len(result) > 10:
-                summary += f"\n\n... und {len(result) - 10} weitere Zeilen"
-                
-            return summary
+            format_started = time.perf_counter()
+            formatted = self._format_result(columns, rows, total_rows, summary)
+            metrics["format_ms"] = (time.perf_counter() - format_started) * 1000
+            self._count_result_tokens(metrics, formatted)
+            cache.put(cache_key, formatted)
+            return formatted
             
         except Exception as e:
+            metrics["error"] = str(e)
             return f"Fehler beim Ausführen der Query: {str(e)}"
+        finally:
+            self._record_metrics(metrics, started)
+    
+    def query_df(self, query: str, interrupt: Optional[QueryInterrupt] = None) -> pd.DataFrame:
+        """
+        Führt eine Query aus und gibt das vollständige Ergebnis als DataFrame zurück.
+        Gedacht für kleine, aggregierte Ergebnisse, die programmatisch weiterverarbeitet werden.
+        """
+        metrics = new_metrics(query)
+        started = time.perf_counter()
+        try:
+            catalog = self._get_catalog()
+            cache = self._get_query_cache()
+            tables = catalog.referenced_tables(query)
+            metrics["tables"] = tables
+            
+            # Eigener Schlüsselraum, damit DataFrames und formatierte Texte sich nicht überschneiden
+            cache_key = cache.make_key(query, ("dataframe", catalog.data_version(tables)))
+            metrics["ingest_ms"] = (time.perf_counter() - started) * 1000
+            cached = cache.get(cache_key)
+            metrics["cache_hit"] = cached is not None
+            if cached is None:
+                execute_started = time.perf_counter()
+                profile = {} if self.profiling else None
+                cached = catalog.query_df(query, tables, interrupt or QueryInterrupt(self.query_timeout), profile)
+                metrics["execute_ms"] = (time.perf_counter() - execute_started) * 1000
+                cache.put(cache_key, cached)
+                self._attach_profile(metrics, profile)
+            metrics["rows_returned"] = len(cached)
+            return cached.copy()
+        except Exception as e:
+            metrics["error"] = str(e)
+            raise
+        finally:
+            self._record_metrics(metrics, started)
+    
+    @staticmethod
+    def _attach_profile(metrics: QueryMetrics, profile: Optional[Dict[str, Any]]) -> None:
+        """Ergänzt die Metriken um das Profil der Ausführung (falls Profiling aktiv war)"""
+        if profile:
+            metrics["profile"] = profile
+            metrics["rows_scanned"] = rows_scanned(profile)
+    
+    @staticmethod
+    def _count_result_tokens(metrics: QueryMetrics, result: str) -> None:
+        """Tokens des Ergebnisses, nur wenn Metriken überhaupt gespeichert werden"""
+        if get_metrics_store().enabled:
+            metrics["result_tokens"] = count_tokens(result)
+    
+    @staticmethod
+    def _record_metrics(metrics: QueryMetrics, started: float) -> None:
+        metrics["total_ms"] = (time.perf_counter() - started) * 1000
+        for key in ("ingest_ms", "execute_ms", "fetch_ms", "format_ms", "total_ms"):
+            metrics[key] = round(metrics[key], 3)
+        get_metrics_store().record(metrics)
+    
+    @classmethod
+    def format_frame(cls, frame: pd.DataFrame) -> str:
+        """Formatiert einen DataFrame genauso wie ein Ergebnis von _run"""
+        rows = list(frame.itertuples(index=False, name=None))
+        summary = None
+        if RESULT_FORMAT == "compact" and len(rows) > FULL_RESULT_MAX_ROWS:
+            summary = result_format.summarize_frame(frame)
+        return cls._format_result(list(frame.columns), rows[:FULL_RESULT_MAX_ROWS], len(rows), summary)
+    
+    @staticmethod
+    def _format_result(columns: List[str], rows: List[tuple], total_rows: int,
+                       summary: Optional[Dict[str, Dict[str, Any]]] = None) -> str:
+        """Formatiert ein Query-Ergebnis (Vorschauzeilen + Gesamtzahl) als Text für das LLM"""
+        if total_rows == 0:
+            return "Keine Daten gefunden."
+        
+        if RESULT_FORMAT == "compact":
+            shown = rows if total_rows <= FULL_RESULT_MAX_ROWS else rows[:PREVIEW_ROWS]
+            return result_format.compact_table(columns, shown, total_rows, summary)
+        
+        preview = pd.DataFrame.from_records(rows, columns=columns)
+        
+        # Für kleine Ergebnisse: vollständige Ausgabe
+        if total_rows <= FULL_RESULT_MAX_ROWS and len(columns) <= 10:
+            return preview.to_string(index=False)
+        
+        # Für große Ergebnisse: Zusammenfassung
+        summary = f"Query erfolgreich ausgeführt. {total_rows} Zeilen, {len(columns)} Spalten.\n"
+        summary += f"Spalten: {', '.join(columns)}\n\n"
+        summary += f"Erste {PREVIEW_ROWS} Zeilen:\n"
+        summary += preview.head(PREVIEW_ROWS).to_string(index=False)
+        
+        if total_rows > PREVIEW_ROWS:
+            summary += f"\n\n... und {total_rows - PREVIEW_ROWS} weitere Zeilen"
+            
+        return summary
+    
+    def stream(self, query: str, vectors_per_batch: int = 1) -> Iterator[pd.DataFrame]:
+        """
+        Streamt das vollständige Ergebnis einer Query als DataFrame-Batches
+        für Aufrufer, die wirklich alle Zeilen benötigen (ohne Cache)
+        """
+        return self._get_catalog().stream_batches(query, vectors_per_batch)
     
     async def _arun(self, query: str) -> str:
-        """Async-Version des Tools"""
-        return self._run(query) 
\ No newline at end of file
+        """
+        Async-Version des Tools: Die Query läuft im DuckDB-Thread-Pool, der Event-Loop
+        bleibt frei. Wird der wartende Task gecancelt, wird die Query per interrupt() abgebrochen.
+        """
+        return await self._in_executor(self._execute, query)
+    
+    async def aquery_df(self, query: str) -> pd.DataFrame:
+        """Async-Version von query_df (siehe _arun)"""
+        return await self._in_executor(self.query_df, query)
+    
+    async def _in_executor(self, func: Callable[..., Any], query: str) -> Any:
+        interrupt = QueryInterrupt(self.query_timeout)
+        # Kontext mitgeben, damit die Metriken dem aufrufenden Workflow zugeordnet werden
+        context = contextvars.copy_context()
+        future = _get_query_executor().submit(context.run, func, query, interrupt)
+        result = asyncio.wrap_future(future)
+        try:
+            return await asyncio.shield(result)
+        except asyncio.CancelledError:
+            # Noch wartende Queries entfallen, laufende werden abgebrochen. Erst wenn die
+            # Query beendet und ihr Cursor zurück im Pool ist, wird der Abbruch weitergegeben.
+            interrupt.interrupt()
+            future.cancel()
+            await asyncio.gather(result, return_exceptions=True)
+            raise
@@ -0,0 +1,126 @@
+"""
+Abfragen auf den KPI-Rollup-Cube mit Fallback auf die Faktentabelle paid_sales
+"""
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Dimensionen des Cubes (Spalten von kpi_cube) und ihre Entsprechung in paid_sales
+CUBE_DIMENSIONS = {
+    "date": "order_date",
+    "acquisition_channel": "acquisition_channel",
+    "category": "category",
+    "country": "country",
+}
+
+# Additive Kennzahlen: Name -> (Ausdruck auf kpi_cube, Ausdruck auf paid_sales).
+# {filter} nimmt eine optionale FILTER-Klausel des Aggregats auf.
+CUBE_MEASURES = {
+    "revenue": ("SUM(revenue){filter}", "SUM(line_revenue){filter}"),
+    "cogs": ("SUM(cogs){filter}", "SUM(line_cogs){filter}"),
+    "quantity": ("CAST(SUM(quantity){filter} AS BIGINT)", "SUM(quantity){filter}"),
+    "order_items": ("CAST(SUM(order_items){filter} AS BIGINT)", "COUNT(*){filter}"),
+    # Bestellungen können mehrere Kategorien enthalten: ohne Gruppierung oder Filter nach
+    # Kategorie zählt jede Bestellung nur in ihrer Primärkategorie (siehe kpi_cube)
+    "orders": ("CAST(SUM({orders_column}){filter} AS BIGINT)", "COUNT(DISTINCT order_id){filter}"),
+}
+
+
+def sql_literal(value: Any) -> str:
+    """SQL-Literal für Filterwerte (Strings und Datumswerte werden gequotet)"""
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, date):
+        return f"DATE '{value.isoformat()}'"
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _is_value_list(value: Any) -> bool:
+    return isinstance(value, (list, tuple, set))
+
+
+def uses_cube(dimensions: Iterable[str] = (), filters: Optional[Dict[str, Any]] = None) -> bool:
+    """
+    Der Cube kann antworten, wenn alle Gruppierungen und Filter auf Cube-Dimensionen liegen.
+    Ein Filter auf mehrere Kategorien geht an paid_sales: Bestellungen mit mehreren dieser
+    Kategorien ließen sich aus den Cube-Zeilen nicht ohne Doppelzählung zusammenfassen.
+    """
+    filters = dict(filters or {})
+    category = filters.get("category")
+    if _is_value_list(category) and len(category) != 1:
+        return False
+    return all(name in CUBE_DIMENSIONS for name in list(dimensions) + list(filters))
+
+
+def dimension_column(name: str, on_cube: bool) -> str:
+    """Spalte einer Dimension im Cube bzw. in paid_sales"""
+    return name if on_cube else CUBE_DIMENSIONS.get(name, name)
+
+
+def measure_expression(name: str, on_cube: bool, dimensions: Iterable[str],
+                       condition: Optional[str] = None, filters: Iterable[str] = ()) -> str:
+    """
+    Aggregat-Ausdruck einer Kennzahl, optional nur über Zeilen, die `condition` erfüllen;
+    `filters` sind die Dimensionen, nach denen die Zeilen der Kennzahl gefiltert werden
+    """
+    template = CUBE_MEASURES[name][0 if on_cube else 1]
+    orders_column = "orders" if "category" in list(dimensions) + list(filters) else "orders_primary"
+    return template.format(
+        filter=f" FILTER (WHERE {condition})" if condition else "",
+        orders_column=orders_column
+    )
+
+
+def filter_conditions(filters: Dict[str, Any], columns: Dict[str, str],
+                      date_range: Optional[Tuple[Any, Any]] = None) -> List[str]:
+    """
+    SQL-Bedingungen für `filters` (Wert oder Werteliste je Dimension) und `date_range`
+    (inklusive Grenzen, None = offen); `columns` bildet Dimensionen auf Spalten ab
+    """
+    conditions = []
+    for name, value in filters.items():
+        column = columns.get(name, name)
+        if _is_value_list(value):
+            conditions.append(f"{column} IN ({', '.join(sql_literal(v) for v in value)})")
+        else:
+            conditions.append(f"{column} = {sql_literal(value)}")
+    if date_range is not None:
+        date_column = columns.get("date", "date")
+        start, end = date_range
+        if start is not None:
+            conditions.append(f"{date_column} >= {sql_literal(start)}")
+        if end is not None:
+            conditions.append(f"{date_column} <= {sql_literal(end)}")
+    return conditions
+
+
+def rollup_query(measures: Iterable[str], dimensions: Iterable[str] = (),
+                 filters: Optional[Dict[str, Any]] = None,
+                 date_range: Optional[Tuple[Any, Any]] = None) -> str:
+    """
+    Erzeugt die SQL-Query für additive Verkaufskennzahlen (siehe CUBE_MEASURES), gruppiert
+    nach `dimensions` und gefiltert nach `filters` (Wert oder Werteliste je Spalte) sowie
+    `date_range` (inklusive Grenzen, None = offen). Liegen alle Gruppierungen und Filter auf
+    Cube-Dimensionen, liest die Query aus kpi_cube, sonst aus paid_sales.
+    """
+    dimensions = list(dimensions)
+    filters = dict(filters or {})
+    on_cube = uses_cube(dimensions, filters)
+    columns = {name: dimension_column(name, on_cube) for name in CUBE_DIMENSIONS}
+
+    select = [
+        name if dimension_column(name, on_cube) == name else f"{dimension_column(name, on_cube)} AS {name}"
+        for name in dimensions
+    ]
+    select += [f"{measure_expression(name, on_cube, dimensions, filters=filters)} AS {name}" for name in measures]
+
+    query = f"SELECT {', '.join(select)} FROM {'kpi_cube' if on_cube else 'paid_sales'}"
+    conditions = filter_conditions(filters, columns, date_range)
+    if conditions:
+        query += f" WHERE {' AND '.join(conditions)}"
+    if dimensions:
+        query += f" GROUP BY {', '.join(dimensions)} ORDER BY {', '.join(dimensions)}"
+    return query
@@ -0,0 +1,300 @@
+"""
+Deklaratives KPI-Register und Compiler zu einer gemeinsamen SQL-Query
+"""
+import string
+from typing import Any, Dict, Iterable, List, Optional, Tuple, TypedDict
+
+from tools import kpi_cube
+
+
+class KpiDefinition(TypedDict, total=False):
+    """
+    Definition einer KPI. `measure` ist ein SQL-Ausdruck über Basiskennzahlen in
+    geschweiften Klammern (siehe BASE_MEASURES), `filters` schränkt die Basiskennzahlen
+    dieser KPI ein (Wert oder Werteliste je Dimension) und `dimensions` sind die
+    Dimensionen, nach denen die KPI gruppiert bzw. gefiltert werden darf. `date_window`
+    nennt eine Tabelle, deren Datumsbereich (Spalte date) die Basiskennzahlen der KPI
+    begrenzt, z.B. marketing_spend für Verhältnisse zum Spend.
+    """
+    label: str
+    description: str
+    measure: str
+    filters: Dict[str, Any]
+    dimensions: List[str]
+    date_window: str
+
+
+class KpiSource(TypedDict):
+    """Tabelle, aus der Basiskennzahlen gelesen werden"""
+    table: str
+    dimensions: Dict[str, str]
+    measures: Dict[str, str]
+
+
+# Tages- und Kanal-Aggregate aus kpi_channel_daily (Spend, Traffic, Neukunden)
+CHANNEL_SOURCE: KpiSource = {
+    "table": "kpi_channel_daily",
+    "dimensions": {"date": "date", "acquisition_channel": "channel"},
+    "measures": {
+        "spend": "SUM(spend){filter}",
+        "clicks": "CAST(SUM(clicks){filter} AS BIGINT)",
+        "impressions": "CAST(SUM(impressions){filter} AS BIGINT)",
+        "sessions": "CAST(SUM(sessions){filter} AS BIGINT)",
+        "users": "CAST(SUM(users){filter} AS BIGINT)",
+        "transactions": "SUM(transactions){filter}",
+        "web_revenue": "SUM(web_revenue){filter}",
+        "new_customers": "CAST(SUM(new_customers){filter} AS BIGINT)",
+    },
+}
+
+# Basiskennzahl -> Quelle ("sales": kpi_cube bzw. paid_sales, "channel": CHANNEL_SOURCE)
+BASE_MEASURES = {
+    **{name: "sales" for name in kpi_cube.CUBE_MEASURES},
+    **{name: "channel" for name in CHANNEL_SOURCE["measures"]},
+}
+
+# Verkaufs-KPIs lassen sich nach allen Cube-Dimensionen gruppieren, nach weiteren
+# Spalten von paid_sales nur über den (langsameren) Fallback auf die Faktentabelle
+SALES_DIMENSIONS = list(kpi_cube.CUBE_DIMENSIONS) + ["device", "payment_method", "region", "age_group"]
+CHANNEL_DIMENSIONS = list(CHANNEL_SOURCE["dimensions"])
+
+KPI_REGISTRY: Dict[str, KpiDefinition] = {
+    "revenue": {
+        "label": "Revenue",
+        "description": "SUM(order_items.(net_price + tax_amount) * quantity) für bezahlte Bestellungen",
+        "measure": "{revenue}",
+        "dimensions": SALES_DIMENSIONS,
+    },
+    "orders": {
+        "label": "Bestellungen",
+        "description": "Anzahl bezahlter Bestellungen",
+        "measure": "{orders}",
+        "dimensions": SALES_DIMENSIONS,
+    },
+    "aov": {
+        "label": "AOV (Average Order Value)",
+        "description": "Revenue / Anzahl Transaktionen für bezahlte Bestellungen",
+        "measure": "{revenue} / NULLIF({orders}, 0)",
+        "dimensions": SALES_DIMENSIONS,
+    },
+    "cogs": {
+        "label": "COGS",
+        "description": "SUM(products.unit_cost * quantity) für bezahlte Bestellungen",
+        "measure": "{cogs}",
+        "dimensions": SALES_DIMENSIONS,
+    },
+    "gross_margin_percent": {
+        "label": "Gross Margin",
+        "description": "(Revenue - COGS) / Revenue in Prozent",
+        "measure": "({revenue} - {cogs}) / NULLIF({revenue}, 0) * 100",
+        "dimensions": SALES_DIMENSIONS,
+    },
+    "spend": {
+        "label": "Marketing Spend",
+        "description": "SUM(marketing_spend.spend)",
+        "measure": "{spend}",
+        "dimensions": CHANNEL_DIMENSIONS,
+    },
+    "roas": {
+        "label": "ROAS (Return on Ad Spend)",
+        "description": "Revenue / Marketing Spend nach Kanal im Zeitraum der Spend-Daten",
+        "measure": "{revenue} / NULLIF({spend}, 0)",
+        "dimensions": CHANNEL_DIMENSIONS,
+        "date_window": "marketing_spend",
+    },
+    "cac": {
+        "label": "CAC (Customer Acquisition Cost)",
+        "description": "Marketing Spend / Neue Kunden nach Kanal im Zeitraum der Spend-Daten",
+        "measure": "{spend} / NULLIF({new_customers}, 0)",
+        "dimensions": CHANNEL_DIMENSIONS,
+        "date_window": "marketing_spend",
+    },
+    "conversion_rate": {
+        "label": "Conversion Rate",
+        "description": "Transaktionen / Sessions (aus Web Analytics) im Zeitraum der Spend-Daten",
+        "measure": "{transactions} / NULLIF({sessions}, 0)",
+        "dimensions": CHANNEL_DIMENSIONS,
+        "date_window": "marketing_spend",
+    },
+}
+
+
+def describe_kpis(registry: Optional[Dict[str, KpiDefinition]] = None) -> str:
+    """Beschreibung aller KPIs als Aufzählung für System-Prompts"""
+    registry = KPI_REGISTRY if registry is None else registry
+    return "\n".join(f"- {kpi['label']}: {kpi['description']}" for kpi in registry.values())
+
+
+def kpi_tables(kpis: Iterable[str], dimensions: Iterable[str] = (),
+               registry: Optional[Dict[str, KpiDefinition]] = None) -> List[str]:
+    """Tabellen, die compile_kpis für `kpis` nach `dimensions` liest"""
+    registry = KPI_REGISTRY if registry is None else registry
+    kpis = list(kpis)
+    dimensions = list(dimensions)
+    sources = {
+        BASE_MEASURES[base_name]
+        for kpi_name in kpis
+        for base_name in _measure_references(registry[kpi_name]["measure"])
+    }
+    tables = []
+    if "sales" in sources:
+        kpi_filters = {
+            name: value for kpi_name in kpis for name, value in registry[kpi_name].get("filters", {}).items()
+        }
+        tables.append("kpi_cube" if kpi_cube.uses_cube(dimensions, kpi_filters) else "paid_sales")
+    if "channel" in sources:
+        tables.append(CHANNEL_SOURCE["table"])
+    windows = dict.fromkeys(registry[kpi_name]["date_window"] for kpi_name in kpis if "date_window" in registry[kpi_name])
+    tables += [table for table in windows if table not in tables]
+    return tables
+
+
+def _filter_key(filters: Dict[str, Any]) -> Tuple:
+    return tuple(sorted(
+        (name, tuple(value) if isinstance(value, (list, tuple, set)) else value)
+        for name, value in filters.items()
+    ))
+
+
+def _window_condition(table: str, date_column: str) -> str:
+    """Bedingung: Datum innerhalb des Datumsbereichs von `table`"""
+    return f"{date_column} BETWEEN (SELECT MIN(date) FROM {table}) AND (SELECT MAX(date) FROM {table})"
+
+
+def _source_query(source: str, measures: Dict[str, Tuple[str, Dict[str, Any], Optional[str]]],
+                  dimensions: List[str], filters: Dict[str, Any],
+                  date_range: Optional[Tuple[Any, Any]], with_totals: bool) -> str:
+    """SELECT für die Basiskennzahlen (Alias -> (Name, Filter, Datumsfenster)) einer Quelle"""
+    if source == "sales":
+        measure_filters = {
+            name: value for _, kpi_filters, _ in measures.values() for name, value in kpi_filters.items()
+        }
+        on_cube = kpi_cube.uses_cube(dimensions, {**measure_filters, **filters})
+        table = "kpi_cube" if on_cube else "paid_sales"
+        columns = {name: kpi_cube.dimension_column(name, on_cube) for name in set(SALES_DIMENSIONS) | {"date"}}
+    else:
+        on_cube = True
+        table = CHANNEL_SOURCE["table"]
+        columns = CHANNEL_SOURCE["dimensions"]
+
+    select = [f"{columns[name]} AS {name}" if columns[name] != name else name for name in dimensions]
+    group_columns = ", ".join(columns[name] for name in dimensions)
+    if with_totals:
+        select.append(f"GROUPING({group_columns}) AS grouping_level")
+    for alias, (name, kpi_filters, date_window) in measures.items():
+        conditions = kpi_cube.filter_conditions(kpi_filters, columns)
+        if date_window:
+            conditions.append(_window_condition(date_window, columns["date"]))
+        condition = " AND ".join(conditions) or None
+        if source == "sales":
+            expression = kpi_cube.measure_expression(
+                name, on_cube, dimensions, condition, list(filters) + list(kpi_filters)
+            )
+        else:
+            expression = CHANNEL_SOURCE["measures"][name].format(
+                filter=f" FILTER (WHERE {condition})" if condition else ""
+            )
+        select.append(f"{expression} AS {alias}")
+
+    query = f"SELECT {', '.join(select)} FROM {table}"
+    conditions = kpi_cube.filter_conditions(filters, columns, date_range)
+    if conditions:
+        query += f" WHERE {' AND '.join(conditions)}"
+    if dimensions:
+        query += f" GROUP BY GROUPING SETS (({group_columns}), ())" if with_totals else f" GROUP BY {group_columns}"
+    return query
+
+
+def compile_kpis(kpis: Iterable[str], dimensions: Iterable[str] = (),
+                 filters: Optional[Dict[str, Any]] = None,
+                 date_range: Optional[Tuple[Any, Any]] = None,
+                 with_totals: bool = False,
+                 order_by: Optional[str] = None,
+                 registry: Optional[Dict[str, KpiDefinition]] = None) -> str:
+    """
+    Übersetzt die angefragten KPIs in eine einzige SQL-Query. Basiskennzahlen, die mehrere
+    KPIs brauchen (z.B. revenue für Revenue, AOV, ROAS und Gross Margin), werden nur einmal
+    aggregiert; jede Quelle wird genau einmal gelesen und die Quellen über die Dimensionen
+    verbunden. Mit `with_totals` enthält das Ergebnis zusätzlich eine Gesamtzeile
+    (grouping_level > 0). Ungültige KPIs oder Dimensionen führen zu einem ValueError.
+    """
+    registry = KPI_REGISTRY if registry is None else registry
+    kpis = list(kpis)
+    dimensions = list(dimensions)
+    filters = dict(filters or {})
+    with_totals = with_totals and bool(dimensions)
+
+    # Alias je (Basiskennzahl, KPI-Filter, Datumsfenster), gruppiert nach Quelle
+    source_measures: Dict[str, Dict[str, Tuple[str, Dict[str, Any], Optional[str]]]] = {}
+    aliases: Dict[Tuple[str, Tuple], str] = {}
+    kpi_expressions = []
+    for kpi_name in kpis:
+        if kpi_name not in registry:
+            raise ValueError(f"Unbekannte KPI: {kpi_name}")
+        kpi = registry[kpi_name]
+        allowed = kpi.get("dimensions", [])
+        invalid = [name for name in dimensions + list(filters) if name not in allowed]
+        if invalid:
+            raise ValueError(f"KPI {kpi_name} unterstützt die Dimensionen {', '.join(invalid)} nicht")
+
+        kpi_filters = kpi.get("filters", {})
+        date_window = kpi.get("date_window")
+        references = {}
+        for base_name in _measure_references(kpi["measure"]):
+            source = BASE_MEASURES[base_name]
+            key = (base_name, _filter_key(kpi_filters), date_window)
+            if key not in aliases:
+                aliases[key] = base_name if not (kpi_filters or date_window) else f"{base_name}_{kpi_name}"
+                source_measures.setdefault(source, {})[aliases[key]] = (base_name, kpi_filters, date_window)
+            references[base_name] = (source, aliases[key])
+        kpi_expressions.append((kpi_name, kpi["measure"], references))
+
+    sources = list(source_measures)
+    ctes = [
+        f"{source} AS ({_source_query(source, measures, dimensions, filters, date_range, with_totals)})"
+        for source, measures in source_measures.items()
+    ]
+
+    # Dimensionen (und Gesamtzeilen-Kennung) aus der ersten Quelle, die eine Zeile hat
+    keys = dimensions + (["grouping_level"] if with_totals else [])
+    select = [f"{_coalesce(sources, name)} AS {name}" for name in keys]
+    for kpi_name, measure, references in kpi_expressions:
+        # Basiskennzahlen sind additiv: fehlt eine Zeile in einer Quelle, ist ihr Wert 0
+        columns = {
+            base_name: f"COALESCE({source}.{alias}, 0)" if len(sources) > 1 else f"{source}.{alias}"
+            for base_name, (source, alias) in references.items()
+        }
+        select.append(f"{measure.format(**columns)} AS {kpi_name}")
+    query = f"WITH {', '.join(ctes)} SELECT {', '.join(select)} FROM {sources[0]}"
+    for position, source in enumerate(sources[1:], start=1):
+        if keys:
+            # NULL-Dimensionen (z.B. Kunden ohne Kanal) sollen sich ebenfalls treffen
+            condition = " AND ".join(
+                f"{_coalesce(sources[:position], name)} IS NOT DISTINCT FROM {source}.{name}" for name in keys
+            )
+            query += f" FULL OUTER JOIN {source} ON {condition}"
+        else:
+            query += f" CROSS JOIN {source}"
+
+    order = (["grouping_level"] if with_totals else []) + ([order_by] if order_by else []) + dimensions
+    if order:
+        query += f" ORDER BY {', '.join(order)}"
+    return query
+
+
+def _coalesce(sources: List[str], column: str) -> str:
+    references = [f"{source}.{column}" for source in sources]
+    return references[0] if len(references) == 1 else f"COALESCE({', '.join(references)})"
+
+
+def _measure_references(measure: str) -> List[str]:
+    """Basiskennzahlen, die ein KPI-Ausdruck in geschweiften Klammern referenziert"""
+    references = []
+    for _, field_name, _, _ in string.Formatter().parse(measure):
+        if field_name is None:
+            continue
+        if field_name not in BASE_MEASURES:
+            raise ValueError(f"Unbekannte Basiskennzahl in KPI-Ausdruck: {field_name}")
+        if field_name not in references:
+            references.append(field_name)
+    return references
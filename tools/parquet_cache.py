@@ -0,0 +1,104 @@
+"""
+Parquet-Cache für die CSV-Quelldateien
+"""
+import glob
+import hashlib
+import os
+import shutil
+
+import duckdb
+
+from config import PARQUET_CACHE_DIR
+
+
+class ParquetCache:
+    """Konvertiert CSV-Dateien einmalig in typisierte Parquet-Dateien (Schlüssel: Inhalts-Hash)"""
+
+    def __init__(self, cache_dir: str = PARQUET_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    @staticmethod
+    def content_hash(file_path: str, chunk_size: int = 1 << 20) -> str:
+        """SHA-256 über den Dateiinhalt, blockweise gelesen"""
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def source_dir(self, csv_path: str) -> str:
+        """
+        Cache-Verzeichnis einer Quelldatei (Schlüssel: Hash ihres absoluten Pfads). Prozesse auf
+        verschiedenen Datenbeständen (DATA_PATH) teilen sich PARQUET_CACHE_DIR, räumen beim
+        Aufräumen veralteter Kopien aber nur ihre eigenen Dateien ab.
+        """
+        path_hash = hashlib.sha256(os.path.abspath(csv_path).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, path_hash[:16])
+
+    def parquet_path(self, table_name: str, csv_path: str, digest: str) -> str:
+        """Pfad der Parquet-Datei für einen bestimmten CSV-Inhalt"""
+        return os.path.join(self.source_dir(csv_path), f"{table_name}-{digest[:16]}.parquet")
+
+    def partition_dir(self, table_name: str, csv_path: str, digest: str) -> str:
+        """Verzeichnis der nach Jahr/Monat partitionierten Kopie für einen bestimmten CSV-Inhalt"""
+        return os.path.join(self.source_dir(csv_path), f"{table_name}-{digest[:16]}.partitioned")
+
+    def ensure(self, conn: duckdb.DuckDBPyConnection, table_name: str, csv_path: str) -> str:
+        """
+        Gibt den Pfad der aktuellen Parquet-Datei zurück und erstellt sie bei Bedarf.
+        Veraltete Einträge derselben Quelldatei werden dabei entfernt.
+        """
+        target = self.parquet_path(table_name, csv_path, self.content_hash(csv_path))
+        if os.path.exists(target):
+            return target
+
+        os.makedirs(self.source_dir(csv_path), exist_ok=True)
+        # Erst in eine temporäre Datei schreiben, damit parallele Leser nie eine halbe Datei sehen
+        tmp_path = f"{target}.{os.getpid()}.tmp"
+        conn.execute(f"""
+            COPY (SELECT * FROM read_csv_auto('{csv_path}'))
+            TO '{tmp_path}' (FORMAT PARQUET, COMPRESSION ZSTD)
+        """)
+        os.replace(tmp_path, target)
+
+        for stale_path in glob.glob(os.path.join(self.source_dir(csv_path), f"{table_name}-*.parquet")):
+            if stale_path != target:
+                try:
+                    os.remove(stale_path)
+                except OSError:
+                    pass
+
+        return target
+
+    def ensure_partitioned(self, conn: duckdb.DuckDBPyConnection, table_name: str,
+                           csv_path: str, date_column: str) -> str:
+        """
+        Gibt das Verzeichnis einer hive-partitionierten Kopie (year=JJJJ/month=M/*.parquet)
+        zurück und erstellt sie bei Bedarf. Jede Datei enthält nur einen Monat, sodass
+        DuckDB bei Datumsfiltern alle anderen Dateien anhand ihrer Min/Max-Statistik überspringt.
+        """
+        target = self.partition_dir(table_name, csv_path, self.content_hash(csv_path))
+        if os.path.exists(target):
+            return target
+
+        os.makedirs(self.source_dir(csv_path), exist_ok=True)
+        tmp_dir = f"{target}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        conn.execute(f"""
+            COPY (
+                SELECT *, year({date_column}) AS year, month({date_column}) AS month
+                FROM read_csv_auto('{csv_path}')
+            )
+            TO '{tmp_dir}' (FORMAT PARQUET, PARTITION_BY (year, month), COMPRESSION ZSTD)
+        """)
+        try:
+            os.rename(tmp_dir, target)
+        except OSError:
+            # Ein paralleler Prozess hat dieselbe Kopie bereits fertig geschrieben
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        for stale_dir in glob.glob(os.path.join(self.source_dir(csv_path), f"{table_name}-*.partitioned")):
+            if stale_dir != target:
+                shutil.rmtree(stale_dir, ignore_errors=True)
+
+        return target
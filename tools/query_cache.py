@@ -0,0 +1,129 @@
+"""
+Ergebnis-Cache für SQL-Queries des DuckDB Tools
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Hashable, Optional, Tuple
+
+import duckdb
+
+from config import QUERY_CACHE_SIZE, QUERY_CACHE_TTL_SECONDS
+
+
+# String-Literale und Bezeichner in doppelten Anführungszeichen (inkl. escaptem '' bzw. "")
+_QUOTED = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")""")
+_WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+@lru_cache(maxsize=1)
+def _sql_keywords() -> FrozenSet[str]:
+    """
+    Schlüsselwörter, die kein Alias sein können (reservierte Wörter, Join-Schlüsselwörter, BY).
+    Alle anderen Wörter behalten ihre Schreibweise, da auch ungequotete Aliase wie
+    `AS Revenue` den Spaltennamen im Ergebnis bestimmen.
+    """
+    rows = duckdb.connect().execute(
+        "SELECT keyword_name FROM duckdb_keywords() WHERE keyword_category IN ('reserved', 'type_function')"
+    ).fetchall()
+    return frozenset(row[0] for row in rows) | {"by"}
+
+
+def normalize_sql(query: str) -> str:
+    """
+    Normalisiert eine SQL-Query für den Cache-Schlüssel: Whitespace wird zusammengefasst,
+    Groß-/Kleinschreibung von SQL-Schlüsselwörtern ignoriert und ein abschließendes Semikolon
+    entfernt. String-Literale und Bezeichner bleiben unverändert.
+    """
+    keywords = _sql_keywords()
+    parts = _QUOTED.split(query.strip().rstrip(";").strip())
+    normalized = []
+    for i, part in enumerate(parts):
+        if i % 2 == 1:
+            normalized.append(part)
+        else:
+            part = re.sub(r"\s+", " ", part)
+            normalized.append(_WORD.sub(
+                lambda m: m.group().lower() if m.group().lower() in keywords else m.group(), part
+            ))
+    return "".join(normalized).strip()
+
+
+class QueryResultCache:
+    """Thread-sicherer LRU-Cache mit TTL für formatierte Query-Ergebnisse"""
+
+    def __init__(self, max_entries: int = QUERY_CACHE_SIZE, ttl_seconds: float = QUERY_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def make_key(query: str, data_version: Hashable) -> Tuple[str, Hashable]:
+        """Schlüssel aus normalisierter Query und Fingerprint der zugrunde liegenden Daten"""
+        return normalize_sql(query), data_version
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Gibt ein gültiges Ergebnis zurück oder None (zählt Treffer/Fehlschläge)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if self.ttl_seconds <= 0 or time.monotonic() - stored_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Speichert ein Ergebnis und verdrängt bei Bedarf die am längsten ungenutzten Einträge"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Kennzahlen des Caches (Trefferquote, Größe, Verdrängungen)"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_query_cache: Optional[QueryResultCache] = None
+_query_cache_lock = threading.Lock()
+
+
+def get_query_cache() -> QueryResultCache:
+    """Gibt den prozessweit geteilten Ergebnis-Cache zurück"""
+    global _query_cache
+    with _query_cache_lock:
+        if _query_cache is None:
+            _query_cache = QueryResultCache()
+        return _query_cache
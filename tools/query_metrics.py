@@ -0,0 +1,125 @@
+"""
+Metriken pro Query des DuckDB Tools (Timings, Zeilen, optional Profil)
+"""
+import contextvars
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, TypedDict
+
+from config import QUERY_METRICS_MAX_RECORDS
+
+
+# Workflow, dem Queries im aktuellen Kontext zugeordnet werden (wird von der Web-API gesetzt)
+current_workflow_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "duckdb_workflow_id", default=None
+)
+
+
+class QueryMetrics(TypedDict):
+    """Messwerte einer einzelnen Query"""
+    timestamp: int
+    workflow_id: Optional[str]
+    query: str
+    tables: List[str]
+    cache_hit: bool
+    ingest_ms: float
+    execute_ms: float
+    fetch_ms: float
+    format_ms: float
+    total_ms: float
+    rows_returned: Optional[int]
+    rows_scanned: Optional[int]
+    result_tokens: Optional[int]
+    profile: Optional[Dict[str, Any]]
+    error: Optional[str]
+
+
+def new_metrics(query: str) -> QueryMetrics:
+    """Leerer Messdatensatz für eine Query im aktuellen Workflow-Kontext"""
+    return QueryMetrics(
+        timestamp=int(time.time() * 1000),
+        workflow_id=current_workflow_id.get(),
+        query=" ".join(query.split()),
+        tables=[],
+        cache_hit=False,
+        ingest_ms=0.0,
+        execute_ms=0.0,
+        fetch_ms=0.0,
+        format_ms=0.0,
+        total_ms=0.0,
+        rows_returned=None,
+        rows_scanned=None,
+        result_tokens=None,
+        profile=None,
+        error=None
+    )
+
+
+def rows_scanned(profile: Dict[str, Any]) -> int:
+    """Summiert die gescannten Zeilen aller Operatoren eines JSON-Profils von DuckDB"""
+    total = profile.get("operator_rows_scanned", 0) or 0
+    for child in profile.get("children", []):
+        total += rows_scanned(child)
+    return total
+
+
+class QueryMetricsStore:
+    """In-Process-Speicher der letzten Query-Metriken, abfragbar nach Workflow"""
+
+    def __init__(self, max_records: int = QUERY_METRICS_MAX_RECORDS):
+        self.max_records = max_records
+        self._records: "deque[QueryMetrics]" = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_records > 0
+
+    def record(self, metrics: QueryMetrics) -> None:
+        with self._lock:
+            self._records.append(metrics)
+
+    def query(self, workflow_id: Optional[str] = None, since: Optional[int] = None,
+              limit: Optional[int] = None) -> List[QueryMetrics]:
+        """Gibt Metriken gefiltert nach Workflow und Zeitpunkt (ms) zurück, älteste zuerst"""
+        with self._lock:
+            records = [
+                dict(record) for record in self._records
+                if (workflow_id is None or record["workflow_id"] == workflow_id)
+                and (since is None or record["timestamp"] >= since)
+            ]
+        return records[-limit:] if limit else records
+
+    def summary(self, workflow_id: Optional[str] = None) -> Dict[str, Any]:
+        """Aggregierte Kennzahlen über alle (bzw. die Queries eines Workflows)"""
+        records = self.query(workflow_id)
+        return {
+            "queries": len(records),
+            "cache_hits": sum(1 for r in records if r["cache_hit"]),
+            "errors": sum(1 for r in records if r["error"]),
+            "ingest_ms": round(sum(r["ingest_ms"] for r in records), 3),
+            "execute_ms": round(sum(r["execute_ms"] for r in records), 3),
+            "fetch_ms": round(sum(r["fetch_ms"] for r in records), 3),
+            "format_ms": round(sum(r["format_ms"] for r in records), 3),
+            "total_ms": round(sum(r["total_ms"] for r in records), 3),
+            "rows_returned": sum(r["rows_returned"] or 0 for r in records),
+            "result_tokens": sum(r["result_tokens"] or 0 for r in records),
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._records.clear()
+
+
+_metrics_store: Optional[QueryMetricsStore] = None
+_metrics_store_lock = threading.Lock()
+
+
+def get_metrics_store() -> QueryMetricsStore:
+    """Gibt den prozessweit geteilten Metrik-Speicher zurück"""
+    global _metrics_store
+    with _metrics_store_lock:
+        if _metrics_store is None:
+            _metrics_store = QueryMetricsStore()
+        return _metrics_store
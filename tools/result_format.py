@@ -0,0 +1,185 @@
+"""
+Kompakte, tokensparende Serialisierung von Query-Ergebnissen für LLM-Prompts
+"""
+import csv
+import io
+import math
+import numbers
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence
+
+import pandas as pd
+
+from config import RESULT_DECIMALS
+
+# Kennzahlen der Zusammenfassung für numerische Spalten (Reihenfolge in der Ausgabe)
+SUMMARY_STATS = ("sum", "min", "max", "avg")
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (numbers.Number, Decimal)) and not isinstance(value, bool)
+
+
+def value_type(value: Any) -> str:
+    """Kurzer Typname eines Werts für den Spalten-Header"""
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, numbers.Integral):
+        return "int"
+    if _is_number(value):
+        return "float"
+    if isinstance(value, datetime):
+        return "datetime"
+    if isinstance(value, date):
+        return "date"
+    return "str"
+
+
+def column_types(columns: Sequence[str], rows: Sequence[tuple]) -> List[str]:
+    """Typ jeder Spalte anhand ihres ersten Werts, der nicht NULL ist"""
+    types = []
+    for index in range(len(columns)):
+        value = next((row[index] for row in rows if not _is_null(row[index])), None)
+        types.append("str" if value is None else value_type(value))
+    return types
+
+
+def numeric_columns(columns: Sequence[str], rows: Sequence[tuple]) -> List[str]:
+    """Spalten mit Zahlenwerten (Kandidaten für die Zusammenfassung)"""
+    return [
+        column for column, column_type in zip(columns, column_types(columns, rows))
+        if column_type in ("int", "float")
+    ]
+
+
+def _is_null(value: Any) -> bool:
+    if value is None or value is pd.NaT:
+        return True
+    return isinstance(value, float) and math.isnan(value)
+
+
+def format_value(value: Any, decimals: int = RESULT_DECIMALS) -> str:
+    """
+    Formatiert einen Wert möglichst kurz: ganze Zahlen ohne Nachkommastellen, Beträge
+    auf `decimals` Stellen gerundet, kleine Quoten mit `decimals` + 1 signifikanten Stellen
+    """
+    if _is_null(value):
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, numbers.Integral):
+        return str(int(value))
+    if _is_number(value):
+        number = float(value)
+        if math.isinf(number):
+            return "inf" if number > 0 else "-inf"
+        if number.is_integer():
+            return str(int(number))
+        if abs(number) >= 1:
+            return f"{number:.{decimals}f}".rstrip("0").rstrip(".")
+        return f"{number:.{decimals + 1}g}"
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def compact_table(columns: Sequence[str], rows: Sequence[tuple], total_rows: Optional[int] = None,
+                  summary: Optional[Dict[str, Dict[str, Any]]] = None,
+                  decimals: int = RESULT_DECIMALS) -> str:
+    """
+    CSV mit Typangabe im Header (spalte:typ), gerundeten Zahlen und ohne Auffüllung.
+    Sind nicht alle `total_rows` Zeilen enthalten, folgt ein Hinweis; `summary`
+    (Spalte -> sum/min/max/avg) wird als Kommentarzeilen angehängt.
+    """
+    total_rows = len(rows) if total_rows is None else total_rows
+    if total_rows == 0:
+        return "Keine Daten gefunden."
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(
+        f"{column}:{column_type}" for column, column_type in zip(columns, column_types(columns, rows))
+    )
+    writer.writerows([format_value(value, decimals) for value in row] for row in rows)
+
+    if total_rows > len(rows):
+        buffer.write(f"# {total_rows} Zeilen, erste {len(rows)} gezeigt\n")
+    for column, stats in (summary or {}).items():
+        values = ", ".join(f"{name}={format_value(stats.get(name), decimals)}" for name in SUMMARY_STATS)
+        buffer.write(f"# {column}: {values}\n")
+    return buffer.getvalue().rstrip("\n")
+
+
+class RunningSummary:
+    """
+    Summe, Minimum, Maximum und Mittelwert der numerischen Spalten, blockweise aus den
+    DataFrame-Blöcken fortgeschrieben, während ein Ergebnis abgeholt wird. Welche Spalten
+    numerisch sind, bestimmen die Beispielzeilen `rows`; NULL-Werte werden wie in SQL ignoriert.
+    """
+
+    def __init__(self, columns: Sequence[str], rows: Sequence[tuple]):
+        numeric = set(numeric_columns(columns, rows))
+        self._indices = {column: index for index, column in enumerate(columns) if column in numeric}
+        self._stats = {column: {"sum": 0, "min": None, "max": None, "count": 0} for column in self._indices}
+
+    def update(self, frame: pd.DataFrame) -> None:
+        for column, index in self._indices.items():
+            values = frame.iloc[:, index]
+            count = int(values.count())
+            if not count:
+                continue
+            stats = self._stats[column]
+            low, high = values.min().item(), values.max().item()
+            stats["sum"] += values.sum().item()
+            stats["min"] = low if stats["min"] is None else min(stats["min"], low)
+            stats["max"] = high if stats["max"] is None else max(stats["max"], high)
+            stats["count"] += count
+
+    def result(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            column: {
+                "sum": stats["sum"] if stats["count"] else None,
+                "min": stats["min"],
+                "max": stats["max"],
+                "avg": stats["sum"] / stats["count"] if stats["count"] else None,
+            }
+            for column, stats in self._stats.items()
+        }
+
+
+def summarize_frame(frame: pd.DataFrame, columns: Optional[Sequence[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """Summe, Minimum, Maximum und Mittelwert numerischer Spalten eines DataFrames"""
+    rows = list(frame.itertuples(index=False, name=None))
+    columns = numeric_columns(list(frame.columns), rows) if columns is None else columns
+    return {
+        column: {
+            "sum": frame[column].sum(),
+            "min": frame[column].min(),
+            "max": frame[column].max(),
+            "avg": frame[column].mean(),
+        }
+        for column in columns
+    }
+
+
+def compact_frame(frame: pd.DataFrame, top_k: Optional[int] = None, sort_by: Optional[str] = None,
+                  ascending: bool = False, with_summary: Optional[bool] = None,
+                  decimals: int = RESULT_DECIMALS) -> str:
+    """
+    Serialisiert einen DataFrame kompakt. Mit `top_k` werden nur die ersten k Zeilen
+    (optional nach `sort_by` sortiert) ausgegeben; die Zusammenfassung über alle Zeilen
+    wird standardmäßig genau dann angehängt, wenn Zeilen weggelassen wurden.
+    """
+    if sort_by is not None:
+        frame = frame.sort_values(sort_by, ascending=ascending)
+    shown = frame if top_k is None else frame.head(top_k)
+    if with_summary is None:
+        with_summary = len(shown) < len(frame)
+    return compact_table(
+        list(frame.columns),
+        list(shown.itertuples(index=False, name=None)),
+        len(frame),
+        summarize_frame(frame) if with_summary else None,
+        decimals
+    )
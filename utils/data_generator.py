@@ -0,0 +1,279 @@
+"""
+Synthetischer Datengenerator im Schema von show_case_data für Skalierungstests
+
+Beispiel:
+    python -m utils.data_generator --scale 100 --output data_sf100
+    DATA_PATH=data_sf100 python main.py
+"""
+import argparse
+import os
+import time
+from datetime import date
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+# Verteilungen angelehnt an die mitgelieferten show_case_data
+ACQUISITION_CHANNELS = {
+    "Organic": 0.28, "Paid Search": 0.22, "Paid Social": 0.17,
+    "Direct": 0.13, "Email": 0.13, "Referral": 0.07
+}
+COUNTRIES = {"DE": 0.70, "NL": 0.125, "CH": 0.09, "AT": 0.085}
+DE_REGIONS = ["BW", "BY", "BE", "HH", "HE", "NI", "NRW", "RP", "SH", "SN", "ST"]
+AGE_GROUPS = {"18-24": 0.10, "25-34": 0.31, "35-44": 0.32, "45-54": 0.18, "55+": 0.09}
+ORDER_STATUS = {"paid": 0.755, "cancelled": 0.088, "pending": 0.086, "returned": 0.071}
+PAYMENT_METHODS = {"Credit Card": 0.56, "PayPal": 0.29, "Bank Transfer": 0.107, "Invoice": 0.043}
+DEVICES = {"Desktop": 0.52, "Mobile": 0.437, "Tablet": 0.043}
+DISCOUNT_RATES = {0.0: 0.49, 0.05: 0.17, 0.1: 0.17, 0.15: 0.17}
+CATEGORIES = ["Books", "Electronics", "Apparel", "Home", "Beauty"]
+TAX_RATE = 0.19
+# Tagesbudget und Klicks pro Euro je Marketing-Kanal bei Skalierungsfaktor 1
+MARKETING_CHANNELS = {
+    "Paid Search": (1200.0, 0.67), "Paid Social": (815.0, 0.66), "Display": (400.0, 0.69),
+    "Affiliate": (290.0, 0.70), "Email": (155.0, 0.61), "Organic": (0.0, 0.0)
+}
+# Tägliche Sessions je Akquisitionskanal bei Skalierungsfaktor 1
+SESSIONS_PER_DAY = {
+    "Organic": 2050, "Paid Search": 2420, "Paid Social": 1700,
+    "Direct": 1515, "Email": 856, "Referral": 620
+}
+
+# Basisgrößen bei Skalierungsfaktor 1 (entspricht show_case_data)
+BASE_CUSTOMERS = 400
+BASE_ORDERS = 1200
+BASE_PRODUCTS = 50
+
+
+class SyntheticDataGenerator:
+    """
+    Erzeugt deterministisch (Seed) schema-kompatible CSV-Dateien in beliebiger Größe.
+    Bestellungen und Positionen werden vektorisiert in Blöcken geschrieben, sodass der
+    Speicherbedarf nur von der Blockgröße abhängt. Referentielle Integrität bleibt erhalten:
+    jede Bestellung gehört zu einem existierenden Kunden (nach dessen Signup), jede Position
+    zu einer Bestellung und einem Produkt; web_analytics_daily aggregiert die bezahlten Bestellungen.
+    """
+
+    def __init__(self, scale: float = 1.0, seed: int = 42, chunk_size: int = 1_000_000,
+                 start_date: str = "2025-08-01", end_date: str = "2025-11-30"):
+        if scale <= 0:
+            raise ValueError("Skalierungsfaktor muss größer als 0 sein")
+        self.scale = scale
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.start_day = np.datetime64(date.fromisoformat(start_date), "D")
+        self.end_day = np.datetime64(date.fromisoformat(end_date), "D")
+        self.num_days = int((self.end_day - self.start_day).astype(int)) + 1
+
+        self.num_customers = max(1, int(round(BASE_CUSTOMERS * scale)))
+        self.num_orders = max(1, int(round(BASE_ORDERS * scale)))
+        # Das Sortiment wächst langsamer als das Bestellvolumen
+        self.num_products = max(BASE_PRODUCTS, int(round(BASE_PRODUCTS * scale ** 0.5)))
+
+    def _rng(self, *stream: int) -> np.random.Generator:
+        """Eigener Zufallsstrom je Tabelle/Block - Ergebnis hängt nur von Seed und Blockgröße ab"""
+        return np.random.default_rng([self.seed, *stream])
+
+    @staticmethod
+    def _choice(rng: np.random.Generator, distribution: Dict, size: int) -> np.ndarray:
+        values = np.array(list(distribution.keys()), dtype=object)
+        probabilities = np.array(list(distribution.values()), dtype=float)
+        return values[rng.choice(len(values), size=size, p=probabilities / probabilities.sum())]
+
+    @staticmethod
+    def _write(frame: pd.DataFrame, path: str, first_chunk: bool) -> None:
+        frame.to_csv(path, mode="w" if first_chunk else "a", header=first_chunk, index=False)
+
+    def generate(self, output_dir: str) -> Dict[str, int]:
+        """Schreibt alle sechs Tabellen nach `output_dir` und gibt die Zeilenanzahlen zurück"""
+        os.makedirs(output_dir, exist_ok=True)
+        paths = {
+            name: os.path.join(output_dir, f"{name}.csv")
+            for name in ["customers", "orders", "order_items", "products",
+                         "marketing_spend", "web_analytics_daily"]
+        }
+
+        product_prices = self._generate_products(paths["products"])
+        customers = self._generate_customers(paths["customers"])
+        counts = self._generate_orders(paths["orders"], paths["order_items"],
+                                       paths["web_analytics_daily"], customers, product_prices)
+        counts["marketing_spend"] = self._generate_marketing_spend(paths["marketing_spend"])
+        counts["customers"] = self.num_customers
+        counts["products"] = self.num_products
+        return counts
+
+    def _generate_products(self, path: str) -> np.ndarray:
+        rng = self._rng(1)
+        unit_price = np.round(rng.uniform(10.0, 360.0, self.num_products), 2)
+        unit_cost = np.round(unit_price * rng.uniform(0.60, 0.72, self.num_products), 2)
+        self._write(pd.DataFrame({
+            "product_id": np.arange(1, self.num_products + 1),
+            "category": np.array(CATEGORIES, dtype=object)[rng.integers(0, len(CATEGORIES), self.num_products)],
+            "unit_cost": unit_cost,
+            "unit_price": unit_price
+        }), path, True)
+        return unit_price
+
+    def _generate_customers(self, path: str) -> Dict[str, np.ndarray]:
+        """Schreibt die Kunden und behält die für Bestellungen nötigen Attribute im Speicher"""
+        rng = self._rng(2)
+        n = self.num_customers
+        # Signups ab Jahresanfang bis kurz vor Ende des Bestellzeitraums
+        signup_start = np.datetime64(f"{self.start_day.astype(object).year}-01-01", "D")
+        signup_span = max(1, int((self.end_day - signup_start).astype(int)) - 14)
+        signup_date = signup_start + rng.integers(0, signup_span, n).astype("timedelta64[D]")
+        country = self._choice(rng, COUNTRIES, n)
+        region = np.where(country == "DE", np.array(DE_REGIONS, dtype=object)[rng.integers(0, len(DE_REGIONS), n)], None)
+        channel_names = list(ACQUISITION_CHANNELS)
+        channel_idx = rng.choice(len(channel_names), size=n,
+                                 p=np.array(list(ACQUISITION_CHANNELS.values())) / sum(ACQUISITION_CHANNELS.values()))
+
+        self._write(pd.DataFrame({
+            "customer_id": np.arange(1, n + 1),
+            "signup_date": signup_date,
+            "acquisition_channel": np.array(channel_names, dtype=object)[channel_idx],
+            "country": country,
+            "region": region,
+            "age_group": self._choice(rng, AGE_GROUPS, n)
+        }), path, True)
+        return {"signup_date": signup_date, "country": country, "channel_idx": channel_idx}
+
+    def _generate_orders(self, orders_path: str, items_path: str, analytics_path: str,
+                         customers: Dict[str, np.ndarray], product_prices: np.ndarray) -> Dict[str, int]:
+        """Erzeugt Bestellungen + Positionen blockweise und aggregiert die Web-Analytics-Kennzahlen"""
+        channel_names = list(ACQUISITION_CHANNELS)
+        transactions = np.zeros((self.num_days, len(channel_names)))
+        revenue = np.zeros((self.num_days, len(channel_names)))
+        discount_values = np.array(list(DISCOUNT_RATES.keys()))
+        discount_p = np.array(list(DISCOUNT_RATES.values()))
+
+        next_item_id = 1
+        for chunk_idx, chunk_start in enumerate(range(0, self.num_orders, self.chunk_size)):
+            rng = self._rng(3, chunk_idx)
+            n = min(self.chunk_size, self.num_orders - chunk_start)
+            order_id = np.arange(chunk_start + 1, chunk_start + n + 1)
+            customer_idx = rng.integers(0, self.num_customers, n)
+
+            # Bestelldatum liegt nie vor dem Signup des Kunden
+            first_day = np.maximum(customers["signup_date"][customer_idx], self.start_day)
+            span = (self.end_day - first_day).astype(int) + 1
+            order_date = first_day + np.floor(rng.random(n) * span).astype("timedelta64[D]")
+            status = self._choice(rng, ORDER_STATUS, n)
+
+            self._write(pd.DataFrame({
+                "order_id": order_id,
+                "customer_id": customer_idx + 1,
+                "order_date": order_date,
+                "order_status": status,
+                "payment_method": self._choice(rng, PAYMENT_METHODS, n),
+                "device": self._choice(rng, DEVICES, n),
+                "country": customers["country"][customer_idx]
+            }), orders_path, chunk_idx == 0)
+
+            # 1-4 Positionen pro Bestellung
+            items_per_order = rng.integers(1, 5, n)
+            item_order_idx = np.repeat(np.arange(n), items_per_order)
+            m = len(item_order_idx)
+            product_idx = rng.integers(0, self.num_products, m)
+            quantity = rng.integers(1, 4, m)
+            unit_price = product_prices[product_idx]
+            discount_rate = discount_values[rng.choice(len(discount_values), size=m, p=discount_p)]
+            net_price = np.round(unit_price * (1 - discount_rate), 2)
+            tax_amount = np.round(net_price * TAX_RATE, 2)
+
+            self._write(pd.DataFrame({
+                "order_item_id": np.arange(next_item_id, next_item_id + m),
+                "order_id": order_id[item_order_idx],
+                "product_id": product_idx + 1,
+                "quantity": quantity,
+                "unit_price": unit_price,
+                "discount_rate": discount_rate,
+                "net_price": net_price,
+                "tax_amount": tax_amount
+            }), items_path, chunk_idx == 0)
+            next_item_id += m
+
+            # Bezahlte Bestellungen nach Tag und Akquisitionskanal des Kunden aggregieren
+            order_revenue = np.bincount(item_order_idx, weights=(net_price + tax_amount) * quantity, minlength=n)
+            paid = status == "paid"
+            day_idx = (order_date[paid] - self.start_day).astype(int)
+            channel_idx = customers["channel_idx"][customer_idx[paid]]
+            np.add.at(transactions, (day_idx, channel_idx), 1)
+            np.add.at(revenue, (day_idx, channel_idx), order_revenue[paid])
+
+        self._write_web_analytics(analytics_path, transactions, revenue, channel_names)
+        return {
+            "orders": self.num_orders,
+            "order_items": next_item_id - 1,
+            "web_analytics_daily": self.num_days * len(channel_names)
+        }
+
+    def _write_web_analytics(self, path: str, transactions: np.ndarray, revenue: np.ndarray,
+                             channel_names: List[str]) -> None:
+        rng = self._rng(4)
+        days = self.start_day + np.arange(self.num_days).astype("timedelta64[D]")
+        base_sessions = np.array([SESSIONS_PER_DAY[name] for name in channel_names], dtype=float)
+        sessions = np.round(base_sessions * self.scale * rng.uniform(0.8, 1.2, transactions.shape)).astype(np.int64)
+        sessions = np.maximum(sessions, transactions.astype(np.int64))
+        users = np.round(sessions * rng.uniform(0.72, 0.78, sessions.shape)).astype(np.int64)
+
+        self._write(pd.DataFrame({
+            "date": np.repeat(days, len(channel_names)),
+            "channel": np.tile(np.array(channel_names, dtype=object), self.num_days),
+            "transactions": transactions.ravel(),
+            "revenue": np.round(revenue.ravel(), 2),
+            "sessions": sessions.ravel(),
+            "users": users.ravel()
+        }), path, True)
+
+    def _generate_marketing_spend(self, path: str) -> int:
+        rng = self._rng(5)
+        channel_names = list(MARKETING_CHANNELS)
+        budgets = np.array([MARKETING_CHANNELS[name][0] for name in channel_names])
+        clicks_per_euro = np.array([MARKETING_CHANNELS[name][1] for name in channel_names])
+        shape = (self.num_days, len(channel_names))
+
+        spend = np.round(budgets * self.scale * rng.uniform(0.8, 1.2, shape), 2)
+        clicks = np.round(spend * clicks_per_euro * rng.uniform(0.9, 1.1, shape)).astype(np.int64)
+        # Organische Klicks ohne Budget
+        organic = channel_names.index("Organic")
+        clicks[:, organic] = np.round(150 * self.scale * rng.uniform(0.8, 1.2, self.num_days)).astype(np.int64)
+        days = self.start_day + np.arange(self.num_days).astype("timedelta64[D]")
+
+        self._write(pd.DataFrame({
+            "date": np.repeat(days, len(channel_names)),
+            "channel": np.tile(np.array(channel_names, dtype=object), self.num_days),
+            "campaign": np.tile(np.array([f"{name} Q4 Push" for name in channel_names], dtype=object), self.num_days),
+            "spend": spend.ravel(),
+            "clicks": clicks.ravel(),
+            "impressions": (clicks * 10).ravel()
+        }), path, True)
+        return spend.size
+
+
+def main(argv: Optional[List[str]] = None):
+    """CLI für den Datengenerator"""
+    parser = argparse.ArgumentParser(description="Erzeugt synthetische E-Commerce-Daten im show_case_data-Schema")
+    parser.add_argument("--scale", type=float, default=1.0, help="Skalierungsfaktor (1 = Größe von show_case_data)")
+    parser.add_argument("--output", default=None, help="Zielverzeichnis (Standard: data_sf<scale>)")
+    parser.add_argument("--seed", type=int, default=42, help="Seed für reproduzierbare Daten")
+    parser.add_argument("--chunk-size", type=int, default=1_000_000, help="Bestellungen pro Block")
+    parser.add_argument("--start-date", default="2025-08-01", help="Erster Bestelltag (YYYY-MM-DD)")
+    parser.add_argument("--end-date", default="2025-11-30", help="Letzter Bestelltag (YYYY-MM-DD)")
+    args = parser.parse_args(argv)
+
+    output_dir = args.output or f"data_sf{args.scale:g}"
+    generator = SyntheticDataGenerator(args.scale, args.seed, args.chunk_size, args.start_date, args.end_date)
+
+    print(f"🏭 Erzeuge Daten mit Skalierungsfaktor {args.scale:g} nach {output_dir}/ ...")
+    started = time.perf_counter()
+    counts = generator.generate(output_dir)
+
+    for table_name, rows in counts.items():
+        print(f"✅ {table_name}: {rows:,} Zeilen")
+    print(f"⏱️ Fertig in {time.perf_counter() - started:.1f}s - verwenden mit DATA_PATH={output_dir}")
+
+
+if __name__ == "__main__":
+    main()
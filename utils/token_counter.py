@@ -0,0 +1,68 @@
+"""
+Token-Zählung für Prompts und Tool-Ergebnisse
+"""
+import threading
+from typing import Any, Dict, Optional
+
+from config import LLM_MODEL
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+# Faustregel, falls kein Tokenizer verfügbar ist: ein Token entspricht etwa vier Zeichen
+CHARS_PER_TOKEN = 4
+
+
+# Geladene Tokenizer je Modell (None = nicht verfügbar) und laufende Ladevorgänge
+_encodings: Dict[str, Optional[Any]] = {}
+_loading: Dict[str, threading.Thread] = {}
+_lock = threading.Lock()
+
+
+def _load_encoding(model: str) -> None:
+    """Lädt den Tokenizer eines Modells (tiktoken lädt die Kodierung beim ersten Zugriff herunter)"""
+    encoding = None
+    if TIKTOKEN_AVAILABLE:
+        try:
+            encoding_name = tiktoken.encoding_name_for_model(model)
+        except KeyError:
+            encoding_name = "o200k_base"
+        try:
+            encoding = tiktoken.get_encoding(encoding_name)
+        except Exception as e:
+            print(f"⚠️ Tokenizer für {model} nicht verfügbar, Tokens werden geschätzt ({type(e).__name__})")
+    with _lock:
+        _encodings[model] = encoding
+        _loading.pop(model, None)
+
+
+def load_encoding(model: str = LLM_MODEL, wait: bool = False) -> Optional[Any]:
+    """
+    Startet das Laden des Tokenizers im Hintergrund, damit ein Download nie eine Query oder
+    einen Prompt aufhält. Gibt ihn zurück, sobald er geladen ist (mit `wait` nach dem Laden).
+    """
+    with _lock:
+        if model in _encodings:
+            return _encodings[model]
+        thread = _loading.get(model)
+        if thread is None:
+            thread = threading.Thread(target=_load_encoding, args=(model,), name="tokenizer-load", daemon=True)
+            _loading[model] = thread
+            thread.start()
+    if wait:
+        thread.join()
+        return _encodings.get(model)
+    return None
+
+
+def count_tokens(text: str, model: str = LLM_MODEL) -> int:
+    """Anzahl Tokens von `text` für `model` (geschätzt, solange der Tokenizer nicht geladen ist)"""
+    if not text:
+        return 0
+    encoding = load_encoding(model)
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
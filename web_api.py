@@ -6,11 +6,11 @@ import asyncio
 import json
 import os
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from fastapi import FastAPI, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
 import uvicorn
 
@@ -23,11 +23,23 @@ except ImportError:
 
 try:
     from orchestrator import MultiAgentOrchestrator
+    from agents.llm_cache import get_llm_cache
+    from agents.token_budget import get_prompt_metrics_store
+    from utils.token_counter import load_encoding
     ORCHESTRATOR_AVAILABLE = True
 except ImportError:
     print("⚠️ Orchestrator nicht verfügbar - verwende Simulation")
     ORCHESTRATOR_AVAILABLE = False
 
+try:
+    from tools.duckdb_catalog import get_catalog
+    from tools.query_cache import get_query_cache
+    from tools.query_metrics import get_metrics_store, current_workflow_id
+    DUCKDB_AVAILABLE = True
+except ImportError:
+    print("⚠️ DuckDB-Katalog nicht verfügbar")
+    DUCKDB_AVAILABLE = False
+
 # Pydantic Models
 class WorkflowRequest(BaseModel):
     query: str
@@ -60,6 +72,24 @@ app.add_middleware(
 orchestrator = None
 current_workflows: Dict[str, Dict] = {}
 workflow_logs: Dict[str, list] = {}
+workflow_events: Dict[str, list] = {}
+workflow_subscribers: Dict[str, List[asyncio.Queue]] = {}
+
+# Sekunden ohne Ereignis, nach denen ein SSE-Kommentar die Verbindung offen hält
+SSE_KEEPALIVE_SECONDS = 15
+
+# Agenten-Status, Agent sowie Log-Meldung bei Start und Ende je Knoten des LangGraph-Workflows
+WORKFLOW_NODE_STEPS = {
+    "classify_request": (["orchestrator"], "Orchestrator",
+                         "🎯 Orchestrator: Klassifiziere Anfrage...",
+                         "✅ Orchestrator: Anfrage erfolgreich klassifiziert"),
+    "analyze_data": (["dataAnalyst", "duckdbTool"], "DataAnalyst",
+                     "📊 Datenanalyse-Agent: Analysiere CSV-Daten mit dem DuckDB Tool",
+                     "✅ Datenanalyse-Agent: KPIs aus Daten berechnet"),
+    "generate_report": (["reportGenerator"], "ReportGenerator",
+                        "📝 Report-Generator: Erstelle Bericht aus Analyseergebnissen",
+                        "✅ Report-Generator: Bericht aus Daten erstellt"),
+}
 pdf_generator = None
 
 # Initialize Orchestrator
@@ -69,6 +99,8 @@ async def startup_event():
     try:
         if ORCHESTRATOR_AVAILABLE:
             orchestrator = MultiAgentOrchestrator()
+            # Tokenizer im Hintergrund laden, bis dahin werden Tokens geschätzt
+            load_encoding()
             print("✅ Multi-Agenten-Orchestrator erfolgreich initialisiert")
         else:
             print("⚠️ Orchestrator nicht verfügbar - API läuft im Simulations-Modus")
@@ -101,6 +133,27 @@ async def health_check():
         "simulation_mode": not ORCHESTRATOR_AVAILABLE
     }
 
+@app.get("/api/duckdb/stats")
+async def duckdb_stats():
+    """Auslastung des DuckDB-Cursor-Pools und Kennzahlen des Query-Caches"""
+    if not DUCKDB_AVAILABLE:
+        raise HTTPException(status_code=503, detail="DuckDB-Katalog nicht verfügbar")
+    
+    catalog = get_catalog()
+    return {
+        "pool": catalog.pool.stats(),
+        "query_cache": get_query_cache().stats(),
+        "loaded_tables": list(catalog.loaded_tables().keys())
+    }
+
+@app.get("/api/llm/stats")
+async def llm_stats():
+    """Kennzahlen des LLM-Antwort-Caches"""
+    if not ORCHESTRATOR_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Orchestrator nicht verfügbar")
+    
+    return {"llm_cache": get_llm_cache().stats()}
+
 @app.post("/api/workflow/start", response_model=WorkflowResponse)
 async def start_workflow(request: WorkflowRequest, background_tasks: BackgroundTasks):
     """Startet einen neuen Workflow"""
@@ -148,6 +201,49 @@ async def get_workflow_logs(workflow_id: str):
     
     return {"logs": workflow_logs[workflow_id]}
 
+@app.get("/api/workflow/{workflow_id}/stream")
+async def stream_workflow_events(workflow_id: str):
+    """
+    Server-Sent Events eines Workflows: Start und Ende jedes Graph-Knotens, die Tokens des
+    Berichts, sobald das LLM sie liefert, das Endergebnis und zuletzt ein "done"-Ereignis
+    """
+    if workflow_id not in current_workflows:
+        raise HTTPException(status_code=404, detail="Workflow nicht gefunden")
+    
+    return StreamingResponse(
+        workflow_event_stream(workflow_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/workflow/{workflow_id}/metrics")
+async def get_workflow_metrics(workflow_id: str):
+    """Gibt die gemessenen DuckDB-Query-Metriken eines Workflows zurück"""
+    if workflow_id not in current_workflows:
+        raise HTTPException(status_code=404, detail="Workflow nicht gefunden")
+    if not DUCKDB_AVAILABLE:
+        raise HTTPException(status_code=503, detail="DuckDB-Katalog nicht verfügbar")
+    
+    store = get_metrics_store()
+    return {
+        "queries": store.query(workflow_id),
+        "summary": store.summary(workflow_id)
+    }
+
+@app.get("/api/workflow/{workflow_id}/prompts")
+async def get_workflow_prompt_metrics(workflow_id: str):
+    """Gibt Prompt-Größen je LLM-Aufruf und die Verdichtungen zwischen den Agenten zurück"""
+    if workflow_id not in current_workflows:
+        raise HTTPException(status_code=404, detail="Workflow nicht gefunden")
+    if not ORCHESTRATOR_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Orchestrator nicht verfügbar")
+    
+    store = get_prompt_metrics_store()
+    return {
+        "prompts": store.query(workflow_id),
+        "summary": store.summary(workflow_id)
+    }
+
 @app.get("/api/workflows")
 async def list_workflows():
     """Listet alle aktiven Workflows auf"""
@@ -163,6 +259,8 @@ async def delete_workflow(workflow_id: str):
         del current_workflows[workflow_id]
     if workflow_id in workflow_logs:
         del workflow_logs[workflow_id]
+    workflow_events.pop(workflow_id, None)
+    workflow_subscribers.pop(workflow_id, None)
     
     return {"message": f"Workflow {workflow_id} erfolgreich gelöscht"}
 
@@ -206,6 +304,8 @@ async def download_workflow_report(workflow_id: str):
 # Background Task Functions
 async def run_workflow_real(workflow_id: str, query: str):
     """Führt einen echten LangGraph-Workflow aus"""
+    # DuckDB-Metriken aller Queries dieses Tasks dem Workflow zuordnen
+    workflow_token = current_workflow_id.set(workflow_id) if DUCKDB_AVAILABLE else None
     try:
         add_log(workflow_id, "info", f"🔍 Debug: ORCHESTRATOR_AVAILABLE = {ORCHESTRATOR_AVAILABLE}", "System")
         
@@ -224,9 +324,6 @@ async def run_workflow_real(workflow_id: str, query: str):
         add_log(workflow_id, "info", f"🚀 Starte LangGraph-Workflow: {workflow_id}", "System")
         add_log(workflow_id, "info", f"📝 Query: {query}", "System")
         
-        # Echten Orchestrator verwenden
-        add_log(workflow_id, "info", "🎯 Orchestrator: Klassifiziere Anfrage...", "Orchestrator")
-        
         # LangGraph-Workflow ausführen
         initial_state = {
             "original_request": query,
@@ -259,6 +356,11 @@ async def run_workflow_real(workflow_id: str, query: str):
         current_workflows[workflow_id]["status"] = "failed"
         current_workflows[workflow_id]["current_step"] = f"Fehler: {str(e)}"
         add_log(workflow_id, "error", f"❌ Workflow-Fehler: {str(e)}", "System")
+    finally:
+        if workflow_token is not None:
+            current_workflow_id.reset(workflow_token)
+        if workflow_id in current_workflows:
+            await publish_event(workflow_id, {"type": "done", "status": current_workflows[workflow_id]["status"]})
 
 async def execute_langgraph_workflow(workflow_id: str, initial_state: Dict[str, Any]) -> Dict[str, Any]:
     """Führt den LangGraph-Workflow schrittweise aus und updated den Status"""
@@ -266,27 +368,16 @@ async def execute_langgraph_workflow(workflow_id: str, initial_state: Dict[str,
         # Orchestrator-Instanz verwenden
         result_state = initial_state.copy()
         
-        # Schritt 1: Request klassifizieren
-        current_workflows[workflow_id]["workflow_status"]["orchestrator"] = "active"
-        add_log(workflow_id, "info", "🎯 Orchestrator: Klassifiziere Anfrage...", "Orchestrator")
-        await asyncio.sleep(1)  # Simulation der Verarbeitung
-        
-        current_workflows[workflow_id]["workflow_status"]["orchestrator"] = "completed"
-        add_log(workflow_id, "success", "✅ Orchestrator: Anfrage erfolgreich klassifiziert", "Orchestrator")
-        
-        # Schritt 2: Datenanalyse
-        current_workflows[workflow_id]["current_step"] = "Datenanalyse-Agent startet..."
-        current_workflows[workflow_id]["workflow_status"]["dataAnalyst"] = "active"
-        add_log(workflow_id, "info", "📊 Datenanalyse-Agent: Analysiere CSV-Daten aus show_case_data/", "DataAnalyst")
-        
-        # DuckDB Tool aktivieren
-        current_workflows[workflow_id]["workflow_status"]["duckdbTool"] = "active"
-        add_log(workflow_id, "info", "🔧 DuckDB Tool: Führe SQL-Queries auf CSV-Dateien aus (orders.csv, customers.csv, etc.)", "DuckDBTool")
-        
-        # Echte LangGraph-Workflow-Ausführung
+        # Echte LangGraph-Workflow-Ausführung; der Status der Agenten folgt den Graph-Knoten
         try:
             add_log(workflow_id, "info", "🚀 Starte LangGraph-Workflow-Ausführung...", "System")
-            final_output = orchestrator.process_request(initial_state["original_request"])
+            final_output = ""
+            async for event in orchestrator.astream_request(initial_state["original_request"]):
+                await publish_event(workflow_id, event)
+                if event["type"] in ("node_start", "node_end"):
+                    track_node_event(workflow_id, event)
+                elif event["type"] == "final":
+                    final_output = event["output"]
             add_log(workflow_id, "success", "✅ LangGraph-Workflow erfolgreich ausgeführt", "System")
             
             # Format das Ergebnis richtig
@@ -304,22 +395,8 @@ async def execute_langgraph_workflow(workflow_id: str, initial_state: Dict[str,
                 "report_result": {"status": "fallback_report_generated"}
             }
         
-        await asyncio.sleep(2)  # Simulation der Datenbankabfragen
-        current_workflows[workflow_id]["workflow_status"]["duckdbTool"] = "completed"
-        add_log(workflow_id, "success", "✅ DuckDB Tool: CSV-Daten erfolgreich abgerufen und verarbeitet", "DuckDBTool")
-        
-        await asyncio.sleep(1)
-        current_workflows[workflow_id]["workflow_status"]["dataAnalyst"] = "completed"
-        add_log(workflow_id, "success", "✅ Datenanalyse-Agent: KPIs aus Daten berechnet", "DataAnalyst")
-        
-        # Schritt 3: Berichterstellung
-        current_workflows[workflow_id]["current_step"] = "Report-Generator erstellt Bericht..."
-        current_workflows[workflow_id]["workflow_status"]["reportGenerator"] = "active"
-        add_log(workflow_id, "info", "📝 Report-Generator: Erstelle Bericht aus Analyseergebnissen", "ReportGenerator")
-        
-        await asyncio.sleep(2)
-        current_workflows[workflow_id]["workflow_status"]["reportGenerator"] = "completed"
-        add_log(workflow_id, "success", "✅ Report-Generator: Bericht aus Daten erstellt", "ReportGenerator")
+        log_query_metrics(workflow_id)
+        log_prompt_metrics(workflow_id)
         
         # Ergebnis zurückgeben
         result_state.update({
@@ -334,6 +411,20 @@ async def execute_langgraph_workflow(workflow_id: str, initial_state: Dict[str,
         add_log(workflow_id, "error", f"❌ LangGraph-Workflow Fehler: {str(e)}", "System")
         return {"error": str(e)}
 
+def track_node_event(workflow_id: str, event: Dict[str, Any]):
+    """Setzt Status, aktuellen Schritt und Logs der Agenten beim Start bzw. Ende eines Graph-Knotens"""
+    step = WORKFLOW_NODE_STEPS.get(event["node"])
+    if step is None:
+        return
+    status_keys, agent, start_message, end_message = step
+    workflow = current_workflows[workflow_id]
+    started = event["type"] == "node_start"
+    for key in status_keys:
+        workflow["workflow_status"][key] = "active" if started else "completed"
+    if started:
+        workflow["current_step"] = start_message
+    add_log(workflow_id, "info" if started else "success", start_message if started else end_message, agent)
+
 async def run_workflow_simulation(workflow_id: str, query: str):
     """Simuliert einen Workflow im Hintergrund (Fallback)"""
     try:
@@ -409,6 +500,86 @@ async def run_workflow_simulation(workflow_id: str, query: str):
         current_workflows[workflow_id]["error"] = str(e)
         add_log(workflow_id, "error", f"❌ Fehler im Workflow: {str(e)}", "System")
 
+def log_query_metrics(workflow_id: str):
+    """Überträgt die gemessenen DuckDB-Query-Metriken eines Workflows in dessen Log"""
+    if not DUCKDB_AVAILABLE:
+        add_log(workflow_id, "success", "✅ DuckDB Tool: CSV-Daten erfolgreich abgerufen und verarbeitet", "DuckDBTool")
+        return
+    
+    store = get_metrics_store()
+    for i, metrics in enumerate(store.query(workflow_id), 1):
+        details = {key: value for key, value in metrics.items() if key != "profile"}
+        if metrics["error"]:
+            add_log(workflow_id, "error", f"❌ SQL Query {i} fehlgeschlagen nach {metrics['total_ms']:.1f} ms: {metrics['error']}", "DuckDBTool", details)
+        elif metrics["cache_hit"]:
+            add_log(workflow_id, "info", f"⚡ SQL Query {i}: Cache-Treffer in {metrics['total_ms']:.1f} ms", "DuckDBTool", details)
+        else:
+            add_log(
+                workflow_id, "info",
+                f"🔍 SQL Query {i}: {metrics['total_ms']:.1f} ms "
+                f"(Ingest {metrics['ingest_ms']:.1f} ms, Ausführung {metrics['execute_ms']:.1f} ms, "
+                f"Fetch {metrics['fetch_ms']:.1f} ms, Format {metrics['format_ms']:.1f} ms), "
+                f"{metrics['rows_returned']} Zeilen, {metrics['result_tokens']} Tokens",
+                "DuckDBTool", details
+            )
+    
+    summary = store.summary(workflow_id)
+    add_log(
+        workflow_id, "success",
+        f"✅ DuckDB Tool: {summary['queries']} Queries in {summary['total_ms']:.1f} ms "
+        f"({summary['cache_hits']} Cache-Treffer, {summary['errors']} Fehler, {summary['result_tokens']} Ergebnis-Tokens)",
+        "DuckDBTool", summary
+    )
+
+def log_prompt_metrics(workflow_id: str):
+    """Überträgt Prompt-Größen und Verdichtungen zwischen den Agenten eines Workflows in dessen Log"""
+    if not ORCHESTRATOR_AVAILABLE:
+        return
+    
+    summary = get_prompt_metrics_store().summary(workflow_id)
+    roles = ", ".join(f"{role} {tokens}" for role, tokens in summary["prompt_tokens_by_role"].items())
+    add_log(
+        workflow_id, "info",
+        f"🧮 Prompts: {summary['llm_calls']} LLM-Aufrufe mit {summary['prompt_tokens']} Tokens ({roles}), "
+        f"{summary['compressions']} Verdichtungen sparten {summary['tokens_saved']} Tokens",
+        "Orchestrator", summary
+    )
+
+async def publish_event(workflow_id: str, event: Dict[str, Any]):
+    """
+    Stellt ein Workflow-Ereignis allen verbundenen SSE-Verbindungen zu und merkt es für später
+    verbundene. Im Puffer werden aufeinanderfolgende Berichts-Chunks zu einem zusammengefasst,
+    sodass er nicht mit jedem Token wächst.
+    """
+    events = workflow_events.setdefault(workflow_id, [])
+    if event["type"] == "report_chunk" and events and events[-1]["type"] == "report_chunk":
+        events[-1] = {"type": "report_chunk", "content": events[-1]["content"] + event["content"]}
+    else:
+        events.append(event)
+    for queue in workflow_subscribers.get(workflow_id, []):
+        queue.put_nowait(event)
+
+async def workflow_event_stream(workflow_id: str):
+    """Liefert alle bisherigen und alle neuen Ereignisse eines Workflows im SSE-Format"""
+    # Puffer kopieren und Queue anmelden ohne await dazwischen, damit kein Ereignis fehlt
+    queue: asyncio.Queue = asyncio.Queue()
+    for event in workflow_events.get(workflow_id, []):
+        queue.put_nowait(event)
+    subscribers = workflow_subscribers.setdefault(workflow_id, [])
+    subscribers.append(queue)
+    try:
+        while workflow_id in current_workflows:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+            if event["type"] == "done":
+                return
+    finally:
+        subscribers.remove(queue)
+
 def add_log(workflow_id: str, level: str, message: str, agent: str = None, details: Dict = None):
     """Fügt einen Log-Eintrag hinzu"""
     log_entry = {